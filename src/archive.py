@@ -0,0 +1,221 @@
+"""
+=============================================================================
+File: archive.py
+Description: Archive of fetched pages so that episodes can be re-extracted without
+             downloading them again.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+
+The archive is in WARC format (as used by web archives): one "response" record per
+fetched page, each record compressed separately and appended to the file. A sidecar
+index file (archive name + .idx) has one tab-separated line per record:
+
+    URL, offset, compressed length, HTTP status, fetch date, SHA-1 of body
+
+so any page can be read without decompressing the whole archive. If the index is
+missing, it's rebuilt from the archive.
+=============================================================================
+"""
+
+import gzip
+import hashlib
+import io
+import os
+import threading
+import uuid
+import zlib
+from datetime import datetime, timezone
+from http.client import responses
+
+INDEX_SUFFIX = '.idx'
+READ_SIZE = 1024 * 1024
+CRLF = b'\r\n'
+
+
+class ArchiveRecord:
+    """
+    A page in the archive
+    """
+
+    def __init__(self, url, status, date, headers, body, offset=None):
+        self.url = url
+        self.status = status
+        self.date = date
+        self.headers = headers
+        self.body = body
+        self.offset = offset
+
+    def __str__(self):
+        return f'{self.url} ({self.status}, {self.date}, {len(self.body)} bytes)'
+
+
+def record_as_warc(url, status, headers, body, date):
+    """
+    Return WARC response record for a page
+    """
+    http = f'HTTP/1.1 {status} {responses.get(status, "")}\r\n'
+    for name, value in headers.items():
+        http += f'{name}: {value}\r\n'
+    block = http.encode('utf-8') + CRLF + body
+
+    warc = ['WARC/1.0',
+            'WARC-Type: response',
+            f'WARC-Target-URI: {url}',
+            f'WARC-Date: {date}',
+            f'WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>',
+            'Content-Type: application/http; msgtype=response',
+            f'Content-Length: {len(block)}']
+    return '\r\n'.join(warc).encode('utf-8') + CRLF + CRLF + block + CRLF + CRLF
+
+
+def parse_warc(data, offset=None):
+    """
+    Return ArchiveRecord from an uncompressed WARC response record
+    """
+    warc_header, _, rest = data.partition(CRLF + CRLF)
+    fields = {}
+    for line in warc_header.decode('utf-8').split('\r\n')[1:]:
+        name, _, value = line.partition(': ')
+        fields[name] = value
+
+    block = rest[:int(fields['Content-Length'])]
+    http_header, _, body = block.partition(CRLF + CRLF)
+    lines = http_header.decode('utf-8').split('\r\n')
+    status = int(lines[0].split(' ')[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(': ')
+        headers[name] = value
+
+    return ArchiveRecord(fields['WARC-Target-URI'], status, fields['WARC-Date'], headers, body, offset)
+
+
+def index_line(url, offset, length, status, date, sha1):
+    """
+    Return line of the index file for a record
+    """
+    return f'{url}\t{offset}\t{length}\t{status}\t{date}\t{sha1}\n'
+
+
+class PageArchive:
+    """
+    Append-only archive of fetched pages. Writing is safe from several threads. The
+    index is read once and kept up to date as pages are written so the archive
+    shouldn't be written by another PageArchive at the same time.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.index_filename = filename + INDEX_SUFFIX
+        # URL to (offset, length) of its latest record, loaded when first needed
+        self._index = None
+        self._lock = threading.Lock()
+
+    def write(self, url, status, headers, body):
+        date = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        # Only keep headers that describe the body
+        headers = {k: v for k, v in headers.items()
+                   if k.lower() in ('content-type', 'etag', 'last-modified')}
+        data = gzip.compress(record_as_warc(url, status, headers, body, date))
+        sha1 = hashlib.sha1(body).hexdigest()
+
+        with self._lock:
+            self._load_index()
+            with open(self.filename, 'ab') as f:
+                offset = f.tell()
+                f.write(data)
+            with open(self.index_filename, 'a', encoding='utf-8') as f:
+                f.write(index_line(url, offset, len(data), status, date, sha1))
+            self._index[url] = (offset, len(data))
+
+    def index(self):
+        """
+        Return dict of URL to (offset, length) of the latest record for each URL
+        """
+        with self._lock:
+            return dict(self._load_index())
+
+    def _load_index(self):
+        """
+        Return the index, reading it, or rebuilding it if the index file is missing,
+        the first time. The caller holds the lock.
+        """
+        if self._index is None:
+            self._index = {}
+            if os.path.exists(self.index_filename):
+                with open(self.index_filename, encoding='utf-8') as f:
+                    for line in f:
+                        url, offset, length = line.split('\t')[:3]
+                        self._index[url] = (int(offset), int(length))
+            elif os.path.exists(self.filename):
+                self._rebuild_index()
+
+        return self._index
+
+    def _rebuild_index(self):
+        """
+        Write the index file from the records in the archive
+        """
+        with open(self.filename, 'rb') as f, \
+                open(self.index_filename, 'w', encoding='utf-8') as index:
+            for offset, length, data in self._members(f):
+                record = parse_warc(data, offset)
+                index.write(index_line(record.url, offset, length, record.status, record.date,
+                                       hashlib.sha1(record.body).hexdigest()))
+                self._index[record.url] = (offset, length)
+
+    def get(self, url):
+        """
+        Return latest record for url or None if it's not in the archive
+        """
+        with self._lock:
+            entry = self._load_index().get(url)
+        if entry is None:
+            return None
+
+        offset, length = entry
+        with open(self.filename, 'rb') as f:
+            f.seek(offset)
+            return parse_warc(gzip.decompress(f.read(length)), offset)
+
+    def records(self, latest_only=True):
+        """
+        Return generator of records in the order they were written. The archive is
+        streamed so memory use doesn't depend on its size. If latest_only, records
+        that have been superseded by a later fetch of the same URL are skipped.
+        """
+        latest = None
+        if latest_only:
+            latest = {offset for offset, _ in self.index().values()}
+
+        with open(self.filename, 'rb') as f:
+            for offset, _, data in self._members(f):
+                if latest is None or offset in latest:
+                    yield parse_warc(data, offset)
+
+    def _members(self, f):
+        """
+        Return generator of (offset, compressed length, uncompressed data) for each gzip
+        member
+        """
+        offset = 0
+        pending = b''
+        while True:
+            decompressor = zlib.decompressobj(wbits=31)
+            output = io.BytesIO()
+            consumed = 0
+            data = pending
+            while True:
+                if not data:
+                    data = f.read(READ_SIZE)
+                    if not data:
+                        return
+                output.write(decompressor.decompress(data))
+                consumed += len(data) - len(decompressor.unused_data)
+                if decompressor.eof:
+                    pending = decompressor.unused_data
+                    break
+                data = b''
+
+            yield offset, consumed, output.getvalue()
+            offset += consumed
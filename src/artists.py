@@ -19,14 +19,21 @@ import sys
 # print(sys.argv)
 
 ARTIST_COLUMNS = 8
-count = 0
-with open(sys.argv[1], newline='') as f:
-    reader = csv.DictReader(f, delimiter='\t')
-    for row in reader:
-        for n in range(1, ARTIST_COLUMNS + 1):
-            column = f'Artist {n}'
-            if row[column] is not None and row[column].strip() != '':
-                print(row[column])
-                count += 1
-
-    print(f'Total rows: {count}')
+
+
+def main():
+    count = 0
+    with open(sys.argv[1], newline='') as f:
+        reader = csv.DictReader(f, delimiter='\t')
+        for row in reader:
+            for n in range(1, ARTIST_COLUMNS + 1):
+                column = f'Artist {n}'
+                if row[column] is not None and row[column].strip() != '':
+                    print(row[column])
+                    count += 1
+
+        print(f'Total rows: {count}')
+
+
+if __name__ == '__main__':
+    main()
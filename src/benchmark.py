@@ -0,0 +1,136 @@
+"""
+=============================================================================
+File: benchmark.py
+Description: Measure the crawler's throughput and error recovery against the
+             stand-in BBC website (see standin_bbc.py).
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+
+To run:
+
+    python benchmark.py --episodes 2000 --latency lognormal:-3,0.5 --error-rate 0.05 \\
+        --reset-rate 0.01 --rate 50 --max-rate 200 --fetch-workers 16
+
+The stand-in server is started in this process and a full crawl (scraper.py --all)
+is run against it. The report gives episodes scraped per second, how many of
+the episodes were scraped despite the faults injected, and the crawler's
+retries, timeouts and back-offs.
+=============================================================================
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import standin_bbc
+from scraper import (CastawayReader, Crawler, DesertIslandDiscsParser, Fetcher, RateLimiter,
+                     programme_pid, set_fetcher, setup_command_line as scraper_command_line,
+                     DEFAULT_FETCH_WORKERS, DEFAULT_PARSE_WORKERS, DEFAULT_LISTING_WORKERS)
+from fetcher import DEFAULT_MIN_RATE, MAX_RETRIES
+from metrics import METRICS
+
+DEFAULT_BENCHMARK_EPISODES = 500
+DEFAULT_BENCHMARK_RATE = 50.0
+DEFAULT_BENCHMARK_MAX_RATE = 500.0
+
+
+def run_benchmark(site, args, output):
+    """
+    Crawl the stand-in site, writing episodes to output. Return (crawler, episode
+    pipeline, seconds taken).
+    """
+    server, listing_url = standin_bbc.serve_in_thread(site)
+    try:
+        crawl_args = scraper_command_line().parse_args(
+            ['--all', '--csv', output, '--listing-url', listing_url,
+             '--listing-workers', str(args.listing_workers),
+             '--fetch-workers', str(args.fetch_workers),
+             '--parse-workers', str(args.parse_workers)])
+        set_fetcher(Fetcher(RateLimiter(args.rate, min_rate=args.min_rate, max_rate=args.max_rate),
+                            max_retries=args.max_retries, read_timeout=args.read_timeout,
+                            stream=args.stream))
+        crawler = Crawler(DesertIslandDiscsParser(structured=args.structured), crawl_args)
+        METRICS.reset()
+
+        start = time.perf_counter()
+        # The crawl reports each listing page fetched; only the summary is wanted
+        log = io.StringIO() if not args.verbose else None
+        with contextlib.redirect_stdout(log) if log else contextlib.nullcontext():
+            castaways = crawler.frontier(range(1, crawler.last_page() + 1))
+            pipeline = crawler.crawl_frontier(castaways)
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+        set_fetcher(None)
+
+    return crawler, pipeline, elapsed
+
+
+def report(site, crawler, pipeline, elapsed, output):
+    pids = {programme_pid(row['URL']) for row in CastawayReader().rows(output)}
+    expected = {standin_bbc.episode_pid(i) for i in range(site.total_episodes)}
+    scraped = len(pids & expected)
+
+    result = [f'Episodes: {scraped} of {site.total_episodes} scraped ({100 * scraped / site.total_episodes:.1f}%) '
+              f'in {elapsed:.1f}s: {scraped / elapsed:.1f} episodes/s',
+              f'Server: {site.stats}',
+              f'Downloaded: {METRICS.get("did_bytes_downloaded_total") / 1e6:.1f} MB '
+              f'({METRICS.get("did_bytes_downloaded_total") / max(1, scraped) / 1e3:.0f} KB per episode)',
+              f'Crawler: {crawler.fetcher.stats}',
+              f'Episodes that could not be fetched: {len(crawler.parser.failed_urls)}',
+              'Episode stages:',
+              pipeline.report().rstrip()]
+    return '\n'.join(result)
+
+
+def setup_command_line():
+    cmdline = argparse.ArgumentParser(prog='Desert Island Discs crawler benchmark')
+    standin_bbc.add_site_arguments(cmdline)
+    cmdline.set_defaults(episodes=DEFAULT_BENCHMARK_EPISODES)
+    cmdline.add_argument('--rate', type=float, default=DEFAULT_BENCHMARK_RATE,
+                         help=f'Crawler\'s initial requests per second (default is {DEFAULT_BENCHMARK_RATE})')
+    cmdline.add_argument('--min-rate', type=float, default=DEFAULT_MIN_RATE,
+                         help=f'Crawler\'s minimum requests per second (default is {DEFAULT_MIN_RATE})')
+    cmdline.add_argument('--max-rate', type=float, default=DEFAULT_BENCHMARK_MAX_RATE,
+                         help=f'Crawler\'s maximum requests per second (default is {DEFAULT_BENCHMARK_MAX_RATE})')
+    cmdline.add_argument('--max-retries', type=int, default=MAX_RETRIES,
+                         help=f'Crawler\'s retries of each request (default is {MAX_RETRIES})')
+    cmdline.add_argument('--read-timeout', type=float, default=5,
+                         help='Crawler\'s read timeout in seconds (default is 5)')
+    cmdline.add_argument('--stream', action='store_true',
+                         help='Stop downloading episode pages once the parts extracted have arrived '
+                         '(see scraper.py --stream)')
+    cmdline.add_argument('--structured', action='store_true',
+                         help='Fetch episodes\' JSON documents and segments fragments instead of their '
+                         'pages (see scraper.py --structured)')
+    cmdline.add_argument('--listing-workers', type=int, default=DEFAULT_LISTING_WORKERS,
+                         help=f'Threads fetching listing pages (default is {DEFAULT_LISTING_WORKERS})')
+    cmdline.add_argument('--fetch-workers', type=int, default=DEFAULT_FETCH_WORKERS,
+                         help=f'Threads fetching episode pages (default is {DEFAULT_FETCH_WORKERS})')
+    cmdline.add_argument('--parse-workers', type=int, default=DEFAULT_PARSE_WORKERS,
+                         help=f'Threads parsing episode pages (default is {DEFAULT_PARSE_WORKERS})')
+    cmdline.add_argument('--csv', dest='output',
+                         help='Keep the scraped episodes in this file, which is overwritten (default is a temporary file)')
+    cmdline.add_argument('--verbose', action='store_true',
+                         help='Show the crawler\'s progress')
+    return cmdline
+
+
+def main():
+    args = setup_command_line().parse_args()
+    site = standin_bbc.site_from_args(args)
+
+    with tempfile.TemporaryDirectory() as directory:
+        output = args.output or os.path.join(directory, 'episodes.csv')
+        if os.path.exists(output):
+            os.remove(output)
+        crawler, pipeline, elapsed = run_benchmark(site, args, output)
+        print(report(site, crawler, pipeline, elapsed, output))
+
+
+if __name__ == '__main__':
+    main()
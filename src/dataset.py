@@ -0,0 +1,241 @@
+"""
+=============================================================================
+File: dataset.py
+Description: Reading and writing the dataset of episodes scraped by scraper.py.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+
+This has no dependencies beyond the standard library so tools that only work with
+the dataset (eg diff_datasets.py, merge_shards.py, artists.py) start quickly; they
+don't import the scraper's HTML parser or HTTP client.
+=============================================================================
+"""
+
+import contextlib
+import csv
+import io
+import re
+import sys
+
+from writers import open_input
+
+# Max tracks that can be chosen by castaway
+MAX_TRACKS = 8
+
+# Fields of an episode that should be filled in; TRACKS means MAX_TRACKS tracks
+TRACKS = 'Tracks'
+EPISODE_FIELDS = ['Book', 'Luxury', 'Favourite track', 'Presenter', TRACKS]
+
+TAB = '\t'
+
+
+@contextlib.contextmanager
+def smart_open(filename=None, filemode='w'):
+    """
+    Return handle to file (if specified) or sys output
+    From https://stackoverflow.com/questions/17602878/how-to-handle-both-with-open-and-sys-stdout-nicely/17603000
+    """
+
+    if filename and filename != '-':
+        #  fh = open(filename, 'w')
+        fh = io.open(filename, newline='', mode=filemode, encoding="utf-8")
+    else:
+        fh = sys.stdout
+
+    try:
+        yield fh
+    finally:
+        if fh is not sys.stdout:
+            fh.close()
+
+
+def programme_pid(url):
+    """
+    Return the programme id (PID) from an episode URL eg m000fx1k from
+    https://www.bbc.co.uk/programmes/m000fx1k. Return url if there's no PID.
+    """
+    if match := re.search(r'/programmes/(\w+)', url or ''):
+        return match.group(1)
+    return url
+
+
+class CastawayReader:
+    """
+    Read the CSV created by CastawayWriter
+    """
+
+    def rows(self, filename, delim=TAB):
+        """
+        Return generator of rows as dicts keyed by column header. The file may be
+        compressed (see writers.py).
+        """
+        with open_input(filename) as f:
+            reader = csv.DictReader(f, delimiter=delim)
+            for row in reader:
+                # The file may have been appended to, repeating the header
+                if row['Castaway'] == reader.fieldnames[0]:
+                    continue
+                yield row
+
+    def row_as_record(self, row):
+        """
+        Return row in the format of CastawayWriter.castaway_as_record
+        """
+        values = [row.get(f'{column} {i}') for i in range(1, MAX_TRACKS + 1)
+                  for column in ('Artist', 'Song')] + list(row.get(None) or [])
+        tracks = [{'artist': artist or None, 'song': song or None}
+                  for artist, song in zip(values[::2], values[1::2]) if artist or song]
+
+        return {'castaway': row['Castaway'] or None,
+                'job': row['Job'] or None,
+                'url': row['URL'] or None,
+                'pid': programme_pid(row['URL']) if row['URL'] else None,
+                'episode_title': row['Episode title'] or None,
+                'book': row['Book'] or None,
+                'luxury': row['Luxury'] or None,
+                'favourite_track': row['Favourite track'] or None,
+                'presenter': row['Presenter'] or None,
+                'broadcast_date': row['Date first broadcast'] or None,
+                'broadcast_time': row['Time first broadcast'] or None,
+                'tracks': tracks}
+
+
+def track_count(row):
+    """
+    Return number of tracks in row read by CastawayReader
+    """
+    count = sum(1 for i in range(1, MAX_TRACKS + 1)
+                if row.get(f'Artist {i}') or row.get(f'Song {i}'))
+    # Tracks beyond MAX_TRACKS are in extra columns
+    return count + len(row.get(None) or []) // 2
+
+
+def missing_fields(row, fields=EPISODE_FIELDS):
+    """
+    Return fields of row that are blank; TRACKS is included if the row has
+    fewer than MAX_TRACKS tracks
+    """
+    result = []
+    for field in fields:
+        if field == TRACKS:
+            if track_count(row) < MAX_TRACKS:
+                result.append(field)
+        elif not row[field]:
+            result.append(field)
+
+    return result
+
+
+class CastawayWriter:
+
+    def castaway_as_dict(self, c):
+        """
+        Return castaway as a row in the format returned by CastawayReader
+        """
+        header = self.csv_header()
+        values = self.castaway_as_row(c)
+        row = dict(zip(header, values))
+        for h in header[len(values):]:
+            row[h] = ''
+        if len(values) > len(header):
+            row[None] = values[len(header):]
+
+        return row
+
+    def castaway_as_row(self, c):
+        """
+        Converts castaway to an array, which maps to a row in a CSV file
+        """
+        result = []
+
+        result.append(c.name)
+        result.append(c.job)
+        result.append(c.episode_url)
+
+        result.append(c.episode.title)
+        result.append(c.episode.book)
+        result.append(c.episode.luxury)
+        result.append(c.episode.favourite_track)
+        result.append(c.episode.presenter)
+        result.append(c.episode.broadcast_datetime[0])
+        result.append(c.episode.broadcast_datetime[1])
+
+        for t in c.episode.tracks:
+            result.append(t.artist)
+            result.append(t.song)
+
+        return result
+
+    def castaway_as_record(self, c):
+        """
+        Return castaway as a dict with all tracks in a list, for formats such as JSON
+        that aren't limited to a fixed number of columns. Missing values are None.
+        """
+        e = c.episode
+        return {'castaway': c.name or None,
+                'job': c.job or None,
+                'url': c.episode_url or None,
+                'pid': programme_pid(c.episode_url) if c.episode_url else None,
+                'episode_title': e.title or None,
+                'book': e.book or None,
+                'luxury': e.luxury or None,
+                'favourite_track': e.favourite_track or None,
+                'presenter': e.presenter or None,
+                'broadcast_date': e.broadcast_datetime[0] or None,
+                'broadcast_time': e.broadcast_datetime[1] or None,
+                'tracks': [{'artist': t.artist or None, 'song': t.song or None} for t in e.tracks]}
+
+    def record_as_row(self, r):
+        """
+        Return record (see castaway_as_record) as a row in a CSV file
+        """
+        result = [r['castaway'], r['job'], r['url'], r['episode_title'], r['book'], r['luxury'],
+                  r['favourite_track'], r['presenter'], r['broadcast_date'], r['broadcast_time']]
+        for t in r['tracks']:
+            result.append(t['artist'])
+            result.append(t['song'])
+
+        return ['' if v is None else v for v in result]
+
+    def csv_header(self):
+        """
+        Return header row for CSV file
+        """
+        result = []
+        result.append('Castaway')
+        result.append('Job')
+        result.append('URL')
+        result.append('Episode title')
+        result.append('Book')
+        result.append('Luxury')
+        result.append('Favourite track')
+        result.append('Presenter')
+        result.append('Date first broadcast')
+        result.append('Time first broadcast')
+        for i in range(1, MAX_TRACKS + 1):
+            result.append(f'Artist {i}')
+            result.append(f'Song {i}')
+
+        return result
+
+    @contextlib.contextmanager
+    def open_csv(self, filename=None, delim=TAB):
+        """
+        Return csv writer, with the header already written, for writing rows as
+        castaways are scraped. If the file already exists, rows are appended to it
+        and the header isn't repeated.
+        """
+        with smart_open(filename, 'a') as output:
+            writer = csv.writer(
+                output, delimiter=delim, lineterminator='\r\n')
+            if output is sys.stdout or output.tell() == 0:
+                writer.writerow(self.csv_header())
+            yield writer
+
+    def as_csv(self, castaways, filename=None, delim=TAB):
+        """
+        Create a CSV of episodes scraped
+        """
+        with self.open_csv(filename, delim) as writer:
+            for c in castaways.values():
+                writer.writerow(self.castaway_as_row(c))
@@ -0,0 +1,75 @@
+"""
+=============================================================================
+File: did.py
+Description: One command for all the Desert Island Discs tools.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+
+To run:
+
+    python did.py <command> [options]
+
+eg python did.py crawl --all --csv episodes.csv or python did.py diff old.csv new.csv.
+Use python did.py <command> --help for a command's options; they're the same as
+those of the script the command runs (see COMMANDS).
+
+Only the script for the command given is imported. Commands that just read or
+convert the dataset (artists, diff, export, merge) don't import the HTML parser or
+HTTP client and start in a few tens of milliseconds; see startup_benchmark.py.
+=============================================================================
+"""
+
+import importlib
+import sys
+
+# command: (module with main(), description)
+COMMANDS = {
+    'crawl': ('scraper', 'Scrape episodes from the BBC website'),
+    'parse': ('parse_pages', 'Extract episodes from saved pages or episode URLs'),
+    'repair': ('repair', 'Scrape again episodes with missing fields'),
+    'watch': ('watch', 'Poll for new episodes and add them to the dataset'),
+    'serve': ('server', 'Run the episode extraction service'),
+    'artists': ('artists', 'List every artist chosen'),
+    'diff': ('diff_datasets', 'Compare two outputs episode by episode'),
+    'merge': ('merge_shards', 'Combine the outputs of sharded crawls'),
+    'export': ('export', 'Convert output to another format'),
+    'benchmark': ('benchmark', 'Measure crawl throughput against a stand-in BBC server'),
+}
+
+# Commands that only use the dataset; they mustn't import HEAVY_MODULES
+DATASET_COMMANDS = ['artists', 'diff', 'export', 'merge']
+HEAVY_MODULES = ['bs4', 'requests', 'scraper', 'multiprocessing']
+
+
+def usage():
+    s = 'usage: python did.py <command> [options]\n\ncommands:\n'
+    for command, (_, description) in COMMANDS.items():
+        s += f'  {command:12}{description}\n'
+    return s
+
+
+def load(command):
+    """
+    Return module that implements command
+    """
+    return importlib.import_module(COMMANDS[command][0])
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage(), end='')
+        sys.exit(0)
+    if argv[0] not in COMMANDS:
+        print(f'*** Unknown command {argv[0]}\n{usage()}', end='', file=sys.stderr)
+        sys.exit(2)
+
+    command = argv[0]
+    module = load(command)
+    # The command's argument parser reads sys.argv
+    sys.argv = [f'did.py {command}'] + argv[1:]
+    module.main()
+
+
+if __name__ == '__main__':
+    main()
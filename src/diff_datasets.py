@@ -0,0 +1,198 @@
+"""
+=============================================================================
+File: diff_datasets.py
+Description: Compare two outputs of scraper.py episode by episode, eg to see what a
+             change to the extraction code has done to the dataset.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+
+To run:
+
+    python diff_datasets.py <old.csv> <new.csv>
+
+Episodes are matched by programme id. The files can be in any format scraper.py
+writes (CSV, JSON Lines or Parquet, optionally compressed; see writers.py) and
+needn't be in the same format or order. For each field, the report gives the number
+of episodes where the value was changed, added (was blank) or removed (is now
+blank), with examples, and lists episodes only in one of the files. The exit status
+is 0 if the files have the same episodes and values and 1 otherwise.
+
+Each file is read into a table keyed by programme id; if an episode appears more
+than once in a file, its last record is kept. A hash of each episode is kept so
+episodes that haven't changed are skipped without comparing fields.
+=============================================================================
+"""
+
+import argparse
+import collections
+import hashlib
+import json
+import sys
+
+from dataset import CastawayReader
+from writers import read_records, FORMATS
+
+# Fields compared, in the order reported
+DIFF_FIELDS = ['castaway', 'job', 'url', 'episode_title', 'book', 'luxury', 'favourite_track',
+               'presenter', 'broadcast_date', 'broadcast_time', 'tracks']
+CHANGED = 'changed'
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGES = [CHANGED, ADDED, REMOVED]
+
+DEFAULT_SAMPLES = 3
+# Values are shortened to this many characters in the report
+SAMPLE_WIDTH = 60
+
+
+def fingerprint(record):
+    return hashlib.blake2b(json.dumps([record.get(f) or None for f in DIFF_FIELDS],
+                                      ensure_ascii=False).encode('utf-8'), digest_size=16).digest()
+
+
+def episode_key(record):
+    return record.get('pid') or record.get('url')
+
+
+def display(value):
+    """
+    Return value as a short string for the report
+    """
+    if value is None:
+        s = '(blank)'
+    elif isinstance(value, list):
+        s = f'{len(value)} tracks: ' + '; '.join(
+            f'{t.get("artist") or ""} - {t.get("song") or ""}' for t in value)
+    else:
+        s = repr(value)
+    return s if len(s) <= SAMPLE_WIDTH else s[:SAMPLE_WIDTH - 3] + '...'
+
+
+class DatasetDiff:
+    """
+    Differences between two datasets, field by field
+    """
+
+    def __init__(self, samples=DEFAULT_SAMPLES):
+        self.samples = samples
+        # field: Counter of CHANGES
+        self.counts = collections.defaultdict(collections.Counter)
+        # (field, change): [(pid, old value, new value)]
+        self.examples = collections.defaultdict(list)
+        self.old_count = 0
+        self.new_count = 0
+        self.unchanged = 0
+        self.changed = 0
+        self.only_old = []
+        self.only_new = []
+        # Episodes that are in a file more than once; the last one is compared
+        self.duplicates = 0
+
+    def latest(self, records):
+        """
+        Return (number of records, dict of episode key to (fingerprint, record) of the
+        last record of each episode)
+        """
+        result = {}
+        count = 0
+        for record in records:
+            count += 1
+            key = episode_key(record)
+            if key in result:
+                self.duplicates += 1
+            result[key] = (fingerprint(record), record)
+
+        return count, result
+
+    def compare(self, old_records, new_records):
+        """
+        Compare records of two datasets (see writers.read_records). Both are read into
+        memory, keeping the last record of an episode that appears more than once.
+        """
+        self.old_count, old = self.latest(old_records)
+        self.new_count, new = self.latest(new_records)
+
+        for key, (new_fingerprint, record) in new.items():
+            if key not in old:
+                self.only_new.append(key)
+                continue
+
+            old_fingerprint, old_record = old.pop(key)
+            if old_fingerprint == new_fingerprint:
+                self.unchanged += 1
+            else:
+                self.compare_episode(key, old_record, record)
+
+        self.only_old = list(old)
+        return self
+
+    def compare_episode(self, key, old, new):
+        self.changed += 1
+        for field in DIFF_FIELDS:
+            # Blank strings and empty track lists are treated as missing
+            old_value, new_value = old.get(field) or None, new.get(field) or None
+            if old_value == new_value:
+                continue
+            if old_value is None:
+                change = ADDED
+            elif new_value is None:
+                change = REMOVED
+            else:
+                change = CHANGED
+            self.counts[field][change] += 1
+            if len(self.examples[(field, change)]) < self.samples:
+                self.examples[(field, change)].append((key, old_value, new_value))
+
+    @property
+    def identical(self):
+        return not (self.changed or self.only_old or self.only_new)
+
+    def __str__(self):
+        s = (f'Episodes: {self.old_count} old, {self.new_count} new; {self.unchanged} unchanged, '
+             f'{self.changed} changed, {len(self.only_new)} only in new, '
+             f'{len(self.only_old)} only in old\n')
+        if self.duplicates:
+            s += f'{self.duplicates} episodes appear more than once; the last is compared\n'
+        if self.counts:
+            s += f'{"":24}' + ''.join(f'{change:>9}' for change in CHANGES) + '\n'
+            for field in DIFF_FIELDS:
+                if field in self.counts:
+                    s += f'{field:24}' + ''.join(f'{self.counts[field][change]:9}' for change in CHANGES) + '\n'
+
+        for field in DIFF_FIELDS:
+            for change in CHANGES:
+                for key, old_value, new_value in self.examples.get((field, change), []):
+                    s += f'{field} {change} {key}: {display(old_value)} -> {display(new_value)}\n'
+
+        for title, keys in (('Only in new', self.only_new), ('Only in old', self.only_old)):
+            if keys:
+                more = f' and {len(keys) - self.samples} more' if len(keys) > self.samples else ''
+                s += f'{title}: {", ".join(keys[:self.samples])}{more}\n'
+
+        return s
+
+
+def setup_command_line():
+    cmdline = argparse.ArgumentParser(prog='Desert Island Discs dataset diff')
+    cmdline.add_argument('old', help='Output of scraper.py to compare with')
+    cmdline.add_argument('new', help='Output of scraper.py to compare')
+    cmdline.add_argument('--old-format', choices=FORMATS,
+                         help='Format of old file (default is inferred from its name)')
+    cmdline.add_argument('--new-format', choices=FORMATS,
+                         help='Format of new file (default is inferred from its name)')
+    cmdline.add_argument('--samples', type=int, default=DEFAULT_SAMPLES,
+                         help=f'Examples to show of each kind of difference (default is {DEFAULT_SAMPLES})')
+    return cmdline
+
+
+def main():
+    args = setup_command_line().parse_args()
+    reader = CastawayReader()
+    diff = DatasetDiff(args.samples).compare(read_records(reader, args.old, args.old_format),
+                                             read_records(reader, args.new, args.new_format))
+    print(diff, end='')
+    sys.exit(0 if diff.identical else 1)
+
+
+if __name__ == '__main__':
+    main()
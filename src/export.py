@@ -0,0 +1,101 @@
+"""
+=============================================================================
+File: export.py
+Description: Convert the output of scraper.py to another format, eg CSV to Parquet
+             or Excel.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+
+To run:
+
+    python export.py --output <episodes.parquet> <episodes.csv>
+
+The formats are those scraper.py can write (see writers.py) and are inferred from
+the filenames unless given with --format and --input-format. Episodes are converted
+one at a time, so any size of file can be converted.
+
+With --replace, the output file is written alongside and then replaces any existing
+one, eg to regenerate the Excel workbook after each crawl:
+
+    python export.py --replace --output episodes.xlsx episodes.csv
+=============================================================================
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+from dataset import CastawayReader, CastawayWriter
+from writers import file_format, open_writer, read_records, FORMATS
+
+
+def export(input_filename, output_filename=None, format=None, input_format=None):
+    """
+    Write the episodes in input_filename to output_filename in format. Return the
+    number of episodes written.
+    """
+    with open_writer(CastawayWriter(), output_filename, format) as writer:
+        for record in read_records(CastawayReader(), input_filename, input_format):
+            writer.write_record(record)
+
+    return writer.count
+
+
+def export_replacing(input_filename, output_filename, format=None, input_format=None):
+    """
+    As export, but output_filename is replaced, if it exists, once it has been
+    written in full
+    """
+    format = file_format(output_filename, format)
+    directory, name = os.path.split(os.path.abspath(output_filename))
+    # The same extension so the format and compression are the same
+    fd, temporary = tempfile.mkstemp(prefix='.tmp-', suffix=f'-{name}', dir=directory)
+    os.close(fd)
+    os.remove(temporary)
+    try:
+        count = export(input_filename, temporary, format, input_format)
+        os.replace(temporary, output_filename)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+    return count
+
+
+def setup_command_line():
+    cmdline = argparse.ArgumentParser(prog='Desert Island Discs export')
+    cmdline.add_argument('input', help='Output of scraper.py')
+    cmdline.add_argument('--output',
+                         help='File to write. CSV and JSON Lines files are appended to if they '
+                         'exist (default output is to console)')
+    cmdline.add_argument('--format', choices=FORMATS,
+                         help='Format to write (default is inferred from the --output filename)')
+    cmdline.add_argument('--input-format', choices=FORMATS,
+                         help='Format of input (default is inferred from its name)')
+    cmdline.add_argument('--replace', action='store_true',
+                         help='Replace --output if it exists instead of appending to it')
+    return cmdline
+
+
+def main():
+    args = setup_command_line().parse_args()
+    if args.replace and not args.output:
+        print('*** --replace needs --output')
+        sys.exit(1)
+    try:
+        # The output's format is checked before anything is written
+        if args.replace:
+            count = export_replacing(args.input, args.output, args.format, args.input_format)
+        else:
+            count = export(args.input, args.output, args.format, args.input_format)
+    except ValueError as e:
+        print(f'*** {e}')
+        sys.exit(1)
+
+    if args.output:
+        print(f'Wrote {count} episodes to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+=============================================================================
+File: extraction_cache.py
+Description: Cache of data extracted from episode pages so that unchanged pages are
+             not parsed again.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+
+Entries are keyed by the SHA-256 of the page, the context it was extracted in (the
+castaway's name) and the version of the extraction code. The version is a hash of the extraction code and its constants (see
+scraper.extractor_version), so changing either invalidates the cache.
+=============================================================================
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Entries are evicted (see ExtractionCache.evict) after this many puts, and as soon as
+# the cache is bigger than its maximum size.
+EVICT_EVERY = 1000
+# A cache bigger than its maximum size is cut to this fraction of it so that it isn't
+# evicted again on the next put
+EVICT_TO_FRACTION = 0.9
+
+
+class ExtractionCache:
+    """
+    On-disk (SQLite) store of extracted episodes. Safe to use from several threads.
+    """
+
+    def __init__(self, filename, version, max_age_days=None, max_size_mb=None):
+        self.filename = filename
+        self.version = version
+        self.max_age_days = max_age_days
+        self.max_size_mb = max_size_mb
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+        # Total size of the data in the cache
+        self.size = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False, timeout=30)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS extraction ('
+                             'key TEXT PRIMARY KEY, version TEXT, created REAL, '
+                             'accessed REAL, size INTEGER, data TEXT)')
+        self.evict()
+
+    def key(self, page, context=''):
+        h = hashlib.sha256(page)
+        h.update(context.encode('utf-8'))
+        return f'{h.hexdigest()}:{self.version}'
+
+    def get(self, page, context=''):
+        """
+        Return data extracted from page in context (eg the castaway's name) or None if
+        not in cache
+        """
+        key = self.key(page, context)
+        with self._lock:
+            row = self._db.execute(
+                'SELECT data FROM extraction WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            with self._db:
+                self._db.execute('UPDATE extraction SET accessed = ? WHERE key = ?',
+                                 (time.time(), key))
+
+        return json.loads(row[0])
+
+    def put(self, page, data, context=''):
+        data = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        key = self.key(page, context)
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute(
+                'SELECT size FROM extraction WHERE key = ?', (key,)).fetchone()
+            self._db.execute('INSERT OR REPLACE INTO extraction VALUES (?, ?, ?, ?, ?, ?)',
+                             (key, self.version, now, now, len(data), data))
+            self.size += len(data) - (row[0] if row else 0)
+            self.puts += 1
+            evict = self.puts % EVICT_EVERY == 0 or \
+                (self.max_size_mb is not None and self.size > self.max_size_mb * 1024 * 1024)
+
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove entries from older versions of the extraction code, entries older than
+        max_age_days and, if the cache is bigger than max_size_mb, the least recently
+        used entries (see EVICT_TO_FRACTION).
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                'DELETE FROM extraction WHERE version != ?', (self.version,))
+
+            if self.max_age_days is not None:
+                self._db.execute('DELETE FROM extraction WHERE created < ?',
+                                 (time.time() - self.max_age_days * SECONDS_PER_DAY,))
+
+            if self.max_size_mb is not None:
+                size = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM extraction').fetchone()[0]
+                if size > self.max_size_mb * 1024 * 1024:
+                    excess = size - EVICT_TO_FRACTION * self.max_size_mb * 1024 * 1024
+                    keys = []
+                    for key, size in self._db.execute('SELECT key, size FROM extraction ORDER BY accessed'):
+                        if excess <= 0:
+                            break
+                        keys.append((key,))
+                        excess -= size
+                    self._db.executemany(
+                        'DELETE FROM extraction WHERE key = ?', keys)
+
+            self.size = self._db.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM extraction').fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+    @property
+    def stats(self):
+        total = self.hits + self.misses
+        ratio = 100 * self.hits / total if total else 0
+        return f'Extraction cache hits: {self.hits}, misses: {self.misses} ({ratio:.0f}% hits)'
@@ -0,0 +1,416 @@
+"""
+=============================================================================
+File: fetcher.py
+Description: Fetch pages from the BBC website, as fast as the site tolerates.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+=============================================================================
+"""
+
+import requests
+import threading
+import time
+import email.utils
+import collections
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
+
+from metrics import METRICS
+
+# Requests per second to start at. The rate is adjusted according to how the server
+# responds: it is halved when the server is struggling (429/5xx or rising latency), at
+# most once every BACKOFF_INTERVAL, and increased a little after every good response.
+DEFAULT_RATE = 2.0
+DEFAULT_MIN_RATE = 0.1
+DEFAULT_MAX_RATE = 10.0
+BACKOFF_FACTOR = 0.5
+RATE_INCREASE = 0.1
+
+# A response that takes this many times longer than the average indicates the server
+# is slowing down.
+LATENCY_BACKOFF_FACTOR = 3
+# Weight of latest response when averaging latency
+LATENCY_SMOOTHING = 0.2
+# Seconds after a back off before the rate is cut again. Errors and slow responses to
+# requests made before the back off say nothing about the new rate, and backing off for
+# each of them would halve the rate faster than it can recover. Retry-After is always
+# honoured.
+BACKOFF_INTERVAL = 10
+
+# Responses that mean "slow down", which are retried.
+NOT_MODIFIED = 304
+RETRY_STATUS = [429, 500, 502, 503, 504]
+MAX_RETRIES = 3
+
+# Seconds to wait for a connection and then for each read from the server
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+
+# Hedged requests: if a request takes longer than the given percentile of recent
+# latencies, a second identical request is made and the first response used.
+HEDGE_PERCENTILE = 95
+# Number of latencies needed before hedging starts and number kept
+HEDGE_MIN_SAMPLES = 20
+LATENCY_SAMPLES = 200
+HEDGE_WORKERS = 8
+
+# Bytes read at a time from a streamed response (see Fetcher.get's until)
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+class FetchTimeout(Exception):
+    """
+    Page could not be fetched in time. The page can be fetched again later.
+    """
+    pass
+
+
+class DeadlineExceeded(FetchTimeout):
+    """
+    The overall time allowed for the run has passed
+    """
+    pass
+
+
+def read_until(response, done, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Read response's body a chunk at a time until done(chunk) is true, then close the
+    connection so the rest isn't downloaded. response.content is what was read and
+    response.truncated tells whether the body was cut short.
+    """
+    chunks = []
+    response.truncated = False
+    try:
+        for chunk in response.iter_content(chunk_size):
+            chunks.append(chunk)
+            if done(chunk):
+                response.truncated = True
+                break
+    finally:
+        response.close()
+    # As requests does once it has read the body
+    response._content = b''.join(chunks)
+    return response
+
+
+def parse_retry_after(value):
+    """
+    Return seconds to wait from Retry-After header, which is either a number of seconds
+    or an HTTP date. Return None if missing or invalid.
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    Token bucket whose rate adapts to the server: multiplicative decrease when the
+    server pushes back, additive increase when it doesn't. It's safe to share between
+    threads.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE,
+                 burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, rate)
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = burst
+        self.last_refill = clock()
+        self.pause_until = 0
+        self.average_latency = None
+        self.last_backoff = None
+        self.backoffs = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens +
+                          (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        """
+        Block until a request may be made
+        """
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._refill(now)
+                if now >= self.pause_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = max(self.pause_until - now,
+                            (1 - self.tokens) / self.rate)
+
+            self.sleep(delay)
+
+    def backoff(self, retry_after=None):
+        with self._lock:
+            now = self.clock()
+            if self.last_backoff is None or now - self.last_backoff >= BACKOFF_INTERVAL:
+                self.rate = max(self.min_rate, self.rate * BACKOFF_FACTOR)
+                self.backoffs += 1
+                self.last_backoff = now
+            if retry_after is not None:
+                self.pause_until = max(
+                    self.pause_until, now + retry_after)
+
+    def speedup(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + RATE_INCREASE)
+
+    def record(self, status, latency, retry_after=None):
+        """
+        Adjust rate given the response to a request
+        """
+        with self._lock:
+            slow = self.average_latency is not None and \
+                latency > LATENCY_BACKOFF_FACTOR * self.average_latency
+            if self.average_latency is None:
+                self.average_latency = latency
+            else:
+                self.average_latency += LATENCY_SMOOTHING * \
+                    (latency - self.average_latency)
+
+        if status in RETRY_STATUS or retry_after is not None or slow:
+            self.backoff(retry_after)
+        else:
+            self.speedup()
+
+    def __str__(self):
+        return f'{self.rate:.2f} requests/s'
+
+
+class Fetcher:
+    """
+    Fetch pages through a pooled session, with rate limiting, retries, timeouts and
+    (optionally) hedged requests.
+    """
+
+    def __init__(self, rate_limiter=None, session=None, max_retries=MAX_RETRIES,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 deadline=None, hedge=False, archive=None, stream=False):
+        self.rate_limiter = rate_limiter if rate_limiter else RateLimiter()
+        self.session = session if session else requests.Session()
+        self.max_retries = max_retries
+        self.timeout = (connect_timeout, read_timeout)
+        # deadline is seconds from now for the whole run
+        self.deadline = time.monotonic() + deadline if deadline else None
+        self.hedge = hedge
+        # PageArchive to save every page fetched
+        self.archive = archive
+        # Stop downloading pages once the caller has what it needs (see get)
+        self.stream = stream
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.executor = ThreadPoolExecutor(HEDGE_WORKERS) if hedge else None
+        self.requests = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.connection_errors = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.truncated = 0
+        # The fetcher is shared by the crawl's fetch workers
+        self._lock = threading.Lock()
+
+    def count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def check_deadline(self):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise DeadlineExceeded('Time allowed for run has passed')
+
+    def hedge_after(self):
+        """
+        Return seconds after which a request is hedged or None if there are not
+        enough latencies to tell.
+        """
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, len(latencies) * HEDGE_PERCENTILE // 100)]
+
+    def _get(self, url, headers=None, until=None):
+        if until is None:
+            return self.session.get(url, headers=headers, timeout=self.timeout)
+
+        response = self.session.get(url, headers=headers, timeout=self.timeout, stream=True)
+        if response.status_code != 200:
+            # Error pages etc are read in full
+            response.content
+            return response
+        return read_until(response, until())
+
+    def _hedged_get(self, url, hedge_after, headers=None, until=None):
+        """
+        Return whichever of the original or hedge request responds first
+        """
+        def close_response(future):
+            if not future.cancelled() and future.exception() is None:
+                future.result().close()
+
+        primary = self.executor.submit(self._get, url, headers, until)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        # The hedge request is also subject to the rate limit
+        self.rate_limiter.acquire()
+        self.count('hedges')
+        hedge = self.executor.submit(self._get, url, headers, until)
+
+        pending = [primary, hedge]
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self.count('hedge_wins')
+                    # Don't leave the loser holding a connection
+                    loser = primary if future is hedge else hedge
+                    if not loser.cancel():
+                        loser.add_done_callback(close_response)
+                    return future.result()
+
+        # Both failed: raise the original request's error
+        return primary.result()
+
+    def request(self, url, headers=None, until=None):
+        """
+        Make a single rate-limited request
+        """
+        self.check_deadline()
+        self.rate_limiter.acquire()
+        start = time.monotonic()
+        METRICS.inc('did_requests_in_flight')
+        try:
+            if self.hedge and (hedge_after := self.hedge_after()) is not None:
+                response = self._hedged_get(url, hedge_after, headers, until)
+            else:
+                response = self._get(url, headers, until)
+        except requests.exceptions.Timeout as e:
+            self.count('timeouts')
+            METRICS.inc('did_errors_total', type='timeout')
+            self.rate_limiter.backoff()
+            raise FetchTimeout(f'Timed out fetching {url}: {e}') from e
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.ChunkedEncodingError) as e:
+            # Including a connection reset while reading the body. Not a sign the server
+            # is slow, so no back off, but worth trying again later.
+            self.count('connection_errors')
+            METRICS.inc('did_errors_total', type='connection')
+            raise FetchTimeout(f'Failed to connect fetching {url}: {e}') from e
+        finally:
+            METRICS.dec('did_requests_in_flight')
+
+        latency = time.monotonic() - start
+        with self._lock:
+            self.latencies.append(latency)
+            self.requests += 1
+        METRICS.inc('did_requests_total')
+        METRICS.observe('did_fetch_seconds', latency)
+        METRICS.inc('did_bytes_downloaded_total', len(response.content))
+        if getattr(response, 'truncated', False):
+            self.count('truncated')
+        if response.status_code >= 400:
+            METRICS.inc('did_errors_total', type=f'http_{response.status_code}')
+
+        retry_after = None
+        if response.status_code in RETRY_STATUS:
+            retry_after = parse_retry_after(
+                response.headers.get('Retry-After'))
+        self.rate_limiter.record(response.status_code, latency, retry_after)
+        METRICS.set('did_rate_limit', self.rate_limiter.rate)
+
+        return response
+
+    def get(self, url, headers=None, until=None):
+        """
+        Return response, retrying if the server asks us to slow down or doesn't
+        respond in time. Raise FetchTimeout if all attempts time out. headers are
+        extra request headers eg for a conditional GET.
+
+        If the fetcher streams and until is given, the page is downloaded a chunk at
+        a time and the connection closed as soon as until()(chunk) is true, so the
+        response's content is only the start of the page. until is called for each
+        attempt. Pages are read in full if they're archived.
+        """
+        if not self.stream or self.archive:
+            until = None
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self.request(url, headers, until)
+            except DeadlineExceeded:
+                raise
+            except FetchTimeout:
+                if last_attempt:
+                    raise
+                self.count('retries')
+                continue
+
+            if response.status_code not in RETRY_STATUS or last_attempt:
+                if self.archive and response.status_code != NOT_MODIFIED:
+                    self.archive.write(url, response.status_code,
+                                       response.headers, response.content)
+                return response
+            self.count('retries')
+
+    @property
+    def stats(self):
+        result = f'Requests: {self.requests}, retries: {self.retries}, timeouts: {self.timeouts}, ' + \
+            f'connection errors: {self.connection_errors}, backoffs: {self.rate_limiter.backoffs}, current rate: {self.rate_limiter}'
+        if self.hedge:
+            result += f', hedged: {self.hedges} (hedge faster: {self.hedge_wins})'
+        if self.stream:
+            result += f', stopped early: {self.truncated}'
+
+        return result
+
+
+_fetcher = None
+
+
+def default_fetcher():
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = Fetcher()
+    return _fetcher
+
+
+def set_fetcher(fetcher):
+    """
+    Use fetcher for all subsequent calls to GetPage
+    """
+    global _fetcher
+    _fetcher = fetcher
+
+
+def GetPage(url, until=None):
+    """
+    Fetch page from web. until stops the download early (see Fetcher.get).
+    """
+    def page_found(code):
+        return code == 200
+
+    page = default_fetcher().get(url, until=until)
+
+    if not page_found(page.status_code):
+        print(f'Status {page.status_code} for {url}')
+
+    return page.content
@@ -0,0 +1,101 @@
+"""
+=============================================================================
+File: fixtures.py
+Description: Record and replay of fetched pages so that tests don't use the network.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+
+Pages are stored in a PageArchive (see archive.py). The mode is set by the
+FIXTURE_MODE environment variable:
+
+    replay  pages are read from the fixture archive (the default if the archive
+            exists); a test that needs a page that isn't there fails
+    skip    as replay, but a test that needs a page that isn't there is skipped, eg
+            when the fixtures can't be recorded
+    record  pages are fetched from the web and added to the fixture archive
+    live    pages are fetched from the web and not saved (the default if the
+            archive doesn't exist yet)
+
+To record the fixtures:
+
+    FIXTURE_MODE=record python -m unittest test_episode
+=============================================================================
+"""
+
+import os
+import unittest
+
+from archive import PageArchive
+from fetcher import Fetcher, RateLimiter, set_fetcher
+
+FIXTURE_MODE_VARIABLE = 'FIXTURE_MODE'
+REPLAY = 'replay'
+SKIP = 'skip'
+RECORD = 'record'
+LIVE = 'live'
+FIXTURE_MODES = [REPLAY, SKIP, RECORD, LIVE]
+# No need to limit the rate of reading from a file
+REPLAY_RATE = 1000
+
+
+class FixtureMissing(Exception):
+    """
+    A page is not in the fixture archive
+    """
+
+
+class ReplayResponse:
+    def __init__(self, record):
+        self.url = record.url
+        self.status_code = record.status
+        self.headers = record.headers
+        self.content = record.body
+
+
+class ReplaySession:
+    """
+    Stand-in for requests.Session that returns pages from a PageArchive. A missing page
+    fails the test or, if skip_missing, skips it.
+    """
+
+    def __init__(self, archive, skip_missing=False):
+        self.archive = archive
+        self.skip_missing = skip_missing
+
+    def get(self, url, **kwargs):
+        if (record := self.archive.get(url)) is None:
+            message = f'No fixture for {url}; record it with {FIXTURE_MODE_VARIABLE}={RECORD}'
+            if self.skip_missing:
+                raise unittest.SkipTest(message)
+            raise FixtureMissing(message)
+        return ReplayResponse(record)
+
+
+def fixture_mode(filename=None):
+    """
+    Return mode set by the environment or, if none is set, replay if the fixture
+    archive filename exists and live if not
+    """
+    default = REPLAY if filename is None or os.path.exists(filename) else LIVE
+    mode = os.environ.get(FIXTURE_MODE_VARIABLE, default).lower()
+    if mode not in FIXTURE_MODES:
+        raise ValueError(f'{FIXTURE_MODE_VARIABLE} must be one of {", ".join(FIXTURE_MODES)}')
+    return mode
+
+
+def use_fixtures(filename, mode=None):
+    """
+    Make GetPage replay pages from, or record pages to, the fixture archive filename
+    """
+    mode = mode or fixture_mode(filename)
+    if mode in [REPLAY, SKIP]:
+        fetcher = Fetcher(RateLimiter(REPLAY_RATE, max_rate=REPLAY_RATE), max_retries=0,
+                          session=ReplaySession(PageArchive(filename), mode == SKIP))
+    elif mode == RECORD:
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        fetcher = Fetcher(archive=PageArchive(filename))
+    else:
+        fetcher = Fetcher()
+
+    set_fetcher(fetcher)
+    return fetcher
@@ -1,5 +1,7 @@
 """
 Before writing unit tests, I wrote this to list a some episodes that were different from each other. 
+
+To check the parser still works before a full crawl, use scraper.py --canary instead.
 """
 from scraper import *
 import time
@@ -0,0 +1,75 @@
+"""
+=============================================================================
+File: merge_shards.py
+Description: Combine the output of scraper.py runs on several machines (see the
+             --shard option of scraper.py) into one CSV file.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+
+To run:
+
+    python merge_shards.py --csv <merged.csv> <shard1.csv> <shard2.csv> ...
+
+Episodes are deduplicated by programme id and ordered by broadcast date, newest
+first, as on the BBC listing pages.
+=============================================================================
+"""
+
+import argparse
+import csv
+
+from dataset import CastawayReader, CastawayWriter, programme_pid, smart_open, TAB
+
+
+def completeness(row):
+    return sum(1 for v in row.values() if v)
+
+
+def merge_shards(filenames):
+    """
+    Return rows of all files, with one row per programme id. If an episode is in
+    more than one file, the row with most fields filled in is used.
+    """
+    rows = {}
+    for filename in filenames:
+        for row in CastawayReader().rows(filename):
+            pid = programme_pid(row['URL'])
+            if pid not in rows or completeness(row) >= completeness(rows[pid]):
+                rows[pid] = row
+
+    return sorted(rows.values(), reverse=True,
+                  key=lambda row: (row['Date first broadcast'] or '',
+                                   row['Time first broadcast'] or '',
+                                   programme_pid(row['URL'])))
+
+
+def write_rows(rows, filename=None, delim=TAB):
+    header = CastawayWriter().csv_header()
+    with smart_open(filename) as output:
+        writer = csv.writer(output, delimiter=delim, lineterminator='\r\n')
+        writer.writerow(header)
+        for row in rows:
+            # Columns beyond the header (eg extra tracks) are kept
+            writer.writerow([row.get(h) or '' for h in header] + row.get(None, []))
+
+
+def setup_command_line():
+    cmdline = argparse.ArgumentParser(prog='Desert Island Discs shard merger')
+    cmdline.add_argument('--csv', dest='output',
+                         help='Filename of merged CSV file (tab-separated). The file is '
+                         'overwritten (default output is to console)')
+    cmdline.add_argument('shards', nargs='+',
+                         help='CSV files created by scraper.py, one per shard')
+    return cmdline
+
+
+def main():
+    args = setup_command_line().parse_args()
+    rows = merge_shards(args.shards)
+    write_rows(rows, args.output)
+    if args.output:
+        print(f'Wrote {len(rows)} episodes to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+"""
+=============================================================================
+File: metrics.py
+Description: Metrics for monitoring a crawl while it runs: a Prometheus endpoint
+             and a progress line with an estimated time to finish.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+
+The fetcher, pipeline and crawler update METRICS as they work. To see them, run
+scraper.py with --metrics-port and point Prometheus (or a browser) at
+http://127.0.0.1:<port>/metrics, and/or use --progress for a line like
+
+    pages 12/225 | episodes 340/2250 15% | 8.2/s | ETA 0:03:53 | in flight 4 | errors 3 | 12.3 MB | cache 80%
+=============================================================================
+"""
+
+import bisect
+import collections
+import sys
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+DEFAULT_PROGRESS_INTERVAL = 10
+# Throughput for the ETA is measured over this many of the latest progress reports
+THROUGHPUT_SAMPLES = 6
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# name: (type, help)
+METRIC_DEFINITIONS = {
+    'did_listing_pages_total': (COUNTER, 'Listing pages fetched'),
+    'did_listing_pages_expected': (GAUGE, 'Listing pages to fetch'),
+    'did_episodes_total': (COUNTER, 'Episodes scraped'),
+    'did_episodes_expected': (GAUGE, 'Episodes to scrape'),
+    'did_requests_in_flight': (GAUGE, 'HTTP requests waiting for a response'),
+    'did_requests_total': (COUNTER, 'HTTP requests made'),
+    'did_bytes_downloaded_total': (COUNTER, 'Bytes of pages downloaded'),
+    'did_errors_total': (COUNTER, 'Errors by type'),
+    'did_fetch_seconds': (HISTOGRAM, 'Time to fetch a page'),
+    'did_parse_seconds': (HISTOGRAM, 'Time to parse an episode page'),
+    'did_cache_hits_total': (COUNTER, 'Episodes found in the extraction cache'),
+    'did_cache_misses_total': (COUNTER, 'Episodes not found in the extraction cache'),
+    'did_page_fallbacks_total': (COUNTER, 'Episode pages fetched for fields missing from structured data'),
+    'did_rate_limit': (GAUGE, 'Requests per second allowed by the rate limiter'),
+}
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Return upper bound of the bucket containing quantile q or None if empty
+        """
+        if self.count == 0:
+            return None
+        target = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets + [float('inf')], self.counts):
+            total += count
+            if total >= target:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """
+    Counters, gauges and histograms, optionally with labels. Safe to update from
+    several threads.
+    """
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.values = collections.defaultdict(float)
+        self.histograms = {}
+        # Functions called before metrics are read, to update gauges from elsewhere
+        self.collectors = []
+        # (time, episodes scraped) at each progress report
+        self.throughput_samples = collections.deque(maxlen=THROUGHPUT_SAMPLES)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self.values[self.key(name, labels)] += value
+
+    def dec(self, name, value=1, **labels):
+        self.inc(name, -value, **labels)
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.values[self.key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            key = self.key(name, labels)
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def get(self, name, **labels):
+        with self._lock:
+            return self.values.get(self.key(name, labels), 0)
+
+    def total(self, name):
+        """
+        Return sum of metric over all its labels
+        """
+        with self._lock:
+            return sum(v for (n, _), v in self.values.items() if n == name)
+
+    def histogram(self, name, **labels):
+        with self._lock:
+            return self.histograms.get(self.key(name, labels))
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def collect(self):
+        for collector in self.collectors:
+            collector(self)
+
+    def reset(self):
+        with self._lock:
+            self.start = time.monotonic()
+            self.values.clear()
+            self.histograms.clear()
+            self.collectors = []
+            self.throughput_samples.clear()
+
+    def prometheus_text(self):
+        """
+        Return metrics in the Prometheus text exposition format
+        """
+        self.collect()
+
+        def label_text(labels, extra=()):
+            labels = list(labels) + list(extra)
+            if not labels:
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+        lines = []
+        with self._lock:
+            for name, (kind, description) in METRIC_DEFINITIONS.items():
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} {kind}')
+                if kind == HISTOGRAM:
+                    for (n, labels), h in sorted(self.histograms.items()):
+                        if n != name:
+                            continue
+                        cumulative = 0
+                        for bound, count in zip(h.buckets + ['+Inf'], h.counts):
+                            cumulative += count
+                            lines.append(f'{name}_bucket{label_text(labels, [("le", bound)])} {cumulative}')
+                        lines.append(f'{name}_sum{label_text(labels)} {h.sum}')
+                        lines.append(f'{name}_count{label_text(labels)} {h.count}')
+                else:
+                    for (n, labels), value in sorted(self.values.items()):
+                        if n == name:
+                            lines.append(f'{name}{label_text(labels)} {value:g}')
+
+        return '\n'.join(lines) + '\n'
+
+    def progress(self):
+        """
+        Return one line summary of progress, with estimated time to finish based on
+        the throughput so far
+        """
+        self.collect()
+        now = time.monotonic()
+        episodes = self.get('did_episodes_total')
+        expected = self.get('did_episodes_expected')
+
+        # Recent throughput, so the ETA isn't skewed by eg time spent on listing pages
+        self.throughput_samples.append((now, episodes))
+        first_time, first_episodes = self.throughput_samples[0]
+        if now - first_time > 0 and episodes > first_episodes:
+            rate = (episodes - first_episodes) / (now - first_time)
+        else:
+            rate = episodes / (now - self.start) if now > self.start else 0
+
+        parts = []
+        if (pages_expected := self.get('did_listing_pages_expected')):
+            parts.append(f'pages {self.get("did_listing_pages_total"):.0f}/{pages_expected:.0f}')
+        if expected:
+            parts.append(f'episodes {episodes:.0f}/{expected:.0f} {min(1, episodes / expected):.0%}')
+        else:
+            parts.append(f'episodes {episodes:.0f}')
+        parts.append(f'{rate:.1f}/s')
+        if expected and rate > 0:
+            parts.append(f'ETA {timedelta(seconds=round(max(0, expected - episodes) / rate))}')
+        parts.append(f'in flight {self.get("did_requests_in_flight"):.0f}')
+        parts.append(f'errors {self.total("did_errors_total"):.0f}')
+        parts.append(f'{self.get("did_bytes_downloaded_total") / 1e6:.1f} MB')
+        if (fetch := self.histogram('did_fetch_seconds')) and fetch.count:
+            parts.append(f'fetch p50 {fetch.quantile(0.5)}s p95 {fetch.quantile(0.95)}s')
+        lookups = self.get('did_cache_hits_total') + self.get('did_cache_misses_total')
+        if lookups:
+            parts.append(f'cache {self.get("did_cache_hits_total") / lookups:.0%}')
+
+        return ' | '.join(parts)
+
+
+METRICS = Metrics()
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    metrics = METRICS
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = self.metrics.prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, host='127.0.0.1', metrics=METRICS):
+    """
+    Serve metrics at http://host:port/metrics from a background thread. Return server.
+    """
+    handler = type('Handler', (MetricsRequestHandler,), {'metrics': metrics})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class ProgressReporter:
+    """
+    Print a progress line every interval seconds from a background thread
+    """
+
+    def __init__(self, interval=DEFAULT_PROGRESS_INTERVAL, metrics=METRICS, output=sys.stderr):
+        self.interval = interval
+        self.metrics = metrics
+        self.output = output
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            print(self.metrics.progress(), file=self.output, flush=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        print(self.metrics.progress(), file=self.output, flush=True)
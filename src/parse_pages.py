@@ -0,0 +1,72 @@
+"""
+=============================================================================
+File: parse_pages.py
+Description: Extract episodes from episode pages saved from the BBC website, or
+             from episode URLs, without crawling the listing.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+
+To run:
+
+    python parse_pages.py "../data/BBC Radio 4 - Desert Island Discs, Cilla Black.html"
+
+Useful to see what the extraction code makes of a page, eg one that has been
+mis-extracted. Episodes are written in any format scraper.py writes (see
+writers.py), to the console by default.
+=============================================================================
+"""
+
+import argparse
+import os
+import sys
+
+from scraper import (CastawayWriter, DesertIslandDiscsCastaway, DesertIslandDiscsParser,
+                     PresenterIndex, GetPage, DEFAULT_DATASET)
+from writers import open_writer, output_format, FORMATS
+
+
+def parse_page(parser, filename_or_url):
+    """
+    Return castaway, with episode, of the saved page or URL. The castaway's name and
+    job are taken from the episode title.
+    """
+    if os.path.exists(filename_or_url):
+        with open(filename_or_url, 'rb') as f:
+            page, url = f.read(), None
+    else:
+        page, url = GetPage(filename_or_url), filename_or_url
+
+    episode = parser.parse_episode_page(page)
+    name, job = parser.name_and_job(episode.title)
+    return DesertIslandDiscsCastaway(name, job, url, episode)
+
+
+def setup_command_line():
+    cmdline = argparse.ArgumentParser(prog='Desert Island Discs page parser')
+    cmdline.add_argument('pages', nargs='+',
+                         help='Saved episode pages or episode URLs (e.g. https://www.bbc.co.uk/programmes/m000fx1k)')
+    cmdline.add_argument('--output', help='File to write (default output is to console)')
+    cmdline.add_argument('--format', choices=FORMATS,
+                         help='Output format (default is inferred from the --output filename)')
+    cmdline.add_argument('--dataset', default=DEFAULT_DATASET,
+                         help='CSV output of a previous run used to look up presenters by broadcast '
+                         f'date (default is {DEFAULT_DATASET})')
+    return cmdline
+
+
+def main():
+    args = setup_command_line().parse_args()
+    try:
+        output_format(args.output, args.format)
+    except ValueError as e:
+        print(f'*** {e}')
+        sys.exit(1)
+
+    parser = DesertIslandDiscsParser(presenter_index=PresenterIndex.from_dataset(args.dataset))
+    with open_writer(CastawayWriter(), args.output, args.format) as writer:
+        for page in args.pages:
+            writer.write(parse_page(parser, page))
+
+
+if __name__ == '__main__':
+    main()
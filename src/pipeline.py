@@ -0,0 +1,147 @@
+"""
+=============================================================================
+File: pipeline.py
+Description: Run work as a series of stages connected by bounded queues so that
+             fetching (waiting on the network) and parsing (using the CPU) overlap.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+=============================================================================
+"""
+
+import queue
+import threading
+import time
+import traceback
+import sys
+
+from metrics import METRICS
+
+# Items waiting between stages. When a queue is full, the stage feeding it waits
+# (backpressure), so memory use stays flat however many items there are.
+DEFAULT_QUEUE_SIZE = 20
+
+# Marks end of input on a queue
+_DONE = object()
+
+
+class Stage:
+    """
+    A step in the pipeline. work is called for each input item and returns an iterable
+    of output items (eg a list, generator or empty tuple) for the next stage.
+    """
+
+    def __init__(self, name, work, workers=1, queue_size=DEFAULT_QUEUE_SIZE):
+        self.name = name
+        self.work = work
+        self.workers = workers
+        self.input = queue.Queue(queue_size)
+        self.processed = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.max_depth = 0
+        self.depth_total = 0
+        self.depth_samples = 0
+        self._finished_workers = 0
+        self._lock = threading.Lock()
+
+    def sample_depth(self):
+        depth = self.input.qsize()
+        with self._lock:
+            self.max_depth = max(self.max_depth, depth)
+            self.depth_total += depth
+            self.depth_samples += 1
+
+    def put(self, item):
+        self.input.put(item)
+        self.sample_depth()
+
+    @property
+    def average_depth(self):
+        return self.depth_total / self.depth_samples if self.depth_samples else 0
+
+    def utilization(self, elapsed):
+        """
+        Fraction of time the stage's workers were busy
+        """
+        return self.busy / (self.workers * elapsed) if elapsed > 0 else 0
+
+    def report(self, elapsed):
+        return f'{self.name:<16} workers: {self.workers:>2}, processed: {self.processed:>6}, ' + \
+            f'errors: {self.errors:>3}, utilization: {100 * self.utilization(elapsed):5.1f}%, ' + \
+            f'queue depth: average {self.average_depth:5.1f}, max {self.max_depth:>3}'
+
+
+class Pipeline:
+    """
+    Run items through stages. Each stage has its own worker threads.
+    """
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.elapsed = 0.0
+
+    def _worker(self, i):
+        stage = self.stages[i]
+        next_stage = self.stages[i + 1] if i + 1 < len(self.stages) else None
+
+        while (item := stage.input.get()) is not _DONE:
+            start = time.monotonic()
+            try:
+                for output in stage.work(item):
+                    if next_stage:
+                        next_stage.put(output)
+                with stage._lock:
+                    stage.processed += 1
+            except Exception as e:
+                with stage._lock:
+                    stage.errors += 1
+                METRICS.inc('did_errors_total', type=type(e).__name__)
+                print(f'Error in {stage.name} processing {item}: {e}')
+                traceback.print_exc(file=sys.stdout)
+            finally:
+                with stage._lock:
+                    stage.busy += time.monotonic() - start
+
+        # The last worker of a stage to finish tells the next stage there's no more input
+        with stage._lock:
+            stage._finished_workers += 1
+            last = stage._finished_workers == stage.workers
+        if last and next_stage:
+            for _ in range(next_stage.workers):
+                next_stage.input.put(_DONE)
+
+    def run(self, items):
+        """
+        Feed items to the first stage and wait for all stages to finish
+        """
+        start = time.monotonic()
+        threads = []
+        for i, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                thread = threading.Thread(target=self._worker, args=(i,),
+                                          name=f'{stage.name} {n + 1}', daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        first = self.stages[0]
+        for item in items:
+            first.put(item)
+        for _ in range(first.workers):
+            first.input.put(_DONE)
+
+        for thread in threads:
+            thread.join()
+
+        self.elapsed = time.monotonic() - start
+
+    @property
+    def bottleneck(self):
+        return max(self.stages, key=lambda s: s.utilization(self.elapsed))
+
+    def report(self):
+        result = ''
+        for stage in self.stages:
+            result += stage.report(self.elapsed) + '\n'
+        result += f'Bottleneck: {self.bottleneck.name} ({self.elapsed:.1f}s elapsed)\n'
+
+        return result
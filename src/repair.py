@@ -0,0 +1,184 @@
+"""
+=============================================================================
+File: repair.py
+Description: Re-scrape only the episodes in a CSV file created by scraper.py that
+             have missing data, and patch their rows.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+
+To run:
+
+    python repair.py --csv <episodes.csv>
+
+An episode is repaired if its book, luxury, favourite track or presenter is blank
+or it has fewer than MAX_TRACKS tracks. Episodes with suspicious values are also
+repaired: more than MAX_TRACKS tracks, or a presenter other than the one of the
+presenter era (see scraper.py) the broadcast date is in. After the extraction code
+has been improved, this fetches just those episodes instead of doing a full crawl.
+The file is rewritten with the rows in the same order. A blank field is filled in
+if the re-scraped value isn't blank, so a repair never loses data; a suspicious
+field is replaced if the re-scraped value isn't blank and, for the presenter, was
+found on the episode page rather than looked up by date.
+=============================================================================
+"""
+
+import argparse
+import os
+
+from scraper import (CastawayReader, CastawayWriter, Crawler, DesertIslandDiscsCastaway,
+                     DesertIslandDiscsParser, ExtractionCache, Fetcher, Pipeline,
+                     PresenterIndex, RateLimiter, extractor_version, is_classic_episode,
+                     missing_fields,
+                     set_fetcher, track_count, DEFAULT_DATASET, DEFAULT_FETCH_WORKERS,
+                     DEFAULT_PARSE_WORKERS, DEFAULT_QUEUE_SIZE, DEFAULT_RATE, DEFAULT_MAX_RATE,
+                     EPISODE_FIELDS, MAX_TRACKS, TRACKS)
+from merge_shards import write_rows
+
+REPAIR_FIELDS = EPISODE_FIELDS
+
+
+def suspicious_fields(row, presenter_index, fields=EPISODE_FIELDS):
+    """
+    Return fields of row that are filled in but implausible: TRACKS if the row has
+    more than MAX_TRACKS tracks and Presenter if it isn't the presenter of the era
+    the broadcast date is in
+    """
+    result = []
+    if TRACKS in fields and track_count(row) > MAX_TRACKS:
+        result.append(TRACKS)
+    if 'Presenter' in fields and row['Presenter'] and \
+            not is_classic_episode(row['Episode title']):
+        era_presenter = presenter_index.lookup(row['Date first broadcast'])
+        if era_presenter and era_presenter != row['Presenter']:
+            result.append('Presenter')
+
+    return result
+
+
+def patch_row(row, repaired, replace=()):
+    """
+    Return row with blank fields, and the fields in replace, filled in from the
+    repaired row. The tracks are replaced only if the repaired row has more of them
+    or TRACKS is in replace and it has no more than MAX_TRACKS.
+    """
+    result = dict(row)
+    track_fields = {f'{name} {i}' for i in range(1, MAX_TRACKS + 1) for name in ('Artist', 'Song')}
+
+    for field, value in repaired.items():
+        if field is not None and field not in track_fields and value and \
+                (not row.get(field) or field in replace):
+            result[field] = value
+
+    repaired_tracks = track_count(repaired)
+    if repaired_tracks > track_count(row) or \
+            (TRACKS in replace and 0 < repaired_tracks <= MAX_TRACKS):
+        for field in track_fields:
+            result[field] = repaired[field]
+        result[None] = repaired.get(None, [])
+
+    return result
+
+
+def rescrape(rows, args, presenter_index):
+    """
+    Return dict of URL to castaway for the rows given, scraped concurrently
+    """
+    set_fetcher(Fetcher(RateLimiter(args.rate, max_rate=args.max_rate)))
+
+    cache = ExtractionCache(args.cache, extractor_version()) if args.cache else None
+    parser = DesertIslandDiscsParser(presenter_index=presenter_index, cache=cache)
+    crawler = Crawler(parser, args)
+
+    castaways = {}
+
+    def collect(castaway):
+        castaways[castaway.episode_url] = castaway
+
+    pipeline = Pipeline(crawler.episode_stages(collect))
+    pipeline.run(DesertIslandDiscsCastaway(row['Castaway'], row['Job'], row['URL'], None)
+                 for row in rows)
+
+    print(pipeline.report(), end='')
+    print(crawler.fetcher.stats)
+    if cache:
+        print(cache.stats)
+
+    return castaways
+
+
+def repair(filename, args):
+    """
+    Re-scrape incomplete and suspicious rows of filename and rewrite it. Return
+    (rows selected, rows improved).
+    """
+    presenter_index = PresenterIndex.from_dataset(args.dataset)
+    rows = list(CastawayReader().rows(filename))
+    # URL to suspicious fields of each row selected
+    suspicious = {row['URL']: suspicious_fields(row, presenter_index, args.fields)
+                  for row in rows}
+    incomplete = [row for row in rows
+                  if missing_fields(row, args.fields) or suspicious[row['URL']]]
+    print(f'{len(incomplete)} of {len(rows)} episodes have missing or suspicious data')
+    if args.dry_run or not incomplete:
+        for row in incomplete:
+            fields = missing_fields(row, args.fields) + \
+                [f'{field}?' for field in suspicious[row['URL']]]
+            print(f'{row["URL"]}\t{", ".join(fields)}')
+        return len(incomplete), 0
+
+    castaways = rescrape(incomplete, args, presenter_index)
+
+    improved = 0
+    for i, row in enumerate(rows):
+        if (castaway := castaways.get(row['URL'])) is not None:
+            replace = [field for field in suspicious[row['URL']]
+                       if field != 'Presenter' or castaway.episode.presenter_mined]
+            patched = patch_row(row, CastawayWriter().castaway_as_dict(castaway), replace)
+            if patched != row:
+                improved += 1
+            rows[i] = patched
+
+    output = args.output or filename
+    write_rows(rows, output + '.tmp')
+    os.replace(output + '.tmp', output)
+
+    return len(incomplete), improved
+
+
+def setup_command_line():
+    cmdline = argparse.ArgumentParser(prog='Desert Island Discs repair')
+    cmdline.add_argument('--csv', dest='input', default=DEFAULT_DATASET,
+                         help=f'CSV file created by scraper.py to repair (default is {DEFAULT_DATASET})')
+    cmdline.add_argument('--output',
+                         help='Write repaired CSV to this file instead of updating the input file')
+    cmdline.add_argument('--fields', nargs='+', choices=REPAIR_FIELDS, default=REPAIR_FIELDS,
+                         help='Repair episodes where these fields are missing or suspicious '
+                         '(default is all)')
+    cmdline.add_argument('--dry-run', action='store_true',
+                         help='List episodes that would be repaired without fetching them')
+    cmdline.add_argument('--cache',
+                         help='Extraction cache file (see scraper.py --cache)')
+    cmdline.add_argument('--dataset', default=DEFAULT_DATASET,
+                         help='CSV file used to look up presenters by broadcast date')
+    cmdline.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                         help=f'Initial requests per second (default is {DEFAULT_RATE})')
+    cmdline.add_argument('--max-rate', type=float, default=DEFAULT_MAX_RATE,
+                         help=f'Maximum requests per second (default is {DEFAULT_MAX_RATE})')
+    cmdline.add_argument('--fetch-workers', type=int, default=DEFAULT_FETCH_WORKERS,
+                         help=f'Threads fetching episode pages (default is {DEFAULT_FETCH_WORKERS})')
+    cmdline.add_argument('--parse-workers', type=int, default=DEFAULT_PARSE_WORKERS,
+                         help=f'Threads parsing episode pages (default is {DEFAULT_PARSE_WORKERS})')
+    cmdline.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                         help=f'Size of the queue between stages (default is {DEFAULT_QUEUE_SIZE})')
+    return cmdline
+
+
+def main():
+    args = setup_command_line().parse_args()
+    selected, improved = repair(args.input, args)
+    if not args.dry_run:
+        print(f'Re-scraped {selected} episodes; {improved} improved')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+=============================================================================
+File: run_tests.py
+Description: Run the unit tests in parallel.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+
+To run:
+
+    python run_tests.py [--processes N] [--record | --skip-missing] [test_episode ...]
+
+Each test is run in one of a pool of processes, so the suite takes about as long
+as its slowest test. The processes aren't daemons so tests can start processes of
+their own, eg to re-extract an archive. Tests use the page fixtures (see fixtures.py); --record
+fetches and saves the pages instead and --skip-missing skips tests whose pages
+haven't been recorded. Recording is done in a single process so that the fixture
+archive is written by one process only.
+=============================================================================
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from fixtures import FIXTURE_MODE_VARIABLE, RECORD, SKIP
+
+TEST_PATTERN = 'test_*.py'
+PASSED = 'ok'
+FAILED = 'FAIL'
+ERROR = 'ERROR'
+SKIPPED = 'skipped'
+
+
+def test_ids(suite):
+    """
+    Return ids of all tests in suite
+    """
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from test_ids(test)
+        else:
+            yield test.id()
+
+
+def run_test(test_id):
+    """
+    Run one test, returning (test id, outcome, details, seconds taken)
+    """
+    start = time.perf_counter()
+    suite = unittest.defaultTestLoader.loadTestsFromName(test_id)
+    result = unittest.TestResult()
+    # The tests print progress, which is only of interest if they fail
+    result.buffer = True
+    suite.run(result)
+
+    outcome, details = PASSED, ''
+    if result.failures:
+        outcome, details = FAILED, result.failures[0][1]
+    elif result.errors:
+        outcome, details = ERROR, result.errors[0][1]
+    elif result.skipped:
+        outcome, details = SKIPPED, result.skipped[0][1]
+
+    return test_id, outcome, details, time.perf_counter() - start
+
+
+def run_tests(ids, processes=None):
+    """
+    Return results of running tests in parallel, in the order the tests finish
+    """
+    # Unlike those of multiprocessing.Pool, the executor's processes aren't daemons
+    with ProcessPoolExecutor(processes) as executor:
+        return [future.result() for future in as_completed(executor.submit(run_test, test_id)
+                                                           for test_id in ids)]
+
+
+def setup_command_line():
+    cmdline = argparse.ArgumentParser(prog='Desert Island Discs test runner')
+    cmdline.add_argument('tests', nargs='*',
+                         help='Test modules, classes or methods to run eg test_episode.TestListing '
+                         '(default is all tests)')
+    cmdline.add_argument('--processes', type=int, default=os.cpu_count(),
+                         help='Number of tests to run at the same time (default is the number of CPU cores)')
+    fixtures = cmdline.add_mutually_exclusive_group()
+    fixtures.add_argument('--record', action='store_true',
+                          help='Fetch the pages used by the tests from the web and save them as fixtures')
+    fixtures.add_argument('--skip-missing', action='store_true',
+                          help='Skip tests whose pages are not in the fixtures instead of failing them')
+    cmdline.add_argument('--verbose', action='store_true',
+                         help='Show the outcome of each test')
+    return cmdline
+
+
+def main():
+    args = setup_command_line().parse_args()
+    if args.record:
+        os.environ[FIXTURE_MODE_VARIABLE] = RECORD
+        args.processes = 1
+    elif args.skip_missing:
+        os.environ[FIXTURE_MODE_VARIABLE] = SKIP
+
+    loader = unittest.defaultTestLoader
+    if args.tests:
+        suite = loader.loadTestsFromNames(args.tests)
+    else:
+        suite = loader.discover(os.path.dirname(os.path.abspath(__file__)), TEST_PATTERN)
+    ids = list(test_ids(suite))
+
+    start = time.perf_counter()
+    results = run_tests(ids, args.processes)
+    elapsed = time.perf_counter() - start
+
+    counts = {PASSED: 0, FAILED: 0, ERROR: 0, SKIPPED: 0}
+    for test_id, outcome, details, seconds in sorted(results):
+        counts[outcome] += 1
+        if args.verbose:
+            print(f'{test_id} ... {outcome} ({seconds:.2f}s)')
+        if outcome in (FAILED, ERROR):
+            print('=' * 70)
+            print(f'{outcome}: {test_id}')
+            print('-' * 70)
+            print(details)
+
+    print('-' * 70)
+    print(f'Ran {len(results)} tests in {elapsed:.2f}s using {args.processes} processes: '
+          + ', '.join(f'{outcome} {count}' for outcome, count in counts.items()))
+    sys.exit(0 if counts[FAILED] == counts[ERROR] == 0 else 1)
+
+
+if __name__ == '__main__':
+    main()
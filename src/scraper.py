@@ -11,19 +11,35 @@ be parts that are not "Pythonic". Please let me know what they are! Thanks
 """
 
 from bs4 import BeautifulSoup
-import requests
 import re
 import sys
 import traceback
 import collections
 from collections.abc import Sequence
 import argparse
-import csv
 import contextlib
-import io
 import time
 import html
-from datetime import datetime
+import json
+import bisect
+import os
+import threading
+import zlib
+import random
+import hashlib
+import inspect
+import itertools
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+from pipeline import Pipeline, Stage, DEFAULT_QUEUE_SIZE
+from archive import PageArchive
+from extraction_cache import ExtractionCache
+from writers import open_writer, output_format, FORMATS
+from dataset import (CastawayReader, CastawayWriter, EPISODE_FIELDS, MAX_TRACKS, TAB, TRACKS,
+                     missing_fields, programme_pid, smart_open, track_count)
+from metrics import METRICS, ProgressReporter, serve_metrics, DEFAULT_PROGRESS_INTERVAL
+from fetcher import GetPage, Fetcher, RateLimiter, set_fetcher, default_fetcher, FetchTimeout, DeadlineExceeded, \
+    DEFAULT_RATE, DEFAULT_MAX_RATE, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
 
 SOUP_PARSER = 'html.parser'
 #  SOUP_PARSER = 'lxml'
@@ -49,40 +65,80 @@ DEFAULT_BOOK_INDEX = 1
 
 TEXT_TRACK_INDICATOR = ['one', 'two', 'three',
                         'four', 'five', 'six', 'seven', 'eight']
-CLASS_EPISODE = 'Classic Desert Island Discs:'
-
-# Max tracks that can be chosen by castaway
-MAX_TRACKS = 8
+# Title prefix of repeats, eg 'Classic Desert Island Discs: X' or '... - X'
+CLASS_EPISODE = r'Classic Desert Island Discs\s*[:\-\u2013]\s*'
+
+# Page layout families, see PageLayout
+LAYOUT_TRACKLIST = 'tracklist'
+LAYOUT_SEGMENTS = 'segments'
+LAYOUT_CLASSIC = 'classic'
+
+# CSS classes that identify the layout of an episode page
+FINGERPRINT_CLASSES = ['segments-list', 'segment__track', 'segment__content']
+
+# A streamed episode page (see --stream) is read until the first of these end markers
+# after the title. In every layout, they come after the description, segments and
+# broadcasts, so only the related links, promotions and footer are skipped.
+EPISODE_TITLE_MARKER = b'<h1'
+EPISODE_END_MARKERS = [b'id="collections"', b'class="superpromo', b'id="podcast"',
+                       b'id="programmes-footer"']
+
+# With --structured, an episode's programme JSON document and segments fragment are
+# fetched instead of its page (see structured_page). They're a tenth of the size.
+PROGRAMME_JSON_URL = '%s.json'
+SEGMENTS_URL = '%s/segments.inc'
+# Start of an episode page made from them, to tell it from a full page
+STRUCTURED_PAGE_MARKER = b'<!-- structured -->'
+
+# For presenter A B (A=first name, B=second name), we are looking for a string like "Presenter: A B", 'A B's castaway is",
+# "interviewed by A B", "A B talks to", "talks to A B", etc.
+# To minimise chance of non-names, we look for two words that start with uppercase for the presenter.
+# Each pattern has two groups: first name and second name.
+PRESENTER_PATTERNS = [r'Presenter:?\s+([A-Z]\w+) ([A-Z]\w+)',
+                      r'([A-Z]\w+) ([A-Z]\w+)[\'’]s castaway',
+                      r'([A-Z]\w+) ([A-Z]\w+) casts away',
+                      r'[Ii]nterviewed by ([A-Z]\w+) ([A-Z]\w+)', r'([A-Z]\w+) ([A-Z]\w+) interviews',
+                      r'speaking to ([A-Z]\w+) ([A-Z]\w+)',
+                      r'([A-Z]\w+) ([A-Z]\w+) talks to ', r'talks to ([A-Z]\w+) ([A-Z]\w+)',
+                      r'castaway choices with ([A-Z]\w+) ([A-Z]\w+)',
+                      r'([A-Z]\w+) ([A-Z]\w+) chats to', r'(chats to [A-Z]\w+) ([A-Z]\w+)',
+                      r'[A-Z]\w+ [A-Z]\w+ joins ([A-Z]\w+) ([A-Z]\w+)']
 
 # There are about 200 pages of episode listings. Each page has about 10 episodes.
 # Choose a subset to process. Once happy program is working, all pages could be
-# processed but it's courteous to have a pause between getting each page.
+# processed. All requests are rate limited (see fetcher.py) so there is no need to
+# pause between pages but a pause can be added.
 # Defaults:
 DEFAULT_LISTING_START_PAGE = 1
 DEFAULT_LISTING_END_PAGE = 1
-DEFAULT_SLEEP = 3
+DEFAULT_SLEEP = 0
 
-TAB = '\t'
+# Number of threads for each stage of a crawl (see Crawler)
+DEFAULT_LISTING_WORKERS = 1
+DEFAULT_FETCH_WORKERS = 4
+DEFAULT_PARSE_WORKERS = 1
 
+# The scraped dataset, used to build the presenter era index (see PresenterIndex)
+DEFAULT_DATASET = '../output/desert-island-discs-episodes.csv'
+# A canary fails if the rate any field is extracted falls by more than this
+DEFAULT_CANARY_TOLERANCE = 0.1
+CANARY_FIELDS = EPISODE_FIELDS + ['Date first broadcast']
 
-@contextlib.contextmanager
-def smart_open(filename=None, filemode='w'):
-    """
-    Return handle to file (if specified) or sys output
-    From https://stackoverflow.com/questions/17602878/how-to-handle-both-with-open-and-sys-stdout-nicely/17603000
-    """
+# A run of episodes with the same presenter must be at least this long to count as an
+# era. Shorter runs are guest presenters or mis-extracted presenters.
+MIN_PRESENTER_ERA_EPISODES = 5
 
-    if filename and filename != '-':
-        #  fh = open(filename, 'w')
-        fh = io.open(filename, newline='', mode=filemode, encoding="utf-8")
-    else:
-        fh = sys.stdout
+# Presenters change at the ends of eras so the presenter of episodes broadcast within
+# this many days of either end is mined from the description rather than looked up.
+PRESENTER_ERA_MARGIN_DAYS = 28
 
-    try:
-        yield fh
-    finally:
-        if fh is not sys.stdout:
-            fh.close()
+
+
+def is_classic_episode(title):
+    """
+    Return True if the episode title is that of a repeat of an old episode
+    """
+    return re.match(CLASS_EPISODE, title.strip(), re.IGNORECASE) is not None
 
 
 def isBlank(myString):
@@ -101,21 +157,6 @@ def contains(s, search_for_list, case_sensitive=re.IGNORECASE):
     return -1
 
 
-def GetPage(url):
-    """
-    Fetch page from web
-    """
-    def page_found(code):
-        return code == 200
-
-    page = requests.get(url)
-
-    if not page_found(page.status_code):
-        print(f'Status {page.status_code} for {url}')
-
-    return page.content
-
-
 def clean_string(s):
     """
     Remove unnecessary characters from beginning and end of s
@@ -137,7 +178,61 @@ def clean_string(s):
     return result
 
 
+def parse_shard(s):
+    """
+    Return (shard, shards) from "I/N", where shards are numbered 1 to N
+    """
+    try:
+        shard, shards = [int(n) for n in s.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Shard must be like 2/4, not {s}')
+    if not 1 <= shard <= shards:
+        raise argparse.ArgumentTypeError(
+            f'Shard must be between 1 and {shards}')
+    return shard, shards
+
+
+def in_shard(pid, shard, shards):
+    """
+    Return True if episode with programme id pid belongs to shard (1 to shards). A
+    stable hash is used so that every node agrees.
+    """
+    return zlib.crc32(pid.encode('utf-8')) % shards == shard - 1
+
+
+def shard_pages(pages, shard, shards):
+    """
+    Return the contiguous range of pages belonging to shard (1 to shards)
+    """
+    pages = list(pages)
+    size, extra = divmod(len(pages), shards)
+    start = (shard - 1) * size + min(shard - 1, extra)
+    end = start + size + (1 if shard <= extra else 0)
+    return pages[start:end]
+
+
+def extractor_version():
+    """
+    Return hash of the code and constants that determine what is extracted from an
+    episode page. Used to invalidate cached extractions when any of them change.
+    """
+    code = [clean_string, contains, LongDescription, LongDescriptionParser, PageLayout,
+            DesertIslandDiscsParser, DesertIslandDiscsEpisode, Track, TrackList]
+    constants = [SOUP_PARSER, DISC_PREFIX, FAVOURITE_INDICATORS, DEFAULT_FAVOURITE_INDEX,
+                 LUXURY_INDICATOR, DEFAULT_LUXURY_INDEX, BOOK_INDICATOR, DEFAULT_BOOK_INDEX,
+                 TEXT_TRACK_INDICATOR, CLASS_EPISODE, FINGERPRINT_CLASSES, PRESENTER_PATTERNS,
+                 MAX_TRACKS]
+
+    h = hashlib.sha256()
+    for c in code:
+        h.update(inspect.getsource(c).encode('utf-8'))
+    h.update(repr(constants).encode('utf-8'))
+
+    return h.hexdigest()[:16]
+
+
 def print_error(msg, error):
+    METRICS.inc('did_errors_total', type=type(error).__name__)
     print(f'{msg}: {str(error)}')
     traceback.print_exc(file=sys.stdout)
 
@@ -171,6 +266,12 @@ class DesertIslandDiscsEpisode:
         self.presenter = presenter
         # this is a tuple: (date, time)
         self.broadcast_datetime = broadcast_datetime
+        # Layout family of the page the episode was extracted from (see PageLayout) and
+        # whether the extractor specialized for it found every field
+        self.layout = None
+        self.layout_hit = None
+        # Whether the presenter was mined from the description rather than looked up
+        self.presenter_mined = False
 
     def __str__(self):
         s = f'Title: {self.title}'
@@ -191,6 +292,27 @@ class DesertIslandDiscsEpisode:
 
         return s
 
+    def as_dict(self):
+        """
+        Return episode as dict of basic types eg for JSON
+        """
+        return {'title': self.title,
+                'tracks': [[t.artist, t.song] for t in self.tracks],
+                'book': self.book,
+                'luxury': self.luxury,
+                'favourite_track': self.favourite_track,
+                'presenter': self.presenter,
+                'broadcast_datetime': list(self.broadcast_datetime)}
+
+    @classmethod
+    def from_dict(cls, d):
+        tracks = TrackList()
+        for artist, song in d['tracks']:
+            tracks.add(Track(artist, song))
+
+        return cls(d['title'], tracks, d['book'], d['luxury'], d['favourite_track'],
+                   d['presenter'], tuple(d['broadcast_datetime']))
+
 
 class Track:
     """
@@ -255,15 +377,401 @@ class TrackList(Sequence):
         return result
 
 
+class LongDescription:
+    """
+    Data found in a DISC-style long description, eg
+        DISC ONE: Elvis Presley - I Just Can't Help Believin' DISC TWO: ...
+        BOOK CHOICE: ... LUXURY ITEM: ... CASTAWAY'S FAVOURITE: ...
+    """
+
+    def __init__(self):
+        self.tracks = TrackList()
+        self.book = ''
+        self.luxury = ''
+        self.favourite_track = ''
+        self.presenter = ''
+
+
+class LongDescriptionParser:
+    """
+    Parse a DISC-style long description in a single pass. One regex recognises all the
+    markers (DISC, book/luxury/favourite labels and presenter mentions); the text between
+    markers belongs to the last marker seen.
+    """
+
+    LABELS = [('book', BOOK_INDICATOR), ('luxury', LUXURY_INDICATOR),
+              ('favourite_track', FAVOURITE_INDICATORS)]
+
+    def __init__(self):
+        # Line breaks are lost in the text so an upper case marker may follow the previous
+        # word directly. Other cases must be followed by a track number eg "Disc one:".
+        numbers = '|'.join(TEXT_TRACK_INDICATOR)
+        alternatives = [f'(?P<disc>{re.escape(DISC_PREFIX)}|'
+                        rf'(?<!\w)(?i:{re.escape(DISC_PREFIX)})(?=(?i:{numbers})\b))']
+        for field, indicators in self.LABELS:
+            # The indicators are in order of preference, which puts the longer ones first.
+            # Allow for a word before the colon eg "FAVOURITE TRACK:". Labels in other than
+            # upper case must start the paragraph so that titles like "Jungle Book: ..."
+            # aren't taken as labels.
+            labels = '|'.join(re.escape(i).replace("'", "['’]") for i in indicators)
+            alternatives.append(rf'(?P<{field}>(?:^\s*(?i:{labels})|{labels.upper()})'
+                                rf'(?:\s+\w+)?\s*:)')
+        for i, pattern in enumerate(PRESENTER_PATTERNS):
+            alternatives.append(f'(?P<presenter{i}>{pattern})')
+
+        self.regex = re.compile('|'.join(alternatives))
+
+    def split_track(self, s):
+        """
+        Return (artist, song) from text after a DISC marker like "ONE: artist - song" or
+        "ONE: song by artist". Return None if there is no colon before the separator.
+        """
+        if (sep := s.rfind(' - ')) > -1:
+            if (colon := s.rfind(':', 0, sep)) > -1:
+                return s[colon + 1:sep], s[sep + 3:]
+        elif (sep := s.rfind(' by ')) > -1:
+            if (colon := s.rfind(':', 0, sep)) > -1:
+                return s[sep + 4:], s[colon + 1:sep]
+
+        return None
+
+    def add_track(self, result, s):
+        if (artist_and_song := self.split_track(s)) is None:
+            # Strip away initial number if it exist and try again
+            for search_for in TEXT_TRACK_INDICATOR:
+                if s[:len(search_for)].lower() == search_for:
+                    s = s[len(search_for):]
+                    if (artist_and_song := self.split_track(s)) is None:
+                        # There's something odd: just use whatever we've found
+                        # for both artist and song
+                        artist_and_song = (s, s)
+                    break
+
+        if artist_and_song:
+            artist, song = artist_and_song
+            result.tracks.add(Track(clean_string(artist), clean_string(song)))
+
+    def add_segment(self, result, field, s):
+        if field == 'disc':
+            self.add_track(result, s)
+        elif field and not getattr(result, field):
+            setattr(result, field, clean_string(s))
+
+    def parse(self, s, castaway=''):
+        result = LongDescription()
+        field = None
+        start = 0
+
+        for m in self.regex.finditer(s):
+            kind = m.lastgroup
+            if kind.startswith('presenter'):
+                # Presenter mentions can occur anywhere and don't end a segment
+                if not result.presenter:
+                    group = self.regex.groupindex[kind]
+                    name = f'{m.group(group + 1)} {m.group(group + 2)}'
+                    if name not in castaway:
+                        result.presenter = name
+                continue
+
+            self.add_segment(result, field, s[start:m.start()])
+            field = kind
+            start = m.end()
+
+        self.add_segment(result, field, s[start:])
+
+        return result
+
+
+class PageLayout:
+    """
+    Cheap fingerprint of an episode page, used to decide which extraction methods are
+    worth running. The page formats fall into a few families:
+
+        tracklist: structured track list (segment__track) in the segments list
+        segments:  segments list but no structured tracks, eg book/luxury only
+        classic:   no segments at all; everything is in the long description
+    """
+
+    def __init__(self, soup):
+        classes = set()
+        for e in soup.find_all(class_=FINGERPRINT_CLASSES):
+            classes.update(c for c in e['class'] if c in FINGERPRINT_CLASSES)
+
+        self.has_segments_list = 'segments-list' in classes or 'segment__content' in classes
+        self.has_segment_track = 'segment__track' in classes
+
+    @property
+    def family(self):
+        if self.has_segment_track:
+            return LAYOUT_TRACKLIST
+        if self.has_segments_list:
+            return LAYOUT_SEGMENTS
+        return LAYOUT_CLASSIC
+
+    def __str__(self):
+        return self.family
+
+
+class EpisodeEndScanner:
+    """
+    Scans an episode page a chunk at a time as it's downloaded. Called with each
+    chunk, returns True once the page has everything that is extracted from it.
+    """
+
+    def __init__(self):
+        self.title_seen = False
+        # End of previous chunk, in case a marker straddles two chunks
+        self.tail = b''
+        self.overlap = max(len(m) for m in EPISODE_END_MARKERS + [EPISODE_TITLE_MARKER]) - 1
+
+    def __call__(self, chunk):
+        data = self.tail + chunk
+        if not self.title_seen:
+            if (start := data.find(EPISODE_TITLE_MARKER)) < 0:
+                self.tail = data[-self.overlap:]
+                return False
+            self.title_seen = True
+            data = data[start:]
+
+        if any(marker in data for marker in EPISODE_END_MARKERS):
+            return True
+        self.tail = data[-self.overlap:]
+        return False
+
+
+def structured_page(programme, segments):
+    """
+    Return an episode page made from the programme's JSON document (parsed) and its
+    segments fragment (bytes). It has only the parts of a full page that are
+    extracted: title, synopses, first broadcast and segments, so it's parsed in the
+    same way.
+    """
+    p = programme['programme']
+    paragraphs = [p.get('short_synopsis') or ''] + re.split(r'\n\s*\n', p.get('long_synopsis') or '')
+    # Lines of the description are separated by <br/> on the page
+    description = ''.join('<p>' + '<br/>'.join(html.escape(line.strip()) for line in paragraph.strip().split('\n')) +
+                          '</p>' for paragraph in paragraphs if paragraph.strip())
+
+    broadcast = ''
+    if first := p.get('first_broadcast_date'):
+        if 'T' in first:
+            broadcast = f'<div class="broadcast-event__time beta" content="{html.escape(first)}"></div>'
+        else:
+            # As on the pages of classic episodes, which have no time
+            broadcast = f'<time datetime="{html.escape(first)}"></time>'
+
+    return STRUCTURED_PAGE_MARKER + (f'<html><body><h1>{html.escape(p.get("title") or "")}</h1>'
+                                     f'{description}{broadcast}').encode('utf-8') + segments + b'</body></html>'
+
+
+def episode_missing(episode):
+    """
+    Return names of the attributes of episode that are blank; tracks is included if it
+    has fewer than MAX_TRACKS tracks
+    """
+    result = [a for a in ['book', 'luxury', 'favourite_track', 'presenter'] if not getattr(episode, a)]
+    if len(episode.tracks) < MAX_TRACKS:
+        result.append('tracks')
+    if not episode.broadcast_datetime or not episode.broadcast_datetime[0]:
+        result.append('broadcast_datetime')
+    return result
+
+
+class LayoutStats:
+    """
+    Count how often the specialized extractor for each layout family found every field
+    (hit) or needed the generic fallback (miss). It's safe to share between threads.
+    """
+
+    def __init__(self):
+        self.hits = collections.Counter()
+        self.misses = collections.Counter()
+        self._lock = threading.Lock()
+
+    def record(self, family, hit):
+        with self._lock:
+            if hit:
+                self.hits[family] += 1
+            else:
+                self.misses[family] += 1
+
+    def __str__(self):
+        result = ''
+        for family in sorted(set(self.hits) | set(self.misses)):
+            total = self.hits[family] + self.misses[family]
+            result += f'{family}: {self.hits[family]}/{total} hits ' + \
+                f'({100 * self.hits[family] / total:.0f}%)\n'
+
+        return result
+
+
+class PresenterIndex:
+    """
+    Presenter eras: a sorted table of (first date, last date, presenter) built from the
+    broadcast dates and presenters of episodes already scraped. The presenter of an
+    episode is looked up by broadcast date first and only mined from the description if
+    the era doesn't settle it (see settled); a mined presenter is never overridden since
+    guest presenters don't follow the eras. Mined presenters outside the known eras (eg
+    a new presenter) are added to the index, which is rebuilt as needed.
+    """
+
+    def __init__(self, min_era_episodes=MIN_PRESENTER_ERA_EPISODES,
+                 era_margin_days=PRESENTER_ERA_MARGIN_DAYS):
+        self.min_era_episodes = min_era_episodes
+        self.era_margin = timedelta(days=era_margin_days)
+        self.observations = []
+        self.hits = 0
+        self.misses = 0
+        self.confirmations = 0
+        self.conflicts = 0
+        self._eras = None
+        self._starts = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dataset(cls, filename, min_era_episodes=MIN_PRESENTER_ERA_EPISODES):
+        """
+        Build index from CSV output of previous runs. Classic episodes are skipped
+        because their date is the repeat date.
+        """
+        index = cls(min_era_episodes)
+        if filename and os.path.exists(filename):
+            for row in CastawayReader().rows(filename):
+                if not is_classic_episode(row['Episode title']):
+                    index.add(row['Date first broadcast'], row['Presenter'])
+
+        return index
+
+    def add(self, date, presenter):
+        if date and presenter:
+            with self._lock:
+                self.observations.append((date, presenter))
+                self._eras = None
+
+    def _build(self):
+        runs = []
+        for date, presenter in sorted(self.observations):
+            if runs and runs[-1][2] == presenter:
+                runs[-1][1] = date
+                runs[-1][3] += 1
+            else:
+                runs.append([date, date, presenter, 1])
+
+        eras = []
+        for run in runs:
+            if run[3] < self.min_era_episodes:
+                continue
+            if eras and eras[-1][2] == run[2]:
+                eras[-1][1] = run[1]
+            else:
+                eras.append(run[:3])
+
+        self._eras = eras
+        self._starts = [era[0] for era in eras]
+        # Dates of episodes, eg with guest presenters, that don't follow their era
+        self._exceptions = set(date for date, presenter in self.observations
+                               if (era := self._era(date)) and era[2] != presenter)
+
+    def _era(self, date):
+        """
+        Return era (first date, last date, presenter) that date is in or None. The
+        caller holds the lock and the eras are built.
+        """
+        if date:
+            i = bisect.bisect_right(self._starts, date) - 1
+            if i >= 0 and self._eras[i][0] <= date <= self._eras[i][1]:
+                return self._eras[i]
+        return None
+
+    @property
+    def eras(self):
+        with self._lock:
+            if self._eras is None:
+                self._build()
+            return self._eras
+
+    def lookup(self, date):
+        """
+        Return presenter for broadcast date (YYYY-MM-DD) or '' if the date is not in
+        a known era.
+        """
+        with self._lock:
+            if self._eras is None:
+                self._build()
+            era = self._era(date)
+            if era:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        return era[2] if era else ''
+
+    def settled(self, date):
+        """
+        Return whether the presenter of an episode broadcast on date can be taken from
+        its era without mining the description: the date is more than the margin from
+        either end of the era and no episode broadcast that day had another presenter.
+        """
+        with self._lock:
+            if self._eras is None:
+                self._build()
+            if not (era := self._era(date)) or date in self._exceptions:
+                return False
+            try:
+                day = datetime.fromisoformat(date)
+                return datetime.fromisoformat(era[0]) + self.era_margin <= day <= \
+                    datetime.fromisoformat(era[1]) - self.era_margin
+            except ValueError:
+                return False
+
+    def record(self, date, mined_presenter):
+        """
+        Record the presenter mined from the description of an episode: it's added to
+        the index if date isn't in a known era, otherwise it confirms the era (or not)
+        """
+        if not mined_presenter:
+            return
+
+        with self._lock:
+            if self._eras is None:
+                self._build()
+            if era := self._era(date):
+                self.confirmations += 1
+                if mined_presenter != era[2]:
+                    self.conflicts += 1
+
+        if not era:
+            self.add(date, mined_presenter)
+
+    def __str__(self):
+        result = ''
+        for start, end, presenter in self.eras:
+            result += f'{start} to {end}: {presenter}\n'
+        result += f'Index hits: {self.hits}, misses: {self.misses}, ' + \
+            f'confirmed: {self.confirmations}, conflicts: {self.conflicts}\n'
+
+        return result
+
+
 class DesertIslandDiscsParser:
     """
     This is the main class to extract data from the BBC Desert Island Discs website. Like all web scrapers,
     this class will break if the web site is amended in some ways eg change of CSS classes.
     """
 
-    def __init__(self, soup=None):
+    def __init__(self, soup=None, presenter_index=None, cache=None, structured=False):
         self.soup = soup
         self.all_castaways = {}
+        self.layout_stats = LayoutStats()
+        self.presenter_index = presenter_index
+        self.description_parser = LongDescriptionParser()
+        # Episodes that timed out, which can be retried later
+        self.failed_urls = []
+        # ExtractionCache of episodes already parsed
+        self.cache = cache
+        # Fetch episodes' structured representations instead of their pages (see
+        # fetch_structured)
+        self.structured = structured
 
     def parse(self, soup=None):
         self.parse_episode_listing(soup)
@@ -278,8 +786,7 @@ class DesertIslandDiscsParser:
 
         if len(nameAndJob) > 0:
             name = nameAndJob[0].strip()
-            if re.search(fr'^{CLASS_EPISODE}', name, re.IGNORECASE):
-                name = name[len(CLASS_EPISODE):]
+            name = re.sub(fr'^{CLASS_EPISODE}', '', name, flags=re.IGNORECASE)
 
         if len(nameAndJob) > 1:
             job = nameAndJob[1]
@@ -320,52 +827,13 @@ class DesertIslandDiscsParser:
 
         return tracks
 
-    def extract_artist_and_song_from_text(self, s):
-        # We're using group names for captured groups
-        if re.search(' - ', s, re.IGNORECASE):
-            return re.search(r'.*:(?P<artist>.*) - (?P<song>.*)', s)
-        elif re.search(' by ', s, re.IGNORECASE):
-            return re.search(r'.*:(?P<song>.*) by (?P<artist>.*)', s)
-
-        return False
-
     def extract_tracks_from_long_description(self, s):
         """
         This is an alternative method of extracting track details. The primary method
         is to extract the tracks from the track list in the episode. If that fails,
         we look for DISC in the long description to see if it's there.
         """
-
-        def add_match():
-            song = clean_string(match.group('song'))
-            artist = clean_string(match.group('artist'))
-            tracks.add(Track(artist, song))
-
-        tracks = TrackList()
-
-        for e in s.split(DISC_PREFIX):
-            match = self.extract_artist_and_song_from_text(e)
-
-            if match:
-                add_match()
-            else:
-                # Strip away initial number if it exist and try again
-                for search_for in TEXT_TRACK_INDICATOR:
-                    if re.search(rf'^{search_for}', e, re.IGNORECASE):
-                        song_and_artist = e[len(search_for):]
-                        match = self.extract_artist_and_song_from_text(
-                            song_and_artist)
-                        if match:
-                            add_match()
-                        else:
-                            # There's something odd: just use whatever we've found
-                            # for both artist and song
-                            song = clean_string(song_and_artist)
-                            artist = song
-                            tracks.add(Track(artist, song))
-                        break
-
-        return tracks
+        return self.description_parser.parse(s).tracks
 
     def extract_item_method_1(self, s, search_for):
         result = ''
@@ -437,20 +905,9 @@ class DesertIslandDiscsParser:
                 return f'{m[0][0]} {m[0][1]}'
             return None
 
-        # For presenter A B (A=first name, B=second name), we are looking for a string like "Presenter: A B", 'A B's castaway is",
-        # "interviewed by A B", "A B talks to", "talks to A B", etc.
-        # To minimise chance of non-names, we look for two words that start with uppercase for the presenter.
         # We compare with castaway because for something like "John Doe chats with Jane Doe", either may be the
         # presenter or castaway
-        for r in [r'Presenter:?\s+([A-Z]\w+) ([A-Z]\w+)',
-                  r'([A-Z]\w+) ([A-Z]\w+)[\'’]s castaway',
-                  r'([A-Z]\w+) ([A-Z]\w+) casts away',
-                  r'[Ii]nterviewed by ([A-Z]\w+) ([A-Z]\w+)', r'([A-Z]\w+) ([A-Z]\w+) interviews',
-                  r'speaking to ([A-Z]\w+) ([A-Z]\w+)',
-                  r'([A-Z]\w+) ([A-Z]\w+) talks to ', r'talks to ([A-Z]\w+) ([A-Z]\w+)',
-                  r'castaway choices with ([A-Z]\w+) ([A-Z]\w+)',
-                  r'([A-Z]\w+) ([A-Z]\w+) chats to', r'(chats to [A-Z]\w+) ([A-Z]\w+)',
-                  r'[A-Z]\w+ [A-Z]\w+ joins ([A-Z]\w+) ([A-Z]\w+)']:
+        for r in PRESENTER_PATTERNS:
             # print(s, r, castaway)
             if name := find(s, r):
                 if name not in castaway:
@@ -532,110 +989,255 @@ class DesertIslandDiscsParser:
         else:
             return ''
 
-    def extract_other_data(self, name, soup, tracks):
+    def _extract_from_paragraphs(self, name, soup, found):
         """
-        This method is very dependent on the structure of the HTML. Since the data isn't structured,
-        we sometimes use the whole html string and sometimes we let Soup parse it. This has been
-        empirically determined based on the (inconsistent) representation of track, book, favourite track,
-        and luxury data.
+        Method 1: scan every paragraph of the long description. This is the only
+        source of data for classic episodes, which have no segments.
         """
-
-        book = ''
-        luxury = ''
-        favourite_track = ''
-        presenter = ''
-        broadcast_datetime = ''
-        new_tracks = tracks
-
         try:
             paragraph_elements = soup.find_all('p')
             for p in paragraph_elements:
                 ptext = p.text
                 pstr = p.__str__()
 
-                if tracks.is_empty and re.search(DISC_PREFIX, ptext, re.IGNORECASE):
-                    new_tracks = self.extract_tracks_from_long_description(
-                        ptext)
-
-                if not luxury:
-                    luxury = self.search_and_extract(pstr, LUXURY_INDICATOR)
-
-                if not favourite_track:
-                    favourite_track = self.search_and_extract(
+                if re.search(DISC_PREFIX, ptext, re.IGNORECASE):
+                    # DISC-style description: one pass gets everything
+                    description = self.description_parser.parse(ptext, name)
+                    if found['tracks'].is_empty:
+                        found['tracks'] = description.tracks
+                    for field in ['book', 'luxury', 'favourite_track', 'presenter']:
+                        if not found[field]:
+                            found[field] = getattr(description, field)
+
+                if not found['luxury']:
+                    found['luxury'] = self.search_and_extract(
+                        pstr, LUXURY_INDICATOR)
+
+                if not found['favourite_track']:
+                    found['favourite_track'] = self.search_and_extract(
                         pstr, FAVOURITE_INDICATORS)
-                if not book:
-                    book = self.search_and_extract(pstr, BOOK_INDICATOR)
+                if not found['book']:
+                    found['book'] = self.search_and_extract(
+                        pstr, BOOK_INDICATOR)
+
+                if not found['presenter']:
+                    found['presenter'] = self.extract_presenter(pstr, name)
 
-                if not presenter:
-                    presenter = self.extract_presenter(pstr, name)
+                if all([found['tracks'], found['book'], found['luxury'],
+                        found['favourite_track'], found['presenter']]):
+                    break
 
         except Exception as e:
             print_error(
                 'Method 1 failed to extract tracks/book/luxury/favourite', e)
 
-        # If we were unsuccessful getting some items, try alternative methods
+    def _extract_from_segments(self, name, soup, found):
+        """
+        Method 2: look below the track listing, including the favourite track heading.
+        """
         try:
-            if not book:
-                book = self.extract_item_method_2(
+            if not found['book']:
+                found['book'] = self.extract_item_method_2(
                     soup, BOOK_INDICATOR[DEFAULT_BOOK_INDEX])
-            if not luxury:
-                luxury = self.extract_item_method_2(
+            if not found['luxury']:
+                found['luxury'] = self.extract_item_method_2(
                     soup, LUXURY_INDICATOR[DEFAULT_LUXURY_INDEX])
-            if not favourite_track:
-                favourite_track = self.extract_favourite(soup)
-            if not broadcast_datetime:
-                broadcast_datetime = self.extract_broadcast_datetime(soup)
+            if not found['favourite_track']:
+                found['favourite_track'] = self.extract_favourite(soup)
         except Exception as e:
             print_error(
-                'Method 2 failed to extract book/luxury/favourite/broadcast datetime', e)
+                'Method 2 failed to extract book/luxury/favourite', e)
 
-        # Try another method
+    def _extract_from_segments_alt(self, name, soup, found):
+        """
+        Method 3: alternative layout below the track listing.
+        """
         try:
-            if not book:
-                book = self.extract_item_method_3(
+            if not found['book']:
+                found['book'] = self.extract_item_method_3(
                     soup, BOOK_INDICATOR[DEFAULT_BOOK_INDEX])
-            if not luxury:
-                luxury = self.extract_item_method_3(
+            if not found['luxury']:
+                found['luxury'] = self.extract_item_method_3(
                     soup, LUXURY_INDICATOR[DEFAULT_LUXURY_INDEX])
 
         except Exception as e:
             print_error('Method 3 failed to extract book/luxury', e)
 
-        return new_tracks, book, favourite_track, luxury, presenter, broadcast_datetime
+    # The strategies in the order the generic (fallback) extractor runs them; each only
+    # looks for fields not yet found
+    EXTRACTORS = ['_extract_from_paragraphs', '_extract_from_segments',
+                  '_extract_from_segments_alt']
+
+    # The specialized extractor for each layout family: only the strategies that can
+    # match pages of that layout, in the generic order. As each strategy only fills in
+    # fields not yet found, the result is the same as running them all: classic pages
+    # have no segments to search and the alternative segments layout (method 3) is only
+    # searched on pages with a structured track list for fields the others missed.
+    LAYOUT_EXTRACTORS = {
+        LAYOUT_CLASSIC: ['_extract_from_paragraphs'],
+        LAYOUT_SEGMENTS: EXTRACTORS,
+        LAYOUT_TRACKLIST: ['_extract_from_paragraphs', '_extract_from_segments'],
+    }
+
+    def extract_other_data(self, name, soup, tracks, layout, presenter=''):
+        """
+        This method is very dependent on the structure of the HTML. Since the data isn't structured,
+        we sometimes use the whole html string and sometimes we let Soup parse it. This has been
+        empirically determined based on the (inconsistent) representation of track, book, favourite track,
+        and luxury data.
+
+        The page is dispatched on its layout family to the extractor specialized for it.
+        The remaining generic methods are only run if that misses a field, which is
+        returned last as hit (False). The presenter isn't mined from the description if
+        it's given.
+        """
+
+        found = {'tracks': tracks, 'book': '', 'luxury': '', 'favourite_track': '',
+                 'presenter': presenter, 'broadcast_datetime': ''}
+
+        found['broadcast_datetime'] = self.extract_broadcast_datetime(soup)
+
+        specialized = self.LAYOUT_EXTRACTORS[layout]
+        for extractor in specialized:
+            getattr(self, extractor)(name, soup, found)
+
+        hit = all([found['tracks'], found['book'], found['luxury'], found['favourite_track'],
+                   found['presenter'], found['broadcast_datetime'][0]])
+        if not hit:
+            for extractor in self.EXTRACTORS:
+                if extractor not in specialized:
+                    getattr(self, extractor)(name, soup, found)
+
+        return found['tracks'], found['book'], found['favourite_track'], found['luxury'], \
+            found['presenter'], found['broadcast_datetime'], hit
 
     def parse_episode(self, soup, castaway=''):
         """
         Parse the page that contains the episode's details for the castaway, extracting
         the songs picked, favourite track, luxury and book
         """
-        episode_title = soup.find('h1').text
+        episode = self.extract_page(None, castaway, soup)
+        self.finish_episode(episode)
+
+        return episode
+
+    def episode_title(self, soup):
+        """
+        Return title of the episode page; raise ValueError if it has none, ie it isn't
+        an episode page
+        """
+        if (h1 := soup.find('h1')) is None:
+            raise ValueError('Not an episode page: no title')
+        return h1.text
+
+    def extract_episode(self, soup, castaway='', presenter=''):
+        """
+        Return the episode extracted from the page alone with its layout family (see
+        PageLayout). If presenter is given, it's the episode's presenter and isn't mined
+        from the description.
+        """
+        episode_title = self.episode_title(soup)
 
         tracks = self.extract_tracks_from_list(soup)
 
         if isBlank(castaway):
             castaway = episode_title
 
+        layout = PageLayout(soup).family
+
         # Get other data, including track data (if we were unsuccessful using the
         # first method above).
-        tracks, book, favourite_track, luxury, presenter, broadcast_datetime = self.extract_other_data(
-            castaway, soup, tracks)
+        tracks, book, favourite_track, luxury, mined_presenter, broadcast_datetime, hit = \
+            self.extract_other_data(castaway, soup, tracks, layout, presenter)
 
-        return DesertIslandDiscsEpisode(episode_title, tracks, book, luxury, favourite_track, presenter, broadcast_datetime)
+        episode = DesertIslandDiscsEpisode(episode_title, tracks, book, luxury, favourite_track,
+                                           mined_presenter, broadcast_datetime)
+        episode.layout, episode.layout_hit, episode.presenter_mined = layout, hit, not presenter
+        return episode
 
-    def parse_castaway_in_listing(self, castaway):
+    def indexed_presenter(self, title, date):
         """
-        Parse a castaway on the episode listing page. Then load the episode page itself
-        for the castaway and extract details
+        Return the presenter of the episode broadcast on date from the presenter index,
+        if there is one, and whether that settles it (see PresenterIndex.settled). The
+        broadcast date of a repeat says nothing about who presented the episode so
+        those aren't looked up.
+        """
+        if self.presenter_index is None or is_classic_episode(title):
+            return '', False
+        presenter = self.presenter_index.lookup(date)
+        return presenter, bool(presenter) and self.presenter_index.settled(date)
+
+    def extract_page(self, page, castaway='', soup=None):
+        """
+        Return the episode on page (bytes as fetched) or soup, using the extraction cache
+        for pages if there is one. The presenter is looked up by broadcast date in the
+        presenter index and only mined from the description if the index doesn't settle
+        it or has no presenter for the date. A cached episode whose presenter wasn't mined
+        is extracted again if it now needs to be.
+        """
+        data = None
+        if soup is None:
+            if self.cache is not None:
+                data = self.cache.get(page, castaway)
+            if data is None:
+                soup = BeautifulSoup(page, SOUP_PARSER)
+
+        if data is not None:
+            title, date = data['title'], data['broadcast_datetime'][0]
+        else:
+            title, date = self.episode_title(soup), self.extract_broadcast_datetime(soup)[0]
+        presenter, settled = self.indexed_presenter(title, date)
+
+        if data is not None and (data['presenter_mined'] or settled):
+            episode = DesertIslandDiscsEpisode.from_dict(data)
+            episode.layout, episode.layout_hit, episode.presenter_mined = \
+                data['layout'], data['layout_hit'], data['presenter_mined']
+        else:
+            if soup is None:
+                soup = BeautifulSoup(page, SOUP_PARSER)
+            episode = self.extract_episode(soup, castaway, presenter if settled else '')
+            if self.cache is not None and page is not None:
+                self.cache.put(page, dict(episode.as_dict(), layout=episode.layout,
+                                          layout_hit=episode.layout_hit,
+                                          presenter_mined=episode.presenter_mined), castaway)
+
+        if not episode.presenter_mined or not episode.presenter:
+            # Not mined or none in the description
+            episode.presenter, episode.presenter_mined = presenter, False
+
+        return episode
+
+    def finish_episode(self, episode, learn=True):
+        """
+        Record whether the extractor specialized for the episode's page layout found every
+        field and, if learn, add a presenter mined from the description to the presenter
+        index, if there is one. These are done once per episode, whether or not it was
+        extracted from the cache.
+        """
+        self.layout_stats.record(episode.layout, episode.layout_hit)
+
+        if learn and self.presenter_index is not None and episode.presenter_mined and \
+                not is_classic_episode(episode.title):
+            self.presenter_index.record(episode.broadcast_datetime[0], episode.presenter)
+
+    def parse_episode_page(self, page, castaway='', learn=True):
+        """
+        Parse episode page (bytes as fetched), using the extraction cache if there is one.
+        Presenters are only added to the presenter index if learn, eg not for pages that
+        may not be the BBC's.
+        """
+        episode = self.extract_page(page, castaway)
+        self.finish_episode(episode, learn)
+        return episode
+
+    def castaway_in_listing(self, castaway):
+        """
+        Return castaway (without episode) from an entry on the episode listing page
         """
         if castaway.a is not None:
             name, job = self.name_and_job(castaway.span.text)
             if name or job:
-                episode_url = castaway.a['href']
-                episode_element = BeautifulSoup(
-                    GetPage(episode_url), SOUP_PARSER)
-                episode = self.parse_episode(episode_element, name)
-
-                return DesertIslandDiscsCastaway(name, job, episode_url, episode)
+                return DesertIslandDiscsCastaway(name, job, castaway.a['href'], None)
             else:
                 print(f'*** No name and job: {castaway.a["href"]}')
         else:
@@ -643,6 +1245,108 @@ class DesertIslandDiscsParser:
 
         return None
 
+    def listing_castaways(self, soup):
+        """
+        Return castaways on an episode listing page, without their episodes
+        """
+        result = []
+        for castaway_element in soup.find_all('h2', class_='programme__titles'):
+            try:
+                if (castaway := self.castaway_in_listing(castaway_element)) is not None:
+                    result.append(castaway)
+            except Exception as e:
+                print_error(
+                    f'ERROR processing castaway: {castaway_element}', e)
+
+        return result
+
+    def fetch_structured(self, url):
+        """
+        Return an episode page made from the JSON document and segments fragment of
+        the episode at url (see structured_page) or None if there's no JSON document
+        """
+        url = url.rstrip('/')
+        response = default_fetcher().get(PROGRAMME_JSON_URL % url)
+        try:
+            programme = json.loads(response.content) if response.status_code == 200 else {}
+        except ValueError:
+            programme = {}
+        if 'programme' not in programme:
+            print(f'*** No programme JSON for {url}: fetching page')
+            return None
+
+        segments = default_fetcher().get(SEGMENTS_URL % url)
+        # Episodes with no segments, eg classic episodes, have no fragment
+        return structured_page(programme, segments.content if segments.status_code == 200 else b'')
+
+    def fetch_episode(self, castaway):
+        """
+        Return castaway's episode page or None if it could not be fetched in time
+        """
+        try:
+            if self.structured and (page := self.fetch_structured(castaway.episode_url)) is not None:
+                return page
+            return GetPage(castaway.episode_url, until=EpisodeEndScanner)
+        except FetchTimeout as e:
+            print(f'*** {e}')
+            self.failed_urls.append(castaway.episode_url)
+            return None
+
+    def parse_castaway_episode(self, castaway, page):
+        """
+        Add the episode on page to castaway
+        """
+        castaway.episode = self.extract_page(page, castaway.name or '')
+        if castaway.name is None:
+            # Not found on a listing page so use episode title
+            castaway.name, castaway.job = self.name_and_job(castaway.episode.title)
+        if page.startswith(STRUCTURED_PAGE_MARKER):
+            self.complete_episode(castaway)
+        self.finish_episode(castaway.episode)
+        return castaway
+
+    def complete_episode(self, castaway, page=None):
+        """
+        Fill in the fields of castaway's episode that its structured representations
+        lack from the full episode page. Some episodes don't have every field so the
+        page is only fetched if it's needed and not given; this happens in the parse
+        stage. The caller finishes the completed episode (see finish_episode).
+        """
+        if not (missing := episode_missing(castaway.episode)):
+            return
+
+        if page is None:
+            METRICS.inc('did_page_fallbacks_total')
+            try:
+                page = GetPage(castaway.episode_url, until=EpisodeEndScanner)
+            except FetchTimeout as e:
+                print(f'*** {e}: keeping structured data')
+                return
+
+        episode = self.extract_page(page, castaway.name or '')
+        for attribute in missing:
+            if attribute == 'tracks':
+                if len(episode.tracks) > len(castaway.episode.tracks):
+                    castaway.episode.tracks = episode.tracks
+            elif attribute == 'broadcast_datetime':
+                if episode.broadcast_datetime and episode.broadcast_datetime[0]:
+                    castaway.episode.broadcast_datetime = episode.broadcast_datetime
+            elif getattr(episode, attribute):
+                setattr(castaway.episode, attribute, getattr(episode, attribute))
+                if attribute == 'presenter':
+                    castaway.episode.presenter_mined = episode.presenter_mined
+
+    def parse_castaway_in_listing(self, castaway):
+        """
+        Parse a castaway on the episode listing page. Then load the episode page itself
+        for the castaway and extract details
+        """
+        if (result := self.castaway_in_listing(castaway)) is not None:
+            if (page := self.fetch_episode(result)) is not None:
+                return self.parse_castaway_episode(result, page)
+
+        return None
+
     def parse_episode_listing(self, soup=None):
         """
         Parse a page that contains a list of episodes and extract each castaway's name,
@@ -668,75 +1372,40 @@ class DesertIslandDiscsParser:
                 castaway = self.parse_castaway_in_listing(castaway_element)
                 if castaway is not None:
                     # Using name as key doesn't allow for castaways who appear more
-                    # than once; use object as key since we don't ever use the key
-                    #  self.all_castaways[castaway.name] = castaway
-                    self.all_castaways[castaway] = castaway
+                    # than once; use the programme id, which is unique to the episode,
+                    # so an episode listed twice (see Crawler.frontier) is kept once
+                    self.all_castaways[programme_pid(castaway.episode_url)] = castaway
             except Exception as e:
                 print_error(
                     f'ERROR processing castaway: {castaway_element}', e)
 
-    @property
-    def castaways(self):
-        return self.all_castaways
-
-
-class CastawayWriter:
-
-    def castaway_as_row(self, c):
+    def last_listing_page(self, soup):
         """
-        Converts castaway to an array, which maps to a row in a CSV file
+        Return number of last listing page from the pagination links on a listing page
+        or None if there are no links.
         """
-        result = []
-
-        result.append(c.name)
-        result.append(c.job)
-        result.append(c.episode_url)
-
-        result.append(c.episode.title)
-        result.append(c.episode.book)
-        result.append(c.episode.luxury)
-        result.append(c.episode.favourite_track)
-        result.append(c.episode.presenter)
-        result.append(c.episode.broadcast_datetime[0])
-        result.append(c.episode.broadcast_datetime[1])
+        pages = [0]
+        for li in soup.find_all('li', class_='pagination__page'):
+            if li.a and (match := re.search(r'page=(\d+)', li.a.get('href', ''))):
+                pages.append(int(match.group(1)))
+            elif (span := li.find('span')) and span.text.strip().isdigit():
+                # the current page isn't a link
+                pages.append(int(span.text.strip()))
 
-        for t in c.episode.tracks:
-            result.append(t.artist)
-            result.append(t.song)
+        return max(pages) if max(pages) > 0 else None
 
-        return result
-
-    def csv_header(self):
-        """
-        Return header row for CSV file
-        """
-        result = []
-        result.append('Castaway')
-        result.append('Job')
-        result.append('URL')
-        result.append('Episode title')
-        result.append('Book')
-        result.append('Luxury')
-        result.append('Favourite track')
-        result.append('Presenter')
-        result.append('Date first broadcast')
-        result.append('Time first broadcast')
-        for i in range(1, MAX_TRACKS + 1):
-            result.append(f'Artist {i}')
-            result.append(f'Song {i}')
+    @property
+    def castaways(self):
+        return self.all_castaways
 
-        return result
 
-    def as_csv(self, castaways, filename=None, delim=TAB):
-        """
-        Create a CSV of episodes scraped
-        """
-        with smart_open(filename, 'a') as output:
-            writer = csv.writer(
-                output, delimiter=delim, lineterminator='\r\n')
-            writer.writerow(self.csv_header())
-            for c in castaways.values():
-                writer.writerow(self.castaway_as_row(c))
+def listing_url(s):
+    """
+    Return URL of listing pages, which has %s where the page number goes
+    """
+    if '%s' not in s:
+        raise argparse.ArgumentTypeError(f'{s} must contain %s for the page number')
+    return s
 
 
 def setup_command_line():
@@ -744,18 +1413,113 @@ def setup_command_line():
     Define command line switches
     """
     cmdline = argparse.ArgumentParser(prog='Desert Island Discs Web Scraper')
-    cmdline.add_argument('--csv', dest='output',
+    cmdline.add_argument('--csv', '--output', dest='output',
                          help='Filename of CSV file (tab-separated). The file will be appended '
-                         'to if it exists (default output is to console)')
+                         'to if it exists (default output is to console). See --format for other '
+                         'formats; add .gz or .zst to the filename to compress it.')
+    cmdline.add_argument('--format', choices=FORMATS,
+                         help='Output format: tsv (tab-separated CSV, the default), jsonl (JSON Lines, '
+                         'with every track), parquet (typed columns; needs pyarrow) or xlsx (Excel, '
+                         'with summary sheets; needs openpyxl). The default '
+                         'is inferred from the output filename eg episodes.jsonl.gz. See writers.py.')
     cmdline.add_argument('--start-page', type=int, default=DEFAULT_LISTING_START_PAGE,
                          help=f'First page to scrape episodes from (default is {DEFAULT_LISTING_START_PAGE})')
     cmdline.add_argument('--end-page', type=int, default=DEFAULT_LISTING_END_PAGE,
                          help=f'Last page to scrape episodes from (default is {DEFAULT_LISTING_START_PAGE})')
+    cmdline.add_argument('--all', action='store_true',
+                         help='Scrape all listing pages, finding the last page automatically. All listing '
+                         'pages are read before any episode is fetched. --start-page and --end-page are ignored')
+    cmdline.add_argument('--shard', type=parse_shard,
+                         help='Scrape only one shard of the episodes, eg 2/4 for the second of four shards. '
+                         'Run each shard on a different machine then combine the output with merge_shards.py')
+    cmdline.add_argument('--shard-by', choices=['pid', 'page'], default='pid',
+                         help='Split episodes into shards by a hash of the programme id (the default, '
+                         'which balances shards evenly) or by listing page range')
     cmdline.add_argument('--sleep', type=int, default=DEFAULT_SLEEP,
-                         help=f'Time to pause (in seconds) between fetching pages (default is {DEFAULT_SLEEP} seconds)')
+                         help=f'Additional time to pause (in seconds) between fetching listing pages (default is {DEFAULT_SLEEP} seconds)')
+    cmdline.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                         help=f'Requests per second to start at (default is {DEFAULT_RATE}). The rate '
+                         'adapts to the server: it drops when the server is slow or asks us to back off '
+                         'and rises otherwise')
+    cmdline.add_argument('--max-rate', type=float, default=DEFAULT_MAX_RATE,
+                         help=f'Maximum requests per second (default is {DEFAULT_MAX_RATE})')
+    cmdline.add_argument('--connect-timeout', type=float, default=DEFAULT_CONNECT_TIMEOUT,
+                         help=f'Seconds to wait to connect to the server (default is {DEFAULT_CONNECT_TIMEOUT})')
+    cmdline.add_argument('--read-timeout', type=float, default=DEFAULT_READ_TIMEOUT,
+                         help=f'Seconds to wait for the server to send data (default is {DEFAULT_READ_TIMEOUT})')
+    cmdline.add_argument('--deadline', type=float,
+                         help='Seconds allowed for the whole run. Episodes not fetched in time are '
+                         'listed as failed (default is no limit)')
+    cmdline.add_argument('--hedge', action='store_true',
+                         help='If a request is slower than most recent requests, make the request '
+                         'again and use whichever response arrives first')
+    cmdline.add_argument('--stream', action='store_true',
+                         help='Stop downloading each episode page once the parts that are extracted '
+                         'have arrived, skipping the related links, promotions and footer. Ignored '
+                         'with --archive, which keeps whole pages.')
+    cmdline.add_argument('--structured', action='store_true',
+                         help='Fetch each episode\'s programme JSON document and segments fragment, '
+                         'a tenth of the size of its page, and only fetch the page for fields they lack')
+    cmdline.add_argument('--failed-urls',
+                         help='File to write URLs of episodes that could not be fetched in time, '
+                         'one per line (default output is to console)')
+    cmdline.add_argument('--listing-workers', type=int, default=DEFAULT_LISTING_WORKERS,
+                         help=f'Threads fetching listing pages (default is {DEFAULT_LISTING_WORKERS})')
+    cmdline.add_argument('--fetch-workers', type=int, default=DEFAULT_FETCH_WORKERS,
+                         help=f'Threads fetching episode pages (default is {DEFAULT_FETCH_WORKERS})')
+    cmdline.add_argument('--parse-workers', type=int, default=DEFAULT_PARSE_WORKERS,
+                         help=f'Threads parsing episode pages (default is {DEFAULT_PARSE_WORKERS})')
+    cmdline.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                         help='Maximum items waiting between stages of the crawl '
+                         f'(default is {DEFAULT_QUEUE_SIZE})')
+    cmdline.add_argument('--archive',
+                         help='Compressed archive (WARC format) to add every page fetched to. Use with '
+                         '--reextract to extract episodes again without downloading them')
+    cmdline.add_argument('--reextract', metavar='ARCHIVE',
+                         help='Extract all episodes in an archive created with --archive, without using '
+                         'the network. Other crawl arguments are ignored')
+    cmdline.add_argument('--processes', type=int, default=os.cpu_count(),
+                         help='Processes used to extract episodes with --reextract '
+                         f'(default is {os.cpu_count()})')
+    cmdline.add_argument('--cache',
+                         help='File to cache data extracted from episode pages in. An unchanged page is not '
+                         'parsed again unless the extraction code has changed since it was cached')
+    cmdline.add_argument('--cache-max-age', type=float,
+                         help='Remove cached extractions older than this many days')
+    cmdline.add_argument('--cache-max-size', type=float,
+                         help='Maximum size of the extraction cache in MB; least recently used '
+                         'extractions are removed first')
+    cmdline.add_argument('--canary', type=int, metavar='N',
+                         help='Before crawling, scrape a sample of N episodes from the dataset, chosen '
+                         'from every decade, and compare how often each field is extracted with the '
+                         'dataset. If it has dropped, eg because the BBC site has changed, the crawl '
+                         'is abandoned.')
+    cmdline.add_argument('--canary-tolerance', type=float, default=DEFAULT_CANARY_TOLERANCE,
+                         help='Fail the canary if the rate any field is extracted drops by more than this '
+                         f'(default is {DEFAULT_CANARY_TOLERANCE}, ie 10 percentage points)')
+    cmdline.add_argument('--canary-only', action='store_true',
+                         help='Exit after the canary instead of crawling')
+    cmdline.add_argument('--dataset', default=DEFAULT_DATASET,
+                         help='CSV output of a previous run used to look up presenters by broadcast '
+                         f'date (default is {DEFAULT_DATASET}). If the file does not exist, '
+                         'presenters are extracted from each episode\'s description.')
+    cmdline.add_argument('--progress', type=float, nargs='?', const=DEFAULT_PROGRESS_INTERVAL, default=0,
+                         metavar='SECONDS',
+                         help='Print a progress line, with an estimate of when the crawl will finish, '
+                         f'to stderr every SECONDS ({DEFAULT_PROGRESS_INTERVAL} if not given; default is none)')
+    cmdline.add_argument('--metrics-port', type=int,
+                         help='Serve metrics of the crawl (pages and episodes scraped, latencies, errors, '
+                         'etc) for Prometheus at http://127.0.0.1:PORT/metrics')
+    cmdline.add_argument('--listing-url', type=listing_url, default=DESERT_ISLAND_DISCS_PAGE,
+                         help='URL of the episode listing pages, with %%s for the page number (default is '
+                         'the BBC website). Used to crawl a stand-in server for testing; see standin_bbc.py.')
     cmdline.add_argument('--url', dest='url',
                          help='URL of episode to process (e.g. https://www.bbc.co.uk/programmes/m000fx1k). '
                          'If this is provided, all other arguments are ignored. Used for testing.')
+    cmdline.add_argument('--urls-file', '--urls', dest='urls_file',
+                         help='File of episode URLs to scrape, one per line, or - to read them from '
+                         'stdin. The episodes are fetched concurrently and written to --csv; the '
+                         'castaway\'s name and job are taken from the episode page.')
 
     return cmdline
 
@@ -766,22 +1530,640 @@ def main():
     """
     args = setup_command_line().parse_args()
 
+    try:
+        output_format(args.output, args.format)
+    except ValueError as e:
+        print(f'*** {e}')
+        sys.exit(1)
+
+    if args.reextract:
+        count = reextract(args.reextract, args.output,
+                          args.dataset, args.processes, args.cache, args.format)
+        print(f'Extracted {count} episodes from {args.reextract}')
+        sys.exit(0)
+
+    fetcher = Fetcher(RateLimiter(args.rate, max_rate=args.max_rate),
+                      connect_timeout=args.connect_timeout, read_timeout=args.read_timeout,
+                      deadline=args.deadline, hedge=args.hedge,
+                      archive=PageArchive(args.archive) if args.archive else None,
+                      stream=args.stream)
+    set_fetcher(fetcher)
+
     if args.url:
         print(process_episode_url(args.url))
         sys.exit(0)
 
+    parser = DesertIslandDiscsParser(
+        presenter_index=PresenterIndex.from_dataset(args.dataset), cache=open_cache(args),
+        structured=args.structured)
+
+    crawler = Crawler(parser, args)
+    METRICS.add_collector(crawler.collect_metrics)
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+        print(f'Metrics at http://127.0.0.1:{args.metrics_port}/metrics')
+    progress = ProgressReporter(args.progress).start() if args.progress else None
+
+    if args.canary:
+        if not os.path.exists(args.dataset):
+            print(f'*** No dataset {args.dataset} to compare canary with')
+            sys.exit(1)
+        canary = Canary(crawler, args.canary_tolerance)
+        passed = canary.run(list(CastawayReader().rows(args.dataset)), args.canary)
+        print(canary, end='')
+        if not passed:
+            print(f'*** Canary failed: extraction of {", ".join(canary.failed_fields())} has '
+                  'dropped. Crawl abandoned.')
+            sys.exit(1)
+        if args.canary_only:
+            sys.exit(0)
+
+    if args.urls_file:
+        with open_urls_file(args.urls_file) as f:
+            pipeline = crawler.crawl_urls(read_urls(f))
+    elif args.all:
+        pages = crawler.shard_pages(range(1, crawler.last_page() + 1))
+        castaways = crawler.frontier(pages)
+        print(f'Found {len(castaways)} episodes on {len(pages)} listing pages')
+        pipeline = crawler.crawl_frontier(castaways)
+    else:
+        pipeline = crawler.crawl(crawler.shard_pages(
+            range(args.start_page, args.end_page + 1)))
+
+    if progress:
+        progress.stop()
+    print('Crawl stages:')
+    print(pipeline.report(), end='')
+    if parser.failed_urls:
+        print(f'{len(parser.failed_urls)} episodes could not be fetched in time:')
+        with smart_open(args.failed_urls) as output:
+            for url in parser.failed_urls:
+                print(url, file=output)
+
+    print(fetcher.stats)
+    if args.structured:
+        print(f'Episode pages fetched for fields the structured data lacked: '
+              f'{METRICS.get("did_page_fallbacks_total"):.0f}')
+    if parser.cache:
+        print(parser.cache.stats)
+    print('Layout dispatch (specialized extractor hit rate):')
+    print(parser.layout_stats, end='')
+    print('Presenter eras:')
+    print(parser.presenter_index, end='')
+
+
+class Crawler:
+    """
+    The stages of a crawl: listing fetch, listing parse, episode fetch, episode parse
+    and output. The stages run concurrently, connected by bounded queues (see
+    pipeline.py).
+    """
+
+    def __init__(self, parser, args):
+        self.parser = parser
+        self.args = args
+        self.fetcher = default_fetcher()
+        self.writer = CastawayWriter()
+        self.listing_url = getattr(args, 'listing_url', None) or DESERT_ISLAND_DISCS_PAGE
+        # Listing pages parsed and castaways found on them, to estimate the number of
+        # episodes to scrape
+        self.listing_pages_parsed = 0
+        self.castaways_found = 0
+        # Programme ids of the castaways found so an episode listed more than once,
+        # because the listing shifted during the crawl, is scraped once
+        self.pids = set()
+        self.duplicates = 0
+        # When each listing page was first fetched by the listing stages, as a sequence number
+        self.listing_fetches = itertools.count()
+        self.listing_fetched = {}
+        self._listing_lock = threading.Lock()
+
+    def collect_metrics(self, metrics):
+        if (cache := self.parser.cache) is not None:
+            metrics.set('did_cache_hits_total', cache.hits)
+            metrics.set('did_cache_misses_total', cache.misses)
+
+    def expect_pages(self, pages):
+        METRICS.set('did_listing_pages_expected', len(pages))
+
+    def get_listing(self, page):
+        """
+        Return content of listing page, or None if it couldn't be fetched
+        """
+        print(f'Fetching page {page} (rate {self.fetcher.rate_limiter})')
+        try:
+            content = GetPage(self.listing_url % page)
+        except DeadlineExceeded:
+            print(f'*** Deadline reached; skipping page {page}')
+            return None
+        except FetchTimeout as e:
+            print(f'*** Skipping page {page}: {e}')
+            return None
+        METRICS.inc('did_listing_pages_total')
+        return content
+
+    def fetch_listing(self, page):
+        if (content := self.get_listing(page)) is None:
+            return ()
+        with self._listing_lock:
+            if page not in self.listing_fetched:
+                self.listing_fetched[page] = next(self.listing_fetches)
+        if self.args.sleep:
+            time.sleep(self.args.sleep)
+        return [(page, content)]
+
+    def in_shard(self, castaways):
+        if self.args.shard and self.args.shard_by == 'pid':
+            return [c for c in castaways if in_shard(programme_pid(c.episode_url), *self.args.shard)]
+        return castaways
+
+    def unseen(self, castaways):
+        """
+        Return castaways whose episodes haven't been found before, remembering them
+        """
+        result = []
+        for castaway in castaways:
+            pid = programme_pid(castaway.episode_url)
+            if pid in self.pids:
+                self.duplicates += 1
+            else:
+                self.pids.add(pid)
+                result.append(castaway)
+
+        return result
+
+    def parse_listing(self, page_and_content):
+        castaways = self.in_shard(self.parser.listing_castaways(
+            BeautifulSoup(page_and_content[1], SOUP_PARSER)))
+
+        # Estimate episodes on all pages from those parsed so far
+        self.listing_pages_parsed += 1
+        self.castaways_found += len(castaways)
+        METRICS.set('did_episodes_expected', round(
+            self.castaways_found / self.listing_pages_parsed * METRICS.get('did_listing_pages_expected')))
+        return self.unseen(castaways)
+
+    def listing_page(self, page):
+        """
+        Return castaways on listing page, or None if it couldn't be fetched. Unlike
+        fetch_listing, when the page was fetched isn't recorded.
+        """
+        if (content := self.get_listing(page)) is not None:
+            return self.parser.listing_castaways(BeautifulSoup(content, SOUP_PARSER))
+        return None
+
+    def shard_pages(self, pages):
+        """
+        Return pages to crawl, which are all pages unless sharding by page
+        """
+        if self.args.shard and self.args.shard_by == 'page':
+            return shard_pages(pages, *self.args.shard)
+        return pages
+
+    def fetch_episode(self, castaway):
+        if (page := self.parser.fetch_episode(castaway)) is not None:
+            return [(castaway, page)]
+        return ()
+
+    def parse_episode(self, castaway_and_page):
+        start = time.perf_counter()
+        castaway = self.parser.parse_castaway_episode(*castaway_and_page)
+        METRICS.observe('did_parse_seconds', time.perf_counter() - start)
+        return [castaway]
+
+    def listing_stages(self, output=None):
+        """
+        Return stages that fetch and parse listing pages. The castaways found are passed
+        on to the next stage or, if output is given, output is called with each page and
+        its castaways.
+        """
+        parse = self.parse_listing
+        if output:
+            def parse(page_and_content):
+                output(page_and_content[0], self.parse_listing(page_and_content))
+                return ()
+
+        return [Stage('listing fetch', self.fetch_listing, self.args.listing_workers, self.args.queue_size),
+                Stage('listing parse', parse, 1, self.args.queue_size)]
+
+    def open_output(self):
+        return open_writer(self.writer, self.args.output, getattr(self.args, 'format', None))
+
+    def episode_stages(self, output):
+        """
+        Return stages that fetch and parse castaways' episodes, then call output with
+        each castaway
+        """
+        def write(castaway):
+            output(castaway)
+            METRICS.inc('did_episodes_total')
+            return ()
+
+        return [Stage('episode fetch', self.fetch_episode, self.args.fetch_workers, self.args.queue_size),
+                Stage('episode parse', self.parse_episode, self.args.parse_workers, self.args.queue_size),
+                Stage('output', write, 1, self.args.queue_size)]
+
+    def crawl(self, pages):
+        """
+        Scrape episodes on the listing pages given, writing each castaway as soon as
+        their episode has been parsed. Castaways are written in the order their episodes
+        are parsed. An episode listed more than once is scraped once but, unlike
+        frontier, episodes missed because the listing shifted aren't looked for.
+        """
+        self.expect_pages(pages)
+        with self.open_output() as output:
+            pipeline = Pipeline(self.listing_stages() + self.episode_stages(output.write))
+            pipeline.run(pages)
+
+        return pipeline
+
+    def frontier(self, pages):
+        """
+        Return all castaways (without episodes) on the listing pages given, in listing
+        order, each once. The listing pages are fetched concurrently.
+
+        The listing is newest first so each episode published during the crawl moves
+        the others along one place: the last episode on a page becomes the first on
+        the next. If page N is fetched before the shift and page N + 1 after, that
+        episode is listed twice; it's found once since castaways are kept by programme
+        id. If page N + 1 is fetched first, the episode is on neither. To find such
+        episodes, page 1 is fetched before and after the others; if the episodes on
+        it have moved, the pages that the shift could have made episodes slide onto
+        unseen are fetched again (see drifted_pages).
+        """
+        before = self.listing_page(1)
+        castaways_on_page = {}
+
+        def collect(page, castaways):
+            castaways_on_page[page] = castaways
+
+        pipeline = Pipeline(self.listing_stages(collect))
+        self.expect_pages(pages)
+        pipeline.run(pages)
+
+        print('Listing stages:')
+        print(pipeline.report(), end='')
+
+        after = self.listing_page(1)
+        if shift := listing_shift(before, after):
+            # Page 1 now has any episodes published during the crawl. Pages after those
+            # of a shard, other than the last, are the next shard's.
+            last = max(pages) if pages and self.args.shard and self.args.shard_by == 'page' and \
+                self.args.shard[0] < self.args.shard[1] else None
+            drifted = ([1] if 1 in pages else []) + drifted_pages(pages, self.listing_fetched, last)
+            recovered = self.recover_drift(drifted, castaways_on_page, {1: after})
+            print(f'Listing moved {shift} places during the crawl: {self.duplicates} episodes '
+                  f'listed twice, {recovered} found on pages fetched again')
+
+        return [c for page in sorted(castaways_on_page) for c in castaways_on_page[page]]
+
+    def recover_drift(self, pages, castaways_on_page, fetched):
+        """
+        Add castaways not yet found on pages to castaways_on_page, before those found
+        on them previously. fetched has castaways of pages just fetched again, which
+        aren't fetched once more. Return the number of castaways added.
+        """
+        recovered = 0
+        for page in pages:
+            if (castaways := fetched[page] if page in fetched else self.listing_page(page)) is not None:
+                castaways = self.unseen(self.in_shard(castaways))
+                castaways_on_page[page] = castaways + castaways_on_page.get(page, [])
+                recovered += len(castaways)
+
+        return recovered
+
+    def crawl_frontier(self, castaways):
+        """
+        Scrape the episodes of castaways already found on listing pages
+        """
+        if isinstance(castaways, Sequence):
+            METRICS.set('did_episodes_expected', len(castaways))
+        with self.open_output() as output:
+            pipeline = Pipeline(self.episode_stages(output.write))
+            pipeline.run(castaways)
+
+        return pipeline
+
+    def crawl_urls(self, urls):
+        """
+        Scrape the episodes at the URLs given. URLs are read as they are needed so
+        they can be streamed, eg from stdin.
+        """
+        return self.crawl_frontier(DesertIslandDiscsCastaway(None, None, url, None) for url in urls)
+
+    def last_page(self):
+        """
+        Return the number of the last listing page. This is read from the pagination
+        links on the first page; if they're missing, search for the last page that
+        lists episodes.
+        """
+        soup = BeautifulSoup(GetPage(self.listing_url % 1), SOUP_PARSER)
+        if (last := self.parser.last_listing_page(soup)) is not None:
+            return last
+
+        print('No pagination links: searching for last page')
+        return find_last_page(lambda page: len(self.parser.listing_castaways(
+            BeautifulSoup(GetPage(self.listing_url % page), SOUP_PARSER))) > 0)
+
+
+def listing_shift(before, after):
+    """
+    Return how many places the episodes on the first listing page have moved, given
+    the castaways on it at two times, or 0 if either is unknown
+    """
+    if not before or after is None:
+        return 0
+    pids = [programme_pid(c.episode_url) for c in after]
+    first = programme_pid(before[0].episode_url)
+    return pids.index(first) if first in pids else len(pids)
+
+
+def drifted_pages(pages, fetched, last=None):
+    """
+    Return pages, other than the first, that episodes could have slid onto unseen
+    when the listing shifted: those fetched before the page preceding them and the
+    page after the last, unless that is after last (eg it's in another shard). fetched
+    has the sequence number of each page's fetch.
+    """
+    result = [page for page in pages
+              if page - 1 in fetched and fetched.get(page, -1) < fetched[page - 1]]
+    if pages and (last is None or max(pages) < last):
+        result.append(max(pages) + 1)
+    return result
+
+
+def find_last_page(page_exists):
+    """
+    Return last page for which page_exists(page) is true, assuming page 1 exists. Double
+    the page number until a page doesn't exist then binary search between the last page
+    found and the missing one.
+    """
+    found = 1
+    missing = 2
+    while page_exists(missing):
+        found = missing
+        missing *= 2
+
+    while missing - found > 1:
+        middle = (found + missing) // 2
+        if page_exists(middle):
+            found = middle
+        else:
+            missing = middle
+
+    return found
+
+
+def is_listing_url(url):
+    return '/episodes/' in url
+
+
+def is_structured_url(url):
+    """
+    Return True if url is of an episode's JSON document or segments fragment
+    """
+    return url.endswith(PROGRAMME_JSON_URL % '') or url.endswith(SEGMENTS_URL % '')
+
+
+def structured_episode_url(url):
+    """
+    Return URL of the episode whose JSON document or segments fragment is at url
+    """
+    for suffix in [PROGRAMME_JSON_URL % '', SEGMENTS_URL % '']:
+        if url.endswith(suffix):
+            return url[:-len(suffix)]
+    return url
+
+
+# Parser used by each --reextract process
+_reextract_parser = None
+
+
+def open_cache(args):
+    if args.cache:
+        return ExtractionCache(args.cache, extractor_version(),
+                               args.cache_max_age, args.cache_max_size)
+    return None
+
+
+def _init_reextract(dataset, cache_filename):
+    global _reextract_parser
+    cache = ExtractionCache(cache_filename, extractor_version()) if cache_filename else None
+    _reextract_parser = DesertIslandDiscsParser(
+        presenter_index=PresenterIndex.from_dataset(dataset), cache=cache)
+
+
+def _reextract_episode(url_body_castaway):
+    """
+    Return castaway for an archived episode page. This runs in a separate process.
+    If the episode's structured representations were fetched instead (see
+    --structured), body is the page made from them and page is the full page, if
+    it was needed.
+    """
+    url, body, name, job, page = url_body_castaway
+    try:
+        episode = _reextract_parser.extract_page(body, name or '')
+        if name is None:
+            # Not found on an archived listing page
+            name, job = _reextract_parser.name_and_job(episode.title)
+        castaway = DesertIslandDiscsCastaway(name, job, url, episode)
+        if page is not None:
+            _reextract_parser.complete_episode(castaway, page)
+        _reextract_parser.finish_episode(episode)
+        return castaway
+    except Exception as e:
+        print_error(f'ERROR re-extracting {url}', e)
+        return None
+
+
+def reextract(archive_filename, output, dataset=DEFAULT_DATASET, processes=None, cache_filename=None,
+              format=None):
+    """
+    Extract all episodes in an archive without using the network. The archive is
+    streamed and episodes are parsed in parallel by several processes. Castaways' names
+    and jobs come from the archived listing pages, which are always archived before
+    the episodes on them.
+
+    Episodes of a --structured crawl are made from their JSON document and segments
+    fragment as in the crawl, and completed from their full page if that was fetched
+    too. As the page may be archived well after the others, these episodes are
+    extracted once the whole archive has been read.
+    """
     parser = DesertIslandDiscsParser()
+    castaways = {}
+    # Episode URL to programme JSON, then to the page made from it and its segments
+    programmes = {}
+    structured = {}
+
+    def episode(url, body, page=None):
+        name, job = castaways.get(url, (None, None))
+        return url, body, name, job, page
+
+    def episodes():
+        for record in PageArchive(archive_filename).records():
+            if is_structured_url(record.url):
+                url = structured_episode_url(record.url)
+                if record.url.endswith(PROGRAMME_JSON_URL % ''):
+                    try:
+                        programme = json.loads(record.body) if record.status == 200 else {}
+                    except ValueError:
+                        programme = {}
+                    if 'programme' in programme:
+                        programmes[url] = programme
+                elif url in programmes:
+                    # Episodes with no segments have no fragment
+                    structured[url] = structured_page(
+                        programmes.pop(url), record.body if record.status == 200 else b'')
+            elif record.status != 200:
+                continue
+            elif is_listing_url(record.url):
+                for c in parser.listing_castaways(BeautifulSoup(record.body, SOUP_PARSER)):
+                    castaways[c.episode_url] = (c.name, c.job)
+            elif (url := record.url.rstrip('/')) in structured:
+                yield episode(record.url, structured.pop(url), record.body)
+            else:
+                yield episode(record.url, record.body)
+
+        for url, body in structured.items():
+            yield episode(url, body)
+
+    count = 0
+    with Pool(processes, _init_reextract, (dataset, cache_filename)) as pool, \
+            open_writer(CastawayWriter(), output, format) as writer:
+        for castaway in pool.imap(_reextract_episode, episodes(), chunksize=4):
+            if castaway is not None:
+                writer.write(castaway)
+                count += 1
+
+    return count
+
+
+def stratified_sample(rows, n, stratum, rng=random):
+    """
+    Return up to n rows, taken in turn from each stratum (as given by function
+    stratum) so that every stratum is represented
+    """
+    strata = collections.defaultdict(list)
+    for row in rows:
+        strata[stratum(row)].append(row)
+    for members in strata.values():
+        rng.shuffle(members)
+
+    result = []
+    groups = [strata[key] for key in sorted(strata)]
+    while len(result) < n and any(groups):
+        for members in groups:
+            if members and len(result) < n:
+                result.append(members.pop())
+
+    return result
 
-    for page in range(args.start_page, args.end_page + 1):
-        print(f'Fetching page {page}')
-        url = DESERT_ISLAND_DISCS_PAGE % page
-        soup = BeautifulSoup(GetPage(url), SOUP_PARSER)
-        parser.parse(soup)
-        time.sleep(args.sleep)
 
-    print('Creating output:')
-    writer = CastawayWriter()
-    writer.as_csv(parser.castaways, args.output)
+def broadcast_decade(row):
+    date = row.get('Date first broadcast') or ''
+    return f'{date[:3]}0s' if date[:4].isdigit() else 'unknown'
+
+
+class Canary:
+    """
+    Scrape a sample of episodes from the dataset and compare how often each field is
+    extracted with the dataset. Done before a crawl, a drop shows that the BBC site
+    has changed and the extraction code needs updating.
+
+    The sample is stratified by decade of broadcast. Page layouts aren't known until
+    pages have been fetched, so extraction rates are also reported for each layout.
+    """
+
+    def __init__(self, crawler, tolerance=DEFAULT_CANARY_TOLERANCE, rng=random):
+        self.crawler = crawler
+        self.tolerance = tolerance
+        self.rng = rng
+        self.sample = []
+        # (baseline row, scraped row, layout family)
+        self.results = []
+
+    def scrape(self, rows):
+        results = []
+        baseline = {row['URL']: row for row in rows}
+        writer = CastawayWriter()
+
+        def parse(castaway_and_page):
+            castaway = self.crawler.parser.parse_castaway_episode(*castaway_and_page)
+            return [(baseline[castaway.episode_url], writer.castaway_as_dict(castaway),
+                     castaway.episode.layout)]
+
+        def collect(result):
+            results.append(result)
+            return ()
+
+        args = self.crawler.args
+        Pipeline([Stage('canary fetch', self.crawler.fetch_episode, args.fetch_workers, args.queue_size),
+                  Stage('canary parse', parse, args.parse_workers, args.queue_size),
+                  Stage('canary output', collect)]).run(
+            DesertIslandDiscsCastaway(row['Castaway'], row['Job'], row['URL'], None) for row in rows)
+
+        return results
+
+    def run(self, rows, n):
+        """
+        Scrape a sample of n of the rows. Return True if no field is extracted less
+        often than in rows, allowing for the tolerance.
+        """
+        self.sample = stratified_sample(rows, n, broadcast_decade, self.rng)
+        self.results = self.scrape(self.sample)
+        return not self.failed_fields()
+
+    @staticmethod
+    def rate(rows, field):
+        return sum(1 for row in rows if not missing_fields(row, [field])) / len(rows) if rows else 0
+
+    def rates(self, results=None):
+        """
+        Return dict of field to (baseline rate, canary rate)
+        """
+        results = self.results if results is None else results
+        baseline = [b for b, _, _ in results]
+        scraped = [s for _, s, _ in results]
+        return {field: (self.rate(baseline, field), self.rate(scraped, field)) for field in CANARY_FIELDS}
+
+    def failed_fields(self):
+        if not self.results:
+            # Nothing could be fetched
+            return list(CANARY_FIELDS)
+        return [field for field, (baseline, canary) in self.rates().items()
+                if canary < baseline - self.tolerance]
+
+    def __str__(self):
+        s = f'Canary: {len(self.results)} of {len(self.sample)} sampled episodes scraped\n'
+        s += f'{"":24}{"dataset":>9}{"canary":>9}\n'
+        for field, (baseline, canary) in self.rates().items():
+            s += f'{field:24}{baseline:9.0%}{canary:9.0%}\n'
+
+        for family in sorted({layout for _, _, layout in self.results}):
+            results = [r for r in self.results if r[2] == family]
+            rates = ', '.join(f'{field} {canary:.0%}' for field, (_, canary) in self.rates(results).items())
+            s += f'{family} layout ({len(results)} episodes): {rates}\n'
+
+        return s
+
+
+def read_urls(f):
+    """
+    Return generator of episode URLs in file f, one per line. Blank lines and lines
+    starting with # are ignored.
+    """
+    for line in f:
+        if (url := line.strip()) and not url.startswith('#'):
+            yield url
+
+
+def open_urls_file(filename):
+    """
+    Return handle to file of URLs or stdin if filename is -
+    """
+    if filename == '-':
+        return contextlib.nullcontext(sys.stdin)
+    return open(filename, encoding='utf-8')
 
 
 def process_episode_url(url):
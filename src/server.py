@@ -0,0 +1,272 @@
+"""
+=============================================================================
+File: server.py
+Description: HTTP service that extracts the data from Desert Island Discs episode
+             pages and returns it as JSON.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+
+To run:
+
+    python server.py --port 8765
+
+Other programs can then get an episode's data without starting Python each time.
+The parser, HTTP session and extraction cache stay loaded between requests, and
+requests are handled concurrently.
+
+    GET  /episode?url=https://www.bbc.co.uk/programmes/m000fx1k
+    GET  /episode?pid=m000fx1k
+    POST /episode?castaway=<name>     (body is the episode page's HTML)
+    GET  /metrics                     (request counts and latencies)
+
+If the BBC returns 404 for the episode page, so does the service; other errors from the
+BBC, or a page that isn't an episode page, are returned as 502. A POSTed page that isn't
+an episode page is returned as 400. POSTed pages aren't used to learn presenters (see
+PresenterIndex). The response is:
+
+    {"castaway": ..., "job": ..., "url": ..., "episode": {"title": ..., "tracks": [[artist, song], ...],
+     "book": ..., "luxury": ..., "favourite_track": ..., "presenter": ...,
+     "broadcast_datetime": [date, time]}}
+=============================================================================
+"""
+
+import argparse
+import collections
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from scraper import (DesertIslandDiscsParser, ExtractionCache, Fetcher, FetchTimeout,
+                     PresenterIndex, RateLimiter, default_fetcher, extractor_version,
+                     set_fetcher, DEFAULT_DATASET, DEFAULT_RATE, DEFAULT_MAX_RATE)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+EPISODE_URL = 'https://www.bbc.co.uk/programmes/%s'
+# Only BBC episode pages are fetched
+EPISODE_URL_PATTERN = re.compile(r'^https://www\.bbc\.co\.uk/programmes/(\w+)$')
+LATENCY_SAMPLES = 1000
+MAX_BODY_SIZE = 10 * 1024 * 1024
+
+
+class BadRequest(Exception):
+    pass
+
+
+class NotFound(Exception):
+    pass
+
+
+class BadGateway(Exception):
+    """
+    The BBC returned an error for the episode page
+    """
+    pass
+
+
+class LatencyStats:
+    """
+    Count and latency of requests to each endpoint
+    """
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self.samples = samples
+        self.counts = collections.Counter()
+        self.errors = collections.Counter()
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=self.samples))
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, latency, error=False):
+        with self._lock:
+            self.counts[endpoint] += 1
+            if error:
+                self.errors[endpoint] += 1
+            self.latencies[endpoint].append(latency)
+
+    def as_dict(self):
+        """
+        Return stats for each endpoint, with latency percentiles in milliseconds over
+        the most recent requests
+        """
+        result = {}
+        with self._lock:
+            for endpoint, latencies in self.latencies.items():
+                ordered = sorted(latencies)
+
+                def percentile(p):
+                    return round(1000 * ordered[min(len(ordered) - 1, len(ordered) * p // 100)], 2)
+
+                result[endpoint] = {'requests': self.counts[endpoint],
+                                    'errors': self.errors[endpoint],
+                                    'latency_ms': {'mean': round(1000 * sum(ordered) / len(ordered), 2),
+                                                   'p50': percentile(50),
+                                                   'p95': percentile(95),
+                                                   'p99': percentile(99),
+                                                   'max': round(1000 * ordered[-1], 2)}}
+        return result
+
+
+class EpisodeService:
+    """
+    The work behind each endpoint, independent of HTTP. Requests are handled in
+    several threads, which share the parser.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.stats = LatencyStats()
+
+    def episode_url(self, query):
+        if 'pid' in query:
+            url = EPISODE_URL % query['pid'][0]
+        elif 'url' in query:
+            url = query['url'][0]
+        else:
+            raise BadRequest('url or pid required')
+
+        if not EPISODE_URL_PATTERN.match(url):
+            raise BadRequest(f'Not a BBC programme URL: {url}')
+        return url
+
+    def episode_as_dict(self, episode, url=None, castaway=''):
+        name, job = self.parser.name_and_job(episode.title)
+        return {'castaway': castaway or name,
+                'job': job,
+                'url': url,
+                'episode': episode.as_dict()}
+
+    def get_episode(self, query):
+        url = self.episode_url(query)
+        response = default_fetcher().get(url)
+        if response.status_code == 404:
+            raise NotFound(f'No episode page: {url}')
+        if response.status_code != 200:
+            raise BadGateway(f'Status {response.status_code} fetching {url}')
+
+        try:
+            episode = self.parser.parse_episode_page(response.content)
+        except ValueError as e:
+            raise BadGateway(f'{e}: {url}')
+        return self.episode_as_dict(episode, url)
+
+    def post_episode(self, query, page):
+        castaway = query.get('castaway', [''])[0]
+        try:
+            episode = self.parser.parse_episode_page(page, castaway, learn=False)
+        except ValueError as e:
+            raise BadRequest(str(e))
+        return self.episode_as_dict(episode, castaway=castaway)
+
+    def metrics(self, query):
+        return self.stats.as_dict()
+
+
+class EpisodeRequestHandler(BaseHTTPRequestHandler):
+    # Set by make_server
+    service = None
+    quiet = False
+
+    def do_GET(self):
+        routes = {'/episode': self.service.get_episode, '/metrics': self.service.metrics}
+        self.handle_route(routes, lambda work, query: work(query))
+
+    def do_POST(self):
+        def post(work, query):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > MAX_BODY_SIZE:
+                raise BadRequest('Page too large')
+            return work(query, self.rfile.read(length))
+
+        self.handle_route({'/episode': self.service.post_episode}, post)
+
+    def handle_route(self, routes, call):
+        start = time.perf_counter()
+        parts = urlsplit(self.path)
+        work = routes.get(parts.path)
+        status = 200
+        try:
+            if work is None:
+                status, result = 404, {'error': f'Not found: {parts.path}'}
+            else:
+                result = call(work, parse_qs(parts.query))
+        except BadRequest as e:
+            status, result = 400, {'error': str(e)}
+        except NotFound as e:
+            status, result = 404, {'error': str(e)}
+        except BadGateway as e:
+            status, result = 502, {'error': str(e)}
+        except FetchTimeout as e:
+            status, result = 504, {'error': str(e)}
+        except Exception as e:
+            status, result = 500, {'error': f'{type(e).__name__}: {e}'}
+
+        latency = time.perf_counter() - start
+        if work is not None:
+            self.service.stats.record(f'{self.command} {parts.path}', latency, status != 200)
+
+        body = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Server-Timing', f'total;dur={1000 * latency:.2f}')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+def make_server(parser, host=DEFAULT_HOST, port=DEFAULT_PORT, quiet=False):
+    """
+    Return HTTP server for the parser. Each request is handled in its own thread.
+    """
+    handler = type('Handler', (EpisodeRequestHandler,),
+                   {'service': EpisodeService(parser), 'quiet': quiet})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def setup_command_line():
+    cmdline = argparse.ArgumentParser(prog='Desert Island Discs episode service')
+    cmdline.add_argument('--host', default=DEFAULT_HOST,
+                         help=f'Address to listen on (default is {DEFAULT_HOST})')
+    cmdline.add_argument('--port', type=int, default=DEFAULT_PORT,
+                         help=f'Port to listen on (default is {DEFAULT_PORT})')
+    cmdline.add_argument('--cache',
+                         help='Extraction cache file (see scraper.py --cache)')
+    cmdline.add_argument('--dataset', default=DEFAULT_DATASET,
+                         help='CSV file used to look up presenters by broadcast date')
+    cmdline.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                         help=f'Initial requests per second to the BBC (default is {DEFAULT_RATE})')
+    cmdline.add_argument('--max-rate', type=float, default=DEFAULT_MAX_RATE,
+                         help=f'Maximum requests per second to the BBC (default is {DEFAULT_MAX_RATE})')
+    cmdline.add_argument('--quiet', action='store_true',
+                         help='Don\'t log each request')
+    return cmdline
+
+
+def main():
+    args = setup_command_line().parse_args()
+    set_fetcher(Fetcher(RateLimiter(args.rate, max_rate=args.max_rate)))
+
+    cache = ExtractionCache(args.cache, extractor_version()) if args.cache else None
+    parser = DesertIslandDiscsParser(
+        presenter_index=PresenterIndex.from_dataset(args.dataset), cache=cache)
+
+    server = make_server(parser, args.host, args.port, args.quiet)
+    print(f'Listening on http://{args.host}:{server.server_port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('Stopped')
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,396 @@
+"""
+=============================================================================
+File: standin_bbc.py
+Description: Local stand-in for the BBC website, for testing the crawler's
+             throughput and how it recovers from errors.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+
+To run:
+
+    python standin_bbc.py --episodes 5000 --latency lognormal:-3,0.5 --error-rate 0.02
+
+then crawl it with
+
+    python scraper.py --all --listing-url 'http://127.0.0.1:8766/programmes/b006qnmr/episodes/guide?page=%s'
+
+Listing pages (ten episodes each) are generated; episode pages are the example
+pages in the data directory. Each episode's programme JSON document (/programmes/<pid>.json)
+and segments fragment (/programmes/<pid>/segments.inc), which scraper.py --structured
+fetches, are recorded from its page. Faults can be injected into any response:
+
+    --latency       delay before responding, from a distribution:
+                    constant:S, uniform:MIN,MAX, exponential:MEAN or
+                    lognormal:MU,SIGMA (all in seconds)
+    --throttle-rate fraction of responses that are 429 with Retry-After
+    --error-rate    fraction of responses that are 500, 502 or 503
+    --drip-rate     fraction of responses whose body is sent slowly in small pieces
+    --reset-rate    fraction of requests where the connection is reset
+
+The listing is newest first, like the BBC's. With --publish-every N, a new episode is
+published every N listing page requests, which moves every other episode along one
+place, as happens when the BBC broadcasts an episode during a crawl.
+=============================================================================
+"""
+
+import argparse
+import collections
+import glob
+import json
+import math
+import os
+import random
+import re
+import socket
+import struct
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bs4 import BeautifulSoup
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8766
+DEFAULT_EPISODES = 3000
+EPISODES_PER_PAGE = 10
+LISTING_PATH = '/programmes/b006qnmr/episodes/guide'
+EPISODE_PATH = re.compile(r'^/programmes/(\w+)$')
+PROGRAMME_JSON_PATH = re.compile(r'^/programmes/(\w+)\.json$')
+SEGMENTS_PATH = re.compile(r'^/programmes/(\w+)/segments\.inc$')
+EPISODE_TEMPLATES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 '../data/BBC Radio 4 - Desert Island Discs, *.html')
+DEFAULT_RETRY_AFTER = 1
+DRIP_CHUNK_SIZE = 512
+DEFAULT_DRIP_DELAY = 0.01
+ERROR_STATUS = [500, 502, 503]
+
+OK = 'ok'
+THROTTLE = 'throttle'
+ERROR = 'error'
+DRIP = 'drip'
+RESET = 'reset'
+
+
+def parse_latency(spec):
+    """
+    Return function that returns a random delay given a random.Random, from a
+    distribution given as name:parameters eg lognormal:-3,0.5
+    """
+    name, _, params = spec.partition(':')
+    try:
+        values = [float(v) for v in params.split(',')] if params else []
+        distributions = {'constant': lambda r: values[0],
+                         'uniform': lambda r: r.uniform(values[0], values[1]),
+                         'exponential': lambda r: r.expovariate(1 / values[0]),
+                         'lognormal': lambda r: r.lognormvariate(values[0], values[1])}
+        distribution = distributions[name]
+        distribution(random.Random())
+    except (KeyError, IndexError, ValueError, ZeroDivisionError):
+        raise argparse.ArgumentTypeError(f'Invalid latency distribution: {spec}')
+
+    return distribution
+
+
+def episode_pid(i):
+    return f'x{i:07d}'
+
+
+def synopsis_text(element):
+    """
+    Return text of the paragraphs in element, as in programme JSON documents: lines
+    separated by a newline and paragraphs by a blank line
+    """
+    if element is None:
+        return None
+    paragraphs = []
+    for p in element.find_all('p'):
+        for br in p.find_all('br'):
+            br.replace_with('\n')
+        paragraphs.append(p.get_text().strip())
+    return '\n\n'.join(paragraphs)
+
+
+def record_fragments(page):
+    """
+    Return (programme JSON document without its pid, segments fragment or None) of an
+    episode page, made as the BBC makes them
+    """
+    soup = BeautifulSoup(page, 'html.parser')
+    title = soup.find('h1').text.strip()
+    broadcasts = [e['content'] for e in soup.find_all('div', class_='broadcast-event__time beta')]
+    if broadcasts:
+        first_broadcast = min(broadcasts, key=datetime.fromisoformat)
+    else:
+        first_broadcast = (time := soup.find('time')) and time['datetime']
+
+    programme = {'type': 'episode',
+                 'title': title,
+                 'display_title': {'title': 'Desert Island Discs', 'subtitle': title},
+                 'short_synopsis': synopsis_text(soup.find(class_='synopsis-toggle__short')),
+                 'long_synopsis': synopsis_text(soup.find(class_='synopsis-toggle__long') or
+                                                soup.find(class_='longest-synopsis')),
+                 'first_broadcast_date': first_broadcast}
+    segments = soup.find('div', class_='segments-list')
+    return programme, str(segments).encode('utf-8') if segments else None
+
+
+def listed_episode(position, episodes, published):
+    """
+    Return number of the episode at position in the listing when published episodes
+    have been added to the first episodes. The newest episode is listed first.
+    """
+    return episodes + published - 1 - position if position < published else position - published
+
+
+def listing_page(host, page, pages, episodes, published=0):
+    """
+    Return HTML of a listing page in the same format as the BBC's
+    """
+    items = []
+    for position in range((page - 1) * EPISODES_PER_PAGE, min(page * EPISODES_PER_PAGE, episodes + published)):
+        i = listed_episode(position, episodes, published)
+        items.append(f'<h2 class="programme__titles"><a href="http://{host}/programmes/{episode_pid(i)}">'
+                     f'<span class="programme__title gamma"><span>Castaway {i}, job {i}</span></span></a></h2>')
+
+    pagination = []
+    for p in sorted({1, page - 1, page, page + 1, pages}):
+        if 1 <= p <= pages:
+            if p == page:
+                pagination.append(f'<li class="pagination__page"><span>{p}</span></li>')
+            else:
+                pagination.append(f'<li class="pagination__page"><a href="http://{host}{LISTING_PATH}?page={p}">'
+                                  f'{p}</a></li>')
+
+    return ('<html><head><title>BBC Radio 4 - Desert Island Discs - Available now</title></head><body>' +
+            '\n'.join(items) + '<ol class="pagination">' + ''.join(pagination) + '</ol></body></html>').encode('utf-8')
+
+
+class StandInBBC:
+    """
+    Content and faults of the stand-in server. Choices are made with a seeded random
+    number generator so a run can be repeated (as far as the order of requests allows).
+    """
+
+    def __init__(self, episodes=DEFAULT_EPISODES, latency=None, throttle_rate=0, error_rate=0,
+                 drip_rate=0, reset_rate=0, retry_after=DEFAULT_RETRY_AFTER,
+                 drip_delay=DEFAULT_DRIP_DELAY, publish_every=0, seed=0):
+        self.episodes = episodes
+        # Episodes published while serving, and listing requests made
+        self.publish_every = publish_every
+        self.published = 0
+        self.listing_requests = 0
+        self.latency = latency
+        self.fault_rates = [(THROTTLE, throttle_rate), (ERROR, error_rate),
+                            (DRIP, drip_rate), (RESET, reset_rate)]
+        self.retry_after = retry_after
+        self.drip_delay = drip_delay
+        self.templates = []
+        for filename in sorted(glob.glob(EPISODE_TEMPLATES)):
+            with open(filename, 'rb') as f:
+                self.templates.append(f.read())
+        self.fragments = [record_fragments(page) for page in self.templates]
+        self.random = random.Random(seed)
+        self.outcomes = collections.Counter()
+        self._lock = threading.Lock()
+
+    def choose(self):
+        """
+        Return (delay, outcome) for a request
+        """
+        with self._lock:
+            delay = self.latency(self.random) if self.latency else 0
+            x = self.random.random()
+            outcome = OK
+            for fault, rate in self.fault_rates:
+                if x < rate:
+                    outcome = fault
+                    break
+                x -= rate
+            self.outcomes[outcome] += 1
+            error_status = self.random.choice(ERROR_STATUS)
+
+        return delay, outcome, error_status
+
+    @property
+    def total_episodes(self):
+        return self.episodes + self.published
+
+    @property
+    def pages(self):
+        return max(1, math.ceil(self.total_episodes / EPISODES_PER_PAGE))
+
+    def listing(self, host, page):
+        """
+        Return listing page, first publishing an episode if one is due
+        """
+        with self._lock:
+            self.listing_requests += 1
+            if self.publish_every and self.listing_requests % self.publish_every == 0:
+                self.published += 1
+            if page > self.pages:
+                return 404, b'Not found'
+            return 200, listing_page(host, page, self.pages, self.episodes, self.published)
+
+    def page(self, host, path, query):
+        """
+        Return (status, body) for a path
+        """
+        if path == LISTING_PATH:
+            match = re.search(r'page=(\d+)', query)
+            return self.listing(host, int(match.group(1)) if match else 1)
+
+        for pattern in (EPISODE_PATH, PROGRAMME_JSON_PATH, SEGMENTS_PATH):
+            if (match := pattern.match(path)) and match.group(1).startswith('x') and \
+                    int(match.group(1)[1:]) < self.total_episodes:
+                return self.episode(pattern, match.group(1))
+
+        return 404, b'Not found'
+
+    def episode(self, pattern, pid):
+        """
+        Return (status, body) of the episode's page, JSON document or segments fragment
+        """
+        i = int(pid[1:]) % len(self.templates)
+        if pattern == PROGRAMME_JSON_PATH:
+            return 200, json.dumps({'programme': dict(self.fragments[i][0], pid=pid)}).encode('utf-8')
+        if pattern == SEGMENTS_PATH:
+            segments = self.fragments[i][1]
+            return (200, segments) if segments is not None else (404, b'Not found')
+        return 200, self.templates[i]
+
+    @property
+    def stats(self):
+        total = sum(self.outcomes.values())
+        return f'Requests: {total}, ' + ', '.join(f'{k}: {v}' for k, v in sorted(self.outcomes.items()))
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    # Keep connections open, as the BBC does, so the crawler's session pool is used
+    protocol_version = 'HTTP/1.1'
+    # Set by make_server
+    site = None
+
+    def do_GET(self):
+        delay, outcome, error_status = self.site.choose()
+        if delay:
+            time.sleep(delay)
+
+        if outcome == RESET:
+            # Close with RST instead of FIN
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            self.close_connection = True
+            self.connection.close()
+            return
+
+        path, _, query = self.path.partition('?')
+        status, body = self.site.page(self.headers.get('Host', ''), path, query)
+        headers = {'Content-Type': 'text/html; charset=utf-8'}
+        if outcome == THROTTLE:
+            status, body = 429, b'Too many requests'
+            headers['Retry-After'] = str(self.site.retry_after)
+        elif outcome == ERROR:
+            status, body = error_status, b'Server error'
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        if outcome == DRIP:
+            for i in range(0, len(body), DRIP_CHUNK_SIZE):
+                self.wfile.write(body[i:i + DRIP_CHUNK_SIZE])
+                self.wfile.flush()
+                time.sleep(self.site.drip_delay)
+        else:
+            self.wfile.write(body)
+
+    def finish(self):
+        try:
+            super().finish()
+        except OSError:
+            # The connection was reset
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Errors from reset connections are expected
+        pass
+
+
+def make_server(site, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    handler = type('Handler', (StandInRequestHandler,), {'site': site})
+    return StandInServer((host, port), handler)
+
+
+def serve_in_thread(site, host=DEFAULT_HOST, port=0):
+    """
+    Start stand-in server in a background thread. Return (server, listing URL).
+    """
+    server = make_server(site, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_port}{LISTING_PATH}?page=%s'
+
+
+def add_site_arguments(cmdline):
+    cmdline.add_argument('--episodes', type=int, default=DEFAULT_EPISODES,
+                         help=f'Number of episodes (default is {DEFAULT_EPISODES})')
+    cmdline.add_argument('--latency', type=parse_latency,
+                         help='Distribution of response delay eg constant:0.05, uniform:0.01,0.2, '
+                         'exponential:0.1 or lognormal:-3,0.5 (seconds; default is no delay)')
+    cmdline.add_argument('--throttle-rate', type=float, default=0,
+                         help='Fraction of responses that are 429 Too Many Requests')
+    cmdline.add_argument('--error-rate', type=float, default=0,
+                         help='Fraction of responses that are 500, 502 or 503')
+    cmdline.add_argument('--drip-rate', type=float, default=0,
+                         help='Fraction of responses whose body is sent slowly')
+    cmdline.add_argument('--reset-rate', type=float, default=0,
+                         help='Fraction of requests where the connection is reset')
+    cmdline.add_argument('--publish-every', type=int, default=0,
+                         help='Publish a new episode every this many listing page requests '
+                         '(default is never)')
+    cmdline.add_argument('--retry-after', type=float, default=DEFAULT_RETRY_AFTER,
+                         help=f'Retry-After seconds sent with 429 responses (default is {DEFAULT_RETRY_AFTER})')
+    cmdline.add_argument('--seed', type=int, default=0,
+                         help='Seed for the random choice of delays and faults')
+
+
+def site_from_args(args):
+    return StandInBBC(args.episodes, args.latency, args.throttle_rate, args.error_rate,
+                      args.drip_rate, args.reset_rate, args.retry_after,
+                      publish_every=args.publish_every, seed=args.seed)
+
+
+def setup_command_line():
+    cmdline = argparse.ArgumentParser(prog='Stand-in BBC website')
+    cmdline.add_argument('--host', default=DEFAULT_HOST,
+                         help=f'Address to listen on (default is {DEFAULT_HOST})')
+    cmdline.add_argument('--port', type=int, default=DEFAULT_PORT,
+                         help=f'Port to listen on (default is {DEFAULT_PORT})')
+    add_site_arguments(cmdline)
+    return cmdline
+
+
+def main():
+    args = setup_command_line().parse_args()
+    site = site_from_args(args)
+    server = make_server(site, args.host, args.port)
+    print(f'Serving {site.episodes} episodes on {site.pages} listing pages')
+    print(f'Listing URL: http://{args.host}:{server.server_port}{LISTING_PATH}?page=%s')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(site.stats)
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
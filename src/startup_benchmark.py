@@ -0,0 +1,87 @@
+"""
+=============================================================================
+File: startup_benchmark.py
+Description: Measure how long each did.py command takes to start.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+
+To run:
+
+    python startup_benchmark.py [--runs 10] [--max-ms 100]
+
+Each command's module is imported in a new Python process, as did.py does, and the
+fastest of several runs is reported after subtracting the time Python itself takes
+to start. Commands that only use the dataset (did.DATASET_COMMANDS) are also
+checked for importing any of did.HEAVY_MODULES. With --max-ms, the exit status is
+1 if a dataset command is slower than that or imports a heavy module.
+=============================================================================
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import did
+
+DEFAULT_RUNS = 10
+
+# Prints modules in HEAVY_MODULES imported by loading the command given
+LOAD_COMMAND = ('import did, sys, json; did.load(sys.argv[1]); '
+                'print(json.dumps([m for m in did.HEAVY_MODULES if m in sys.modules]))')
+
+
+def run_python(args):
+    """
+    Return (seconds taken, stdout) of running python with args in this directory
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable] + args, capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return time.perf_counter() - start, result.stdout
+
+
+def heavy_modules_loaded(command):
+    """
+    Return modules in did.HEAVY_MODULES imported by loading command
+    """
+    return json.loads(run_python(['-c', LOAD_COMMAND, command])[1])
+
+
+def startup_time(command, runs=DEFAULT_RUNS):
+    """
+    Return fastest time, in seconds, to load command over runs, less Python's start up
+    """
+    baseline = min(run_python(['-c', 'pass'])[0] for _ in range(runs))
+    return max(0, min(run_python(['-c', LOAD_COMMAND, command])[0] for _ in range(runs)) - baseline)
+
+
+def setup_command_line():
+    cmdline = argparse.ArgumentParser(prog='Desert Island Discs startup benchmark')
+    cmdline.add_argument('commands', nargs='*', default=list(did.COMMANDS),
+                         help='Commands to measure (default is all)')
+    cmdline.add_argument('--runs', type=int, default=DEFAULT_RUNS,
+                         help=f'Times to start each command (default is {DEFAULT_RUNS})')
+    cmdline.add_argument('--max-ms', type=float,
+                         help='Fail if a dataset command takes longer than this to start')
+    return cmdline
+
+
+def main():
+    args = setup_command_line().parse_args()
+    failed = False
+    print(f'{"command":12}{"ms":>8}  heavy modules imported')
+    for command in args.commands:
+        ms = startup_time(command, args.runs) * 1000
+        heavy = heavy_modules_loaded(command)
+        print(f'{command:12}{ms:8.0f}  {", ".join(heavy)}')
+        if command in did.DATASET_COMMANDS and args.max_ms is not None and (heavy or ms > args.max_ms):
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
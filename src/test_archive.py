@@ -0,0 +1,117 @@
+import unittest
+import contextlib
+import glob
+import io
+import os
+import tempfile
+
+from archive import *
+from dataset import CastawayReader, CastawayWriter
+from scraper import DesertIslandDiscsCastaway, DesertIslandDiscsParser, reextract
+from standin_bbc import listing_page, episode_pid
+from writers import open_writer
+
+EPISODE_PAGES = '../data/BBC Radio 4 - Desert Island Discs, *.html'
+
+
+class TestPageArchive(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.archive = PageArchive(os.path.join(self.dir.name, 'pages.warc.gz'))
+        self.archive.write('https://www.bbc.co.uk/programmes/b001', 200,
+                           {'Content-Type': 'text/html', 'Set-Cookie': 'x'}, b'<h1>One</h1>')
+        self.archive.write('https://www.bbc.co.uk/programmes/b002', 404, {}, b'Not found')
+        self.archive.write('https://www.bbc.co.uk/programmes/b001', 200, {}, b'<h1>One again</h1>')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_get_latest(self):
+        record = self.archive.get('https://www.bbc.co.uk/programmes/b001')
+        self.assertEqual(record.body, b'<h1>One again</h1>')
+        self.assertEqual(record.status, 200)
+        self.assertIsNone(self.archive.get('https://www.bbc.co.uk/programmes/b003'))
+
+    def test_records_streamed_in_order(self):
+        records = list(self.archive.records(latest_only=False))
+        self.assertEqual([r.body for r in records],
+                         [b'<h1>One</h1>', b'Not found', b'<h1>One again</h1>'])
+        self.assertEqual(records[0].headers, {'Content-Type': 'text/html'})
+        self.assertEqual(records[1].status, 404)
+
+    def test_records_latest_only(self):
+        records = list(self.archive.records())
+        self.assertEqual([r.body for r in records], [b'Not found', b'<h1>One again</h1>'])
+
+    def test_index_kept_in_memory(self):
+        self.archive.get('https://www.bbc.co.uk/programmes/b001')
+        os.remove(self.archive.index_filename)
+        self.archive.write('https://www.bbc.co.uk/programmes/b003', 200, {}, b'<h1>Three</h1>')
+        self.assertEqual(self.archive.get('https://www.bbc.co.uk/programmes/b003').body, b'<h1>Three</h1>')
+        self.assertEqual(self.archive.get('https://www.bbc.co.uk/programmes/b001').body,
+                         b'<h1>One again</h1>')
+
+    def test_missing_index_rebuilt(self):
+        with open(self.archive.index_filename) as f:
+            index = f.read()
+        os.remove(self.archive.index_filename)
+
+        archive = PageArchive(self.archive.filename)
+        records = list(archive.records())
+        self.assertEqual([r.body for r in records], [b'Not found', b'<h1>One again</h1>'])
+        with open(self.archive.index_filename) as f:
+            # the fetch dates are the same as the archive's
+            self.assertEqual(f.read(), index)
+
+    def test_large_body(self):
+        body = os.urandom(3 * READ_SIZE)
+        self.archive.write('https://www.bbc.co.uk/programmes/b004', 200, {}, body)
+        self.assertEqual(list(self.archive.records())[-1].body, body)
+
+    def test_warc_format(self):
+        data = record_as_warc('http://example.com', 200, {}, b'body', '2020-01-01T00:00:00Z')
+        self.assertTrue(data.startswith(b'WARC/1.0\r\nWARC-Type: response\r\n'))
+        self.assertEqual(parse_warc(data).body, b'body')
+
+
+class TestReextract(unittest.TestCase):
+    def test_reextract(self):
+        """
+        Episodes re-extracted from an archive are those extracted from the pages, with
+        castaways' names and jobs from the archived listing page
+        """
+        parser = DesertIslandDiscsParser()
+        pages = []
+        for filename in sorted(glob.glob(EPISODE_PAGES))[:4]:
+            with open(filename, 'rb') as f:
+                pages.append(f.read())
+
+        with tempfile.TemporaryDirectory() as directory:
+            archive = PageArchive(os.path.join(directory, 'pages.warc.gz'))
+            expected, output = [os.path.join(directory, name) for name in ['expected.csv', 'episodes.csv']]
+            # The last episode isn't listed so its name comes from the episode title
+            archive.write('https://www.bbc.co.uk/programmes/b006qnmr/episodes/guide?page=1', 200, {},
+                          listing_page('www.bbc.co.uk', 1, 1, len(pages) - 1))
+            with open_writer(CastawayWriter(), expected, None) as writer:
+                for i, page in enumerate(pages):
+                    url = f'http://www.bbc.co.uk/programmes/{episode_pid(i)}'
+                    # a superseded fetch
+                    archive.write(url, 200, {}, pages[-1 - i])
+                    archive.write(url, 200, {}, page)
+                    episode = parser.parse_episode_page(page)
+                    name, job = (f'Castaway {i}', f'job {i}') if i < len(pages) - 1 else \
+                        parser.name_and_job(episode.title)
+                    writer.write(DesertIslandDiscsCastaway(name, job, url, episode))
+            archive.write('http://www.bbc.co.uk/programmes/x9999999', 404, {}, b'Not found')
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                count = reextract(archive.filename, output, dataset=os.path.join(directory, 'none.csv'),
+                                  processes=2)
+            rows = [list(CastawayReader().rows(filename)) for filename in [expected, output]]
+
+        self.assertEqual(count, len(pages))
+        self.assertEqual(rows[1], rows[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import contextlib
+import io
+import os
+import tempfile
+
+from did import *
+from startup_benchmark import heavy_modules_loaded
+from test_writers import castaway, write
+
+
+class TestDid(unittest.TestCase):
+    def test_dataset_commands_are_light(self):
+        for command in DATASET_COMMANDS:
+            self.assertEqual(heavy_modules_loaded(command), [], command)
+
+    def test_every_command_has_main(self):
+        for command in COMMANDS:
+            self.assertTrue(callable(load(command).main), command)
+
+    def test_export(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'episodes.csv')
+            write(filename, [castaway(pid='b001'), castaway(pid='b002')])
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                main(['export', filename, '--format', 'jsonl'])
+
+        self.assertEqual(len(output.getvalue().splitlines()), 2)
+        self.assertIn('"pid": "b002"', output.getvalue())
+
+    def test_export_replace(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'episodes.csv')
+            output = os.path.join(directory, 'episodes.jsonl')
+            write(filename, [castaway(pid='b001')])
+            for _ in range(2):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    main(['export', filename, '--output', output, '--replace'])
+            write(filename, [castaway(pid='b002')])
+            with contextlib.redirect_stdout(io.StringIO()):
+                main(['export', filename, '--output', output, '--replace'])
+
+            with open(output, encoding='utf-8') as f:
+                self.assertEqual(len(f.readlines()), 2)
+            self.assertEqual(sorted(os.listdir(directory)), ['episodes.csv', 'episodes.jsonl'])
+
+    def test_unknown_command(self):
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit) as e:
+            main(['scrape'])
+        self.assertEqual(e.exception.code, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import os
+import tempfile
+
+from diff_datasets import *
+from scraper import CastawayWriter, MAX_TRACKS
+from writers import open_writer
+from test_writers import castaway
+
+
+def record(pid, **fields):
+    result = CastawayWriter().castaway_as_record(castaway(pid=pid))
+    result.update(fields)
+    return result
+
+
+class TestDiffDatasets(unittest.TestCase):
+    def test_same_episodes_in_different_formats(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ('old.csv', 'new.jsonl'):
+                with open_writer(CastawayWriter(), os.path.join(directory, name)) as writer:
+                    for pid in ('b001', 'b002'):
+                        writer.write(castaway(tracks=MAX_TRACKS + 1, pid=pid))
+
+            reader = CastawayReader()
+            diff = DatasetDiff().compare(read_records(reader, os.path.join(directory, 'old.csv')),
+                                         reversed(list(read_records(reader, os.path.join(directory, 'new.jsonl')))))
+
+        self.assertTrue(diff.identical)
+        self.assertEqual(diff.unchanged, 2)
+
+    def test_field_changes(self):
+        old = [record('b001', book='Ulysses', luxury=None),
+               record('b002', presenter='Sue Lawley'),
+               record('b003')]
+        new = [record('b001', book='Middlemarch', luxury='Piano', tracks=[]),
+               record('b002', presenter=''),
+               record('b004'),
+               record('b004')]
+
+        diff = DatasetDiff(samples=1).compare(old, new)
+
+        self.assertFalse(diff.identical)
+        self.assertEqual(diff.changed, 2)
+        self.assertEqual(diff.counts['book'], {CHANGED: 1})
+        self.assertEqual(diff.counts['luxury'], {ADDED: 1})
+        self.assertEqual(diff.counts['presenter'], {REMOVED: 1})
+        self.assertEqual(diff.counts['tracks'], {REMOVED: 1})
+        self.assertEqual(diff.examples[('book', CHANGED)], [('b001', 'Ulysses', 'Middlemarch')])
+        self.assertEqual(diff.only_new, ['b004'])
+        self.assertEqual(diff.only_old, ['b003'])
+        self.assertEqual(diff.duplicates, 1)
+        self.assertIn("book changed b001: 'Ulysses' -> 'Middlemarch'", str(diff))
+
+
+    def test_last_duplicate_compared(self):
+        old = [record('b001', book='Ulysses'),
+               record('b001', book='Middlemarch')]
+        new = [record('b001', book='Ulysses'),
+               record('b001', book='Middlemarch'),
+               record('b002', book='Emma'),
+               record('b002', book='Persuasion')]
+
+        diff = DatasetDiff().compare(old, new)
+
+        self.assertEqual(diff.unchanged, 1)
+        self.assertEqual(diff.changed, 0)
+        self.assertEqual(diff.only_new, ['b002'])
+        self.assertEqual(diff.duplicates, 3)
+        self.assertEqual((diff.old_count, diff.new_count), (2, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,10 @@
 import unittest
+import contextlib
+import io
 from bs4 import BeautifulSoup
 
 from scraper import *
+from fixtures import use_fixtures
 import html
 TEST_PROGRAMME_LISTING_1 = "../data/BBC Radio 4 - Desert Island Discs - Available now.html"
 TEST_EPISODE_1 = "../data/BBC Radio 4 - Desert Island Discs, Cilla Black.html"
@@ -26,6 +29,21 @@ TEST_EPISODE_URL_9 = 'https://www.bbc.co.uk/programmes/b06d29bf'
 TEST_EPISODE_URL_10 = 'https://www.bbc.co.uk/programmes/b08bz0rz' #David Beckham
 TEST_EPISODE_URL_11 = 'https://www.bbc.co.uk/programmes/m001c678'
 TEST_EPISODE_URL_12 = 'https://www.bbc.co.uk/programmes/m000fx1k'
+TEST_EPISODE_FILES = [TEST_EPISODE_1, TEST_EPISODE_2, TEST_EPISODE_3, TEST_EPISODE_4, TEST_EPISODE_5,
+                      TEST_EPISODE_6, TEST_EPISODE_7, TEST_EPISODE_8, TEST_EPISODE_9]
+
+# Pages for TEST_EPISODE_URL_* (see fixtures.py)
+TEST_FIXTURES = '../data/fixtures/episodes.warc.gz'
+
+
+def setUpModule():
+    use_fixtures(TEST_FIXTURES)
+
+
+def tearDownModule():
+    set_fetcher(None)
+
+
 class TestEpisode(unittest.TestCase):
     def setUp(self):
         self.parser = DesertIslandDiscsParser()
@@ -272,6 +290,95 @@ class TestEpisode(unittest.TestCase):
         episode = self.process_episode_url(TEST_EPISODE_URL_10)
         self.assertEqual(episode.presenter, 'Kirsty Young')
 
+    def test_layout_classic(self):
+        """
+        Classic episodes have no segments; tracks are in the long description.
+        """
+        with open(TEST_EPISODE_2, 'r') as episode_file:
+            layout = PageLayout(BeautifulSoup(episode_file.read(), SOUP_PARSER))
+        self.assertEqual(layout.family, LAYOUT_CLASSIC)
+
+    def test_layout_tracklist(self):
+        with open(TEST_EPISODE_1, 'r') as episode_file:
+            layout = PageLayout(BeautifulSoup(episode_file.read(), SOUP_PARSER))
+        self.assertEqual(layout.family, LAYOUT_TRACKLIST)
+
+    def test_layout_dispatch(self):
+        """
+        The generic extraction methods only run when the specialized extractor misses
+        a field
+        """
+        calls = []
+
+        class Parser(DesertIslandDiscsParser):
+            def _extract_from_segments_alt(self, name, soup, found):
+                calls.append(name)
+                super()._extract_from_segments_alt(name, soup, found)
+
+        parser = Parser()
+        with open(TEST_EPISODE_1, 'r') as episode_file:
+            episode = parser.parse_episode(BeautifulSoup(episode_file.read(), SOUP_PARSER))
+        self.assertTrue(episode.layout_hit)
+        self.assertEqual(calls, [])
+
+        with open(TEST_EPISODE_4, 'r') as episode_file:
+            # Sir Malcolm Sargent has no book or favourite track
+            episode = parser.parse_episode(BeautifulSoup(episode_file.read(), SOUP_PARSER))
+        self.assertFalse(episode.layout_hit)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(parser.layout_stats.hits[LAYOUT_TRACKLIST], 1)
+        self.assertEqual(parser.layout_stats.misses[LAYOUT_TRACKLIST], 1)
+
+    def test_streamed_page_stops_after_content(self):
+        """
+        A page read until EpisodeEndScanner says stop has everything extracted
+        """
+        parser = DesertIslandDiscsParser()
+        for filename in TEST_EPISODE_FILES:
+            with open(filename, 'rb') as episode_file:
+                page = episode_file.read()
+            scanner = EpisodeEndScanner()
+            chunks = [page[i:i + 1000] for i in range(0, len(page), 1000)]
+            read = next(i for i, chunk in enumerate(chunks) if scanner(chunk)) + 1
+            truncated = b''.join(chunks[:read])
+
+            self.assertLess(len(truncated), len(page) * 0.9, filename)
+            self.assertEqual(str(parser.parse_episode_page(truncated)),
+                             str(parser.parse_episode_page(page)), filename)
+
+    def test_long_description_single_pass(self):
+        """
+        Tracks, choices and presenter all come from one pass over the description
+        """
+        description = LongDescriptionParser().parse(
+            'Kirsty Young\'s castaway is Jane Doe. DISC ONE: Elvis Presley - Rocket Man '
+            'DISC TWO: Over the Rainbow by Judy Garland DISC SEVEN – Mozart’s Clarinet Quintet'
+            'BOOK CHOICE: War and Peace LUXURY ITEM: A piano '
+            'CASTAWAY’S FAVOURITE: Over the Rainbow by Judy Garland', 'Jane Doe')
+        self.assertEqual(len(description.tracks), 3)
+        self.assertEqual(description.tracks[0].artist, 'Elvis Presley')
+        self.assertEqual(description.tracks[1].artist, 'Judy Garland')
+        self.assertEqual(description.tracks[1].song, 'Over the Rainbow')
+        self.assertEqual(description.tracks[2].song, 'Mozart’s Clarinet Quintet')
+        self.assertEqual(description.book, 'War and Peace')
+        self.assertEqual(description.luxury, 'A piano')
+        self.assertEqual(description.favourite_track,
+                         'Over the Rainbow by Judy Garland')
+        self.assertEqual(description.presenter, 'Kirsty Young')
+
+    def test_long_description_mixed_case(self):
+        description = LongDescriptionParser().parse(
+            'Disc one: Louis Prima - I Wan\'na Be Like You (The Jungle Book: Original Soundtrack) '
+            'Disc two: Over the Rainbow by Judy Garland')
+        self.assertEqual(len(description.tracks), 2)
+        self.assertEqual(description.tracks[0].artist, 'Louis Prima')
+        self.assertEqual(description.tracks[0].song,
+                         'I Wan\'na Be Like You (The Jungle Book: Original Soundtrack)')
+        self.assertEqual(description.book, '')
+
+        description = LongDescriptionParser().parse('Book: War and Peace')
+        self.assertEqual(description.book, 'War and Peace')
+
     def test_clean_string(self):
         s = '  <p>Luxury: Ice machine or hot water bottle</p>  '
         self.assertEqual(clean_string(
@@ -282,5 +389,216 @@ class TestEpisode(unittest.TestCase):
             s2), 'The Leopard (In Italian & English) by Giuseppe di Lampedusa')
 
 
+class TestListing(unittest.TestCase):
+    def setUp(self):
+        self.parser = DesertIslandDiscsParser()
+        with open(TEST_PROGRAMME_LISTING_1, 'r') as listing_file:
+            self.soup = BeautifulSoup(listing_file.read(), SOUP_PARSER)
+
+    def test_listing_castaways(self):
+        castaways = self.parser.listing_castaways(self.soup)
+        self.assertEqual(len(castaways), 10)
+        self.assertEqual(castaways[0].name, 'Michael Lewis')
+        self.assertEqual(castaways[0].job, 'writer')
+        self.assertEqual(castaways[0].episode_url,
+                         'https://www.bbc.co.uk/programmes/m000d6s1')
+
+    def test_last_listing_page(self):
+        self.assertEqual(self.parser.last_listing_page(self.soup), 225)
+        self.assertIsNone(self.parser.last_listing_page(
+            BeautifulSoup('<p>No pages</p>', SOUP_PARSER)))
+
+    def test_find_last_page(self):
+        for last in [1, 2, 3, 8, 9, 225]:
+            self.assertEqual(find_last_page(lambda page: page <= last), last)
+
+    def test_read_urls(self):
+        lines = ['https://www.bbc.co.uk/programmes/m000d6s1\n', '\n', '# comment\n',
+                 '  https://www.bbc.co.uk/programmes/b002  \n']
+        self.assertEqual(list(read_urls(lines)), ['https://www.bbc.co.uk/programmes/m000d6s1',
+                                                  'https://www.bbc.co.uk/programmes/b002'])
+
+    def test_castaway_name_from_episode(self):
+        castaway = DesertIslandDiscsCastaway(None, None, TEST_EPISODE_URL_1, None)
+        with open(TEST_EPISODE_3, 'rb') as episode_file:
+            self.parser.parse_castaway_episode(castaway, episode_file.read())
+        self.assertEqual(castaway.name, 'Isabella Tree')
+        self.assertEqual(castaway.job, 'writer and conservationist')
+
+
+class Response:
+    def __init__(self, content):
+        self.status_code = 200
+        self.content = content
+        self.headers = {}
+
+
+class FakeSession:
+    """
+    Return the same page for every URL
+    """
+
+    def __init__(self, content):
+        self.content = content
+
+    def get(self, url, **kwargs):
+        return Response(self.content)
+
+
+class TestCanary(unittest.TestCase):
+    def setUp(self):
+        with open(TEST_EPISODE_3, 'rb') as episode_file:
+            self.page = episode_file.read()
+        parser = DesertIslandDiscsParser()
+        castaway = parser.parse_castaway_episode(
+            DesertIslandDiscsCastaway('Isabella Tree', 'writer', TEST_EPISODE_URL_1, None), self.page)
+        row = CastawayWriter().castaway_as_dict(castaway)
+        self.rows = [dict(row, URL=f'https://www.bbc.co.uk/programmes/x{i}',
+                          **{'Date first broadcast': f'{1950 + 10 * (i % 5)}-01-01'})
+                     for i in range(20)]
+
+    def tearDown(self):
+        use_fixtures(TEST_FIXTURES)
+
+    def canary(self, page):
+        set_fetcher(Fetcher(RateLimiter(1000, max_rate=1000), session=FakeSession(page)))
+        return Canary(Crawler(DesertIslandDiscsParser(), setup_command_line().parse_args([])))
+
+    def test_stratified_sample(self):
+        sample = stratified_sample(self.rows, 5, broadcast_decade)
+        self.assertEqual(sorted(broadcast_decade(row) for row in sample),
+                         ['1950s', '1960s', '1970s', '1980s', '1990s'])
+        self.assertEqual(len(stratified_sample(self.rows, 50, broadcast_decade)), 20)
+
+    def test_unchanged_site_passes(self):
+        canary = self.canary(self.page)
+        self.assertTrue(canary.run(self.rows, 10))
+        self.assertEqual(len(canary.results), 10)
+        self.assertEqual({layout for _, _, layout in canary.results}, {LAYOUT_TRACKLIST})
+
+    def test_redesigned_site_fails(self):
+        canary = self.canary(b'<html><body><h1>Isabella Tree</h1><p>New design</p></body></html>')
+        self.assertFalse(canary.run(self.rows, 10))
+        self.assertIn('Book', canary.failed_fields())
+        self.assertIn(TRACKS, canary.failed_fields())
+
+
+class TestStructured(unittest.TestCase):
+    def tearDown(self):
+        use_fixtures(TEST_FIXTURES)
+
+    def test_no_programme_json(self):
+        # Every URL, including that of the JSON document, returns the episode page
+        with open(TEST_EPISODE_3, 'rb') as episode_file:
+            page = episode_file.read()
+        set_fetcher(Fetcher(RateLimiter(1000, max_rate=1000), session=FakeSession(page)))
+        parser = DesertIslandDiscsParser(structured=True)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            fetched = parser.fetch_episode(DesertIslandDiscsCastaway(None, None, TEST_EPISODE_URL_1, None))
+
+        self.assertEqual(fetched, page)
+
+    def test_is_structured_url(self):
+        self.assertTrue(is_structured_url(TEST_EPISODE_URL_1 + '.json'))
+        self.assertTrue(is_structured_url(TEST_EPISODE_URL_1 + '/segments.inc'))
+        self.assertFalse(is_structured_url(TEST_EPISODE_URL_1))
+
+
+class TestPresenterIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = PresenterIndex(min_era_episodes=2)
+        for date in ['1950-01-01', '1950-02-01', '1950-03-01']:
+            self.index.add(date, 'Roy Plomley')
+        # guest presenter: too short a run to be an era
+        self.index.add('1950-04-01', 'Eamonn Andrews')
+        for date in ['1950-05-01', '1950-06-01']:
+            self.index.add(date, 'Roy Plomley')
+        for date in ['1990-01-01', '1991-01-01']:
+            self.index.add(date, 'Sue Lawley')
+
+    def test_eras(self):
+        self.assertEqual(self.index.eras, [['1950-01-01', '1950-06-01', 'Roy Plomley'],
+                                           ['1990-01-01', '1991-01-01', 'Sue Lawley']])
+
+    def test_lookup(self):
+        self.assertEqual(self.index.lookup('1950-04-01'), 'Roy Plomley')
+        self.assertEqual(self.index.lookup('1990-06-01'), 'Sue Lawley')
+
+    def test_lookup_outside_eras(self):
+        self.assertEqual(self.index.lookup('1970-01-01'), '')
+        self.assertEqual(self.index.lookup('2020-01-01'), '')
+        self.assertEqual(self.index.lookup(''), '')
+
+    def test_settled(self):
+        self.assertTrue(self.index.settled('1950-03-01'))
+        # near the ends of an era
+        self.assertFalse(self.index.settled('1950-01-15'))
+        self.assertFalse(self.index.settled('1990-12-20'))
+        # the guest presenter's date
+        self.assertFalse(self.index.settled('1950-04-01'))
+        self.assertFalse(self.index.settled('1970-01-01'))
+
+    def test_new_era_detected(self):
+        self.index.record('2020-01-01', 'Lauren Laverne')
+        self.index.record('2020-02-01', 'Lauren Laverne')
+        self.assertEqual(self.index.lookup('2020-01-15'), 'Lauren Laverne')
+
+    def test_parse_with_index(self):
+        parser = DesertIslandDiscsParser(presenter_index=self.index)
+        with open(TEST_EPISODE_4, 'r') as episode_file:
+            # Sir Malcolm Sargent was broadcast 1955-04-28, outside the known eras
+            episode = parser.parse_episode(BeautifulSoup(episode_file.read(), SOUP_PARSER))
+        self.assertEqual(episode.presenter, 'Roy Plomley')
+        self.assertEqual(self.index.misses, 1)
+
+    def test_mined_presenter_not_overridden(self):
+        for date in ['1984-04-14', '1984-12-01']:
+            self.index.add(date, 'Michael Parkinson')
+        parser = DesertIslandDiscsParser(presenter_index=self.index)
+        with open(TEST_EPISODE_6, 'r') as episode_file:
+            # Leo McKern, 1984-04-28, is near the start of the era so is mined
+            episode = parser.parse_episode(BeautifulSoup(episode_file.read(), SOUP_PARSER))
+        self.assertEqual(episode.presenter, 'Roy Plomley')
+        self.assertTrue(episode.presenter_mined)
+        self.assertEqual(self.index.conflicts, 1)
+
+    def test_settled_presenter_not_mined(self):
+        for date in ['1984-01-01', '1984-12-01']:
+            self.index.add(date, 'Michael Parkinson')
+
+        mined = []
+
+        class Parser(DesertIslandDiscsParser):
+            def extract_presenter(self, s, castaway):
+                mined.append(s)
+                return super().extract_presenter(s, castaway)
+
+        with open(TEST_EPISODE_6, 'r') as episode_file:
+            # Leo McKern, 1984-04-28
+            episode = Parser(presenter_index=self.index).parse_episode(
+                BeautifulSoup(episode_file.read(), SOUP_PARSER))
+        self.assertEqual(episode.presenter, 'Michael Parkinson')
+        self.assertFalse(episode.presenter_mined)
+        self.assertEqual(episode.book, 'Encyclopaedia')
+        self.assertEqual(mined, [])
+        self.assertEqual(self.index.confirmations, 0)
+
+    def test_dash_titled_repeat(self):
+        for date in ['2019-01-01', '2019-12-01']:
+            self.index.add(date, 'Lauren Laverne')
+        parser = DesertIslandDiscsParser(presenter_index=self.index)
+        with open(TEST_EPISODE_2, 'r') as episode_file:
+            # repeat broadcast 2019-08-18 of an episode presented by Kirsty Young
+            page = episode_file.read().replace('Classic Desert Island Discs: ',
+                                               'Classic Desert Island Discs - ')
+        soup = BeautifulSoup(page, SOUP_PARSER)
+        self.assertTrue(is_classic_episode(soup.find('h1').text))
+        episode = parser.parse_episode(soup)
+        self.assertEqual(episode.presenter, 'Kirsty Young')
+        self.assertEqual(parser.name_and_job(episode.title), ('Freddie Flintoff', ''))
+        self.assertEqual(self.index.hits + self.index.misses, 0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+import os
+import tempfile
+import time
+
+from extraction_cache import *
+from scraper import DesertIslandDiscsParser, DesertIslandDiscsEpisode, PresenterIndex, \
+    extractor_version
+
+PAGE = '''<html><body><h1>Sir David Attenborough</h1>
+<div class="segments-list"><ul>
+<li class="segments-list__item--music"><div class="segment__track">
+<h3><span class="artist">Ludwig van Beethoven</span></h3>
+<p><span>Symphony No. 6</span></p></div></li>
+</ul></div>
+<div class="text--prose"><p>BOOK CHOICE: The Origin of Species</p>
+<p>LUXURY: A piano</p></div>
+</body></html>'''.encode('utf-8')
+
+
+class TestExtractionCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'cache.db')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def cache(self, version='v1', **kwargs):
+        cache = ExtractionCache(self.filename, version, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_put_get(self):
+        cache = self.cache()
+        self.assertIsNone(cache.get(b'page'))
+        cache.put(b'page', {'title': 'One'})
+        self.assertEqual(cache.get(b'page'), {'title': 'One'})
+        self.assertIsNone(cache.get(b'other page'))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_new_version_invalidates(self):
+        self.cache('v1').put(b'page', {'title': 'One'})
+        self.assertIsNone(self.cache('v2').get(b'page'))
+        self.assertIsNone(self.cache('v1').get(b'page'))
+
+    def test_max_age(self):
+        self.cache().put(b'page', {'title': 'One'})
+        self.assertIsNotNone(self.cache(max_age_days=1).get(b'page'))
+        time.sleep(0.01)
+        self.assertIsNone(self.cache(max_age_days=0).get(b'page'))
+
+    def test_max_size_removes_least_recently_used(self):
+        cache = self.cache()
+        for i in range(3):
+            cache.put(b'page %d' % i, {'data': 'x' * 1000})
+            time.sleep(0.01)
+        cache.get(b'page 0')
+
+        cache = self.cache(max_size_mb=2500 / 1024 / 1024)
+        self.assertIsNotNone(cache.get(b'page 0'))
+        self.assertIsNone(cache.get(b'page 1'))
+        self.assertIsNotNone(cache.get(b'page 2'))
+
+    def test_put_evicts(self):
+        cache = self.cache(max_size_mb=2500 / 1024 / 1024)
+        for i in range(3):
+            cache.put(b'page %d' % i, {'data': 'x' * 1000})
+            time.sleep(0.01)
+        self.assertIsNone(cache.get(b'page 0'))
+        self.assertIsNotNone(cache.get(b'page 2'))
+        self.assertLessEqual(cache.size, 2500)
+
+    def test_context_in_key(self):
+        cache = self.cache()
+        cache.put(b'page', {'title': 'One'}, 'Castaway')
+        self.assertIsNone(cache.get(b'page'))
+        self.assertEqual(cache.get(b'page', 'Castaway'), {'title': 'One'})
+
+    def test_episode_from_cache(self):
+        parser = DesertIslandDiscsParser(cache=self.cache(extractor_version()))
+        parsed = parser.parse_episode_page(PAGE)
+        cached = parser.parse_episode_page(PAGE)
+
+        self.assertEqual(parser.cache.hits, 1)
+        self.assertIsInstance(cached, DesertIslandDiscsEpisode)
+        self.assertEqual(str(cached), str(parsed))
+        self.assertEqual(cached.book, 'The Origin of Species')
+
+    def test_cached_episode_uses_presenter_index(self):
+        """
+        The presenter index isn't part of the page so is applied to cached episodes too
+        """
+        page = PAGE.replace(b'</body>', b'<div class="broadcast-event__time beta" '
+                            b'content="2019-08-18T09:00:00+01:00"></div></body>')
+        DesertIslandDiscsParser(cache=self.cache(extractor_version())).parse_episode_page(page)
+
+        index = PresenterIndex(min_era_episodes=2)
+        for date in ['2019-01-01', '2019-12-01']:
+            index.add(date, 'Lauren Laverne')
+        parser = DesertIslandDiscsParser(cache=self.cache(extractor_version()),
+                                         presenter_index=index)
+        episode = parser.parse_episode_page(page)
+
+        self.assertEqual(parser.cache.hits, 1)
+        self.assertEqual(episode.presenter, 'Lauren Laverne')
+        self.assertEqual(index.hits, 1)
+        self.assertEqual(sum(parser.layout_stats.misses.values()), 1)
+
+    def test_cached_episode_mined_when_needed(self):
+        """
+        An episode cached with its presenter from the index is extracted again if the
+        presenter has to be mined
+        """
+        page = PAGE.replace(b'</body>', b'<p>Presenter: Lauren Laverne</p>'
+                            b'<div class="broadcast-event__time beta" '
+                            b'content="2019-08-18T09:00:00+01:00"></div></body>')
+        index = PresenterIndex(min_era_episodes=2)
+        for date in ['2019-01-01', '2019-12-01']:
+            index.add(date, 'Kirsty Young')
+        episode = DesertIslandDiscsParser(cache=self.cache(extractor_version()),
+                                          presenter_index=index).parse_episode_page(page)
+        self.assertEqual(episode.presenter, 'Kirsty Young')
+
+        parser = DesertIslandDiscsParser(cache=self.cache(extractor_version()),
+                                         presenter_index=PresenterIndex(min_era_episodes=2))
+        episode = parser.parse_episode_page(page)
+        self.assertEqual(episode.presenter, 'Lauren Laverne')
+        self.assertEqual(episode.book, 'The Origin of Species')
+        self.assertEqual(parser.presenter_index.observations, [('2019-08-18', 'Lauren Laverne')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import unittest
+import time
+
+from fetcher import *
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None, content=b''):
+        self.status_code = status_code
+        self.headers = headers if headers else {}
+        self.content = content
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeStreamedResponse:
+    """
+    Body is sent in chunks of chunk_size. As with requests, content is what has
+    been read.
+    """
+
+    def __init__(self, body, chunk_size):
+        self.status_code = 200
+        self.headers = {}
+        self.body = body
+        self.chunk_size = chunk_size
+        self.closed = False
+        self._content = None
+
+    @property
+    def content(self):
+        return self.body if self._content is None else self._content
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), self.chunk_size):
+            yield self.body[i:i + self.chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    """
+    Return the responses given, in order
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        if isinstance(response, tuple):
+            # (delay, response)
+            time.sleep(response[0])
+            response = response[1]
+        return response
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(rate=2, min_rate=0.5, max_rate=3,
+                                   clock=self.clock, sleep=self.clock.sleep)
+
+    def test_acquire_paces_requests(self):
+        for _ in range(5):
+            self.limiter.acquire()
+        # first token is available immediately; then one every 0.5s
+        self.assertAlmostEqual(self.clock.now, 2.0)
+
+    def test_backoff_is_multiplicative(self):
+        self.limiter.record(429, 0.1)
+        self.assertEqual(self.limiter.rate, 1)
+        for _ in range(2):
+            self.clock.now += BACKOFF_INTERVAL
+            self.limiter.record(503, 0.1)
+        self.assertEqual(self.limiter.rate, 0.5)
+
+    def test_speedup_is_additive(self):
+        self.limiter.record(200, 0.1)
+        self.assertAlmostEqual(self.limiter.rate, 2 + RATE_INCREASE)
+        for _ in range(100):
+            self.limiter.record(200, 0.1)
+        self.assertEqual(self.limiter.rate, 3)
+
+    def test_backoff_on_rising_latency(self):
+        self.limiter.record(200, 0.1)
+        self.limiter.record(200, 1.0)
+        self.assertLess(self.limiter.rate, 2)
+
+    def test_backoff_once_per_interval(self):
+        self.limiter.record(200, 0.1)
+        self.limiter.record(200, 1.0)
+        self.limiter.record(503, 0.1)
+        self.limiter.record(200, 5.0)
+        self.assertEqual(self.limiter.backoffs, 1)
+        self.clock.now += BACKOFF_INTERVAL
+        self.limiter.record(200, 50.0)
+        self.assertEqual(self.limiter.backoffs, 2)
+
+    def test_retry_after_pauses(self):
+        self.limiter.acquire()
+        self.limiter.record(429, 0.1, retry_after=10)
+        self.limiter.acquire()
+        self.assertGreaterEqual(self.clock.now, 10)
+
+
+class TestFetcher(unittest.TestCase):
+    def test_retries_when_throttled(self):
+        clock = FakeClock()
+        session = FakeSession([FakeResponse(429, {'Retry-After': '5'}),
+                               FakeResponse(200, content=b'page')])
+        fetcher = Fetcher(RateLimiter(clock=clock, sleep=clock.sleep), session)
+
+        self.assertEqual(fetcher.get('http://example.com').content, b'page')
+        self.assertEqual(fetcher.retries, 1)
+        self.assertGreaterEqual(clock.now, 5)
+
+    def test_timeout_raised_after_retries(self):
+        session = FakeSession([requests.exceptions.ReadTimeout()] * 2)
+        fetcher = Fetcher(RateLimiter(rate=100), session, max_retries=1)
+
+        with self.assertRaises(FetchTimeout):
+            fetcher.get('http://example.com')
+        self.assertEqual(fetcher.timeouts, 2)
+
+    def test_timeout_retried(self):
+        session = FakeSession([requests.exceptions.ConnectTimeout(),
+                               FakeResponse(200, content=b'page')])
+        fetcher = Fetcher(RateLimiter(rate=100), session)
+
+        self.assertEqual(fetcher.get('http://example.com').content, b'page')
+
+    def test_connection_reset_retried(self):
+        session = FakeSession([requests.exceptions.ChunkedEncodingError(),
+                               requests.exceptions.ConnectionError(),
+                               FakeResponse(200, content=b'page')])
+        fetcher = Fetcher(RateLimiter(rate=100), session)
+
+        self.assertEqual(fetcher.get('http://example.com').content, b'page')
+        self.assertEqual(fetcher.connection_errors, 2)
+        self.assertEqual(fetcher.timeouts, 0)
+        self.assertEqual(fetcher.retries, 2)
+
+    def test_deadline(self):
+        fetcher = Fetcher(RateLimiter(rate=100), FakeSession([]), deadline=0.01)
+        time.sleep(0.02)
+
+        with self.assertRaises(DeadlineExceeded):
+            fetcher.get('http://example.com')
+
+    def test_hedged_request(self):
+        slow = FakeResponse(200, content=b'slow')
+        session = FakeSession([(1, slow), FakeResponse(200, content=b'fast')])
+        fetcher = Fetcher(RateLimiter(rate=100), session, hedge=True)
+        fetcher.latencies.extend([0.01] * HEDGE_MIN_SAMPLES)
+
+        self.assertEqual(fetcher.get('http://example.com').content, b'fast')
+        self.assertEqual(fetcher.hedges, 1)
+        self.assertEqual(fetcher.hedge_wins, 1)
+        # the losing request's response is closed once it arrives
+        fetcher.executor.shutdown(wait=True)
+        self.assertTrue(slow.closed)
+
+    def test_stream_stops_early(self):
+        def until():
+            return lambda chunk: b'end' in chunk
+
+        fetcher = Fetcher(RateLimiter(rate=1000, max_rate=1000), stream=True, session=FakeSession(
+            [FakeStreamedResponse(b'start middle end footer', 6), FakeStreamedResponse(b'no marker', 6)]))
+
+        response = fetcher.get('http://example.com/1', until=until)
+        self.assertEqual(response.content, b'start middle end f')
+        self.assertTrue(response.truncated and response.closed)
+        response = fetcher.get('http://example.com/2', until=until)
+        self.assertEqual(response.content, b'no marker')
+        self.assertFalse(response.truncated)
+        self.assertEqual(fetcher.truncated, 1)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after('120'), 120)
+        self.assertEqual(parse_retry_after(
+            'Wed, 21 Oct 2015 07:28:00 GMT'), 0)
+        self.assertIsNone(parse_retry_after('soon'))
+        self.assertIsNone(parse_retry_after(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import os
+import tempfile
+
+from merge_shards import *
+
+HEADER = CastawayWriter().csv_header()
+
+
+def row(pid, date, book=''):
+    values = {'Castaway': f'Castaway {pid}', 'URL': f'https://www.bbc.co.uk/programmes/{pid}',
+              'Date first broadcast': date, 'Book': book}
+    return TAB.join(values.get(h, '') for h in HEADER)
+
+
+class TestMergeShards(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def shard(self, name, rows):
+        filename = os.path.join(self.dir.name, name)
+        with open(filename, 'w', encoding='utf-8', newline='') as f:
+            f.write(TAB.join(HEADER) + '\r\n')
+            for r in rows:
+                f.write(r + '\r\n')
+        return filename
+
+    def test_merge(self):
+        shard1 = self.shard('1.csv', [row('b001', '2001-01-01'), row('b003', '2003-01-01')])
+        shard2 = self.shard('2.csv', [row('b002', '2002-01-01'),
+                                      row('b001', '2001-01-01', 'War and Peace')])
+
+        rows = merge_shards([shard1, shard2])
+
+        self.assertEqual([programme_pid(r['URL']) for r in rows], ['b003', 'b002', 'b001'])
+        # the more complete duplicate is kept
+        self.assertEqual(rows[2]['Book'], 'War and Peace')
+
+    def test_write_one_header(self):
+        shard1 = self.shard('1.csv', [row('b001', '2001-01-01')])
+        output = os.path.join(self.dir.name, 'merged.csv')
+
+        write_rows(merge_shards([shard1, shard1]), output)
+
+        with open(output, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('Castaway'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import io
+import time
+import urllib.request
+
+from metrics import *
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_counters_and_gauges(self):
+        self.metrics.inc('did_episodes_total')
+        self.metrics.inc('did_episodes_total', 2)
+        self.metrics.inc('did_requests_in_flight')
+        self.metrics.dec('did_requests_in_flight')
+        self.metrics.inc('did_errors_total', type='timeout')
+        self.metrics.inc('did_errors_total', type='http_503')
+
+        self.assertEqual(self.metrics.get('did_episodes_total'), 3)
+        self.assertEqual(self.metrics.get('did_requests_in_flight'), 0)
+        self.assertEqual(self.metrics.get('did_errors_total', type='timeout'), 1)
+        self.assertEqual(self.metrics.total('did_errors_total'), 2)
+
+    def test_histogram(self):
+        h = Histogram([0.1, 1])
+        for value in [0.05, 0.05, 0.5, 5]:
+            h.observe(value)
+        self.assertEqual(h.counts, [2, 1, 1])
+        self.assertEqual(h.quantile(0.5), 0.1)
+        self.assertEqual(h.quantile(0.75), 1)
+        self.assertEqual(h.quantile(1), float('inf'))
+
+    def test_prometheus_text(self):
+        self.metrics.inc('did_errors_total', type='timeout')
+        self.metrics.observe('did_fetch_seconds', 0.2)
+
+        text = self.metrics.prometheus_text()
+
+        self.assertIn('# TYPE did_errors_total counter', text)
+        self.assertIn('did_errors_total{type="timeout"} 1', text)
+        self.assertIn('did_fetch_seconds_bucket{le="0.25"} 1', text)
+        self.assertIn('did_fetch_seconds_bucket{le="0.1"} 0', text)
+        self.assertIn('did_fetch_seconds_bucket{le="+Inf"} 1', text)
+        self.assertIn('did_fetch_seconds_count 1', text)
+
+    def test_progress_eta(self):
+        self.metrics.set('did_episodes_expected', 100)
+        self.metrics.inc('did_episodes_total', 10)
+        self.metrics.throughput_samples.append((time.monotonic() - 10, 0))
+
+        line = self.metrics.progress()
+
+        self.assertIn('episodes 10/100 10%', line)
+        self.assertIn('1.0/s', line)
+        self.assertIn('ETA 0:01:30', line)
+
+    def test_collectors(self):
+        self.metrics.add_collector(lambda m: m.set('did_cache_hits_total', 3))
+        self.metrics.set('did_cache_misses_total', 1)
+        self.assertIn('cache 75%', self.metrics.progress())
+
+    def test_progress_reporter(self):
+        output = io.StringIO()
+        ProgressReporter(60, self.metrics, output).start().stop()
+        self.assertIn('episodes 0', output.getvalue())
+
+    def test_endpoint(self):
+        self.metrics.inc('did_episodes_total', 5)
+        server = serve_metrics(0, metrics=self.metrics)
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{server.server_port}/metrics') as response:
+                text = response.read().decode('utf-8')
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIn('did_episodes_total 5', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import threading
+
+from pipeline import *
+
+
+class TestPipeline(unittest.TestCase):
+    def test_items_flow_through_stages(self):
+        results = []
+        lock = threading.Lock()
+
+        def collect(item):
+            with lock:
+                results.append(item)
+            return ()
+
+        pipeline = Pipeline([Stage('split', lambda n: [n, n + 100], workers=2),
+                             Stage('double', lambda n: [n * 2], workers=3),
+                             Stage('collect', collect)])
+        pipeline.run(range(10))
+
+        self.assertEqual(sorted(results), sorted(
+            [n * 2 for n in range(10)] + [(n + 100) * 2 for n in range(10)]))
+        self.assertEqual(pipeline.stages[1].processed, 20)
+
+    def test_errors_counted_and_skipped(self):
+        def fail_on_odd(n):
+            if n % 2:
+                raise ValueError(f'odd {n}')
+            return [n]
+
+        pipeline = Pipeline([Stage('check', fail_on_odd), Stage('sink', lambda n: ())])
+        pipeline.run(range(6))
+
+        self.assertEqual(pipeline.stages[0].errors, 3)
+        self.assertEqual(pipeline.stages[1].processed, 3)
+
+    def test_backpressure_bounds_queues(self):
+        pipeline = Pipeline([Stage('source', lambda n: [n] * 10, queue_size=2),
+                             Stage('sink', lambda n: (), queue_size=3)])
+        pipeline.run(range(20))
+
+        self.assertLessEqual(pipeline.stages[0].max_depth, 2)
+        self.assertLessEqual(pipeline.stages[1].max_depth, 3)
+        self.assertEqual(pipeline.stages[1].processed, 200)
+
+    def test_report_names_bottleneck(self):
+        pipeline = Pipeline([Stage('fast', lambda n: [n]),
+                             Stage('slow', lambda n: [sum(range(100000))])])
+        pipeline.run(range(20))
+
+        self.assertEqual(pipeline.bottleneck.name, 'slow')
+        self.assertIn('Bottleneck: slow', pipeline.report())
+
+
+if __name__ == '__main__':
+    unittest.main()
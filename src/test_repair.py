@@ -0,0 +1,75 @@
+import unittest
+
+from repair import *
+
+
+def row(tracks=MAX_TRACKS, **fields):
+    result = {h: '' for h in CastawayWriter().csv_header()}
+    result.update({'Castaway': 'Cilla Black', 'URL': 'https://www.bbc.co.uk/programmes/b001',
+                   'Book': 'Book', 'Luxury': 'Luxury', 'Favourite track': 'Song 1',
+                   'Presenter': 'Sue Lawley'})
+    for i in range(1, tracks + 1):
+        result[f'Artist {i}'] = f'Artist {i}'
+        result[f'Song {i}'] = f'Song {i}'
+    result.update({k.replace('_', ' ').capitalize(): v for k, v in fields.items()})
+    return result
+
+
+class TestRepair(unittest.TestCase):
+    def test_complete_row(self):
+        self.assertEqual(missing_fields(row()), [])
+
+    def test_missing_fields(self):
+        self.assertEqual(missing_fields(row(book='', presenter='')), ['Book', 'Presenter'])
+        self.assertEqual(missing_fields(row(tracks=6)), [TRACKS])
+        self.assertEqual(missing_fields(row(tracks=6), ['Book']), [])
+
+    def test_extra_tracks_counted(self):
+        r = row()
+        r[None] = ['Artist 9', 'Song 9']
+        self.assertEqual(track_count(r), MAX_TRACKS + 1)
+
+    def test_patch_fills_blanks_only(self):
+        patched = patch_row(row(book='', luxury='Piano'),
+                            row(book='War and Peace', luxury='Guitar', presenter=''))
+        self.assertEqual(patched['Book'], 'War and Peace')
+        self.assertEqual(patched['Luxury'], 'Piano')
+        self.assertEqual(patched['Presenter'], 'Sue Lawley')
+
+    def test_patch_tracks_only_if_more(self):
+        self.assertEqual(track_count(patch_row(row(tracks=6), row(tracks=8))), 8)
+        self.assertEqual(track_count(patch_row(row(tracks=6), row(tracks=4))), 6)
+
+    def test_suspicious_fields(self):
+        index = PresenterIndex(min_era_episodes=2)
+        index.add('1988-01-03', 'Sue Lawley')
+        index.add('1988-12-25', 'Sue Lawley')
+        r = row(date_first_broadcast='1988-06-05')
+        self.assertEqual(suspicious_fields(r, index), [])
+
+        r[None] = ['Artist 9', 'Song 9']
+        r['Presenter'] = 'Michael Parkinson'
+        self.assertEqual(suspicious_fields(r, index), [TRACKS, 'Presenter'])
+        self.assertEqual(suspicious_fields(r, index, ['Book', 'Presenter']), ['Presenter'])
+        # outside the known eras
+        r['Date first broadcast'] = '1990-06-05'
+        self.assertEqual(suspicious_fields(r, index), [TRACKS])
+
+    def test_patch_replaces_suspicious_fields(self):
+        r = row(presenter='Michael Parkinson')
+        r[None] = ['Artist 9', 'Song 9']
+        repaired = row(tracks=8, presenter='Sue Lawley')
+        repaired['Artist 1'] = 'Repaired'
+
+        self.assertEqual(patch_row(r, repaired), r)
+        patched = patch_row(r, repaired, [TRACKS, 'Presenter'])
+        self.assertEqual(patched['Presenter'], 'Sue Lawley')
+        self.assertEqual(track_count(patched), MAX_TRACKS)
+        self.assertEqual(patched['Artist 1'], 'Repaired')
+        # a blank re-scraped value never replaces one
+        self.assertEqual(patch_row(r, row(presenter=''), ['Presenter'])['Presenter'],
+                         'Michael Parkinson')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+import json
+import threading
+import urllib.error
+import urllib.request
+
+from server import *
+
+TEST_EPISODE_3 = "../data/BBC Radio 4 - Desert Island Discs, Isabella Tree, writer and conservationist.html"
+
+
+class Response:
+    def __init__(self, content, status_code=200):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {}
+
+
+class FakeSession:
+    """
+    Return content for every episode except those whose pid is a status code
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        if (pid := url.rsplit('/', 1)[-1]).isdigit():
+            return Response(b'<html><body>Error</body></html>', int(pid))
+        return Response(self.content)
+
+
+class TestServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(TEST_EPISODE_3, 'rb') as f:
+            cls.page = f.read()
+        cls.session = FakeSession(cls.page)
+        set_fetcher(Fetcher(RateLimiter(rate=1000, max_rate=1000), session=cls.session))
+
+        cls.server = make_server(DesertIslandDiscsParser(), port=0, quiet=True)
+        cls.url = f'http://{DEFAULT_HOST}:{cls.server.server_port}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        set_fetcher(None)
+
+    def request(self, path, data=None):
+        try:
+            with urllib.request.urlopen(self.url + path, data) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def test_get_episode(self):
+        status, result = self.request('/episode?pid=m000abcd')
+        self.assertEqual(status, 200)
+        self.assertEqual(result['castaway'], 'Isabella Tree')
+        self.assertEqual(result['url'], 'https://www.bbc.co.uk/programmes/m000abcd')
+        self.assertEqual(len(result['episode']['tracks']), 8)
+        self.assertIn('https://www.bbc.co.uk/programmes/m000abcd', self.session.urls)
+
+    def test_post_episode(self):
+        status, result = self.request('/episode?castaway=Isabella%20Tree', self.page)
+        self.assertEqual(status, 200)
+        self.assertEqual(result['castaway'], 'Isabella Tree')
+        self.assertIsNone(result['url'])
+
+    def test_post_not_episode(self):
+        status, result = self.request('/episode', b'<html><body><p>Not an episode</p></body></html>')
+        self.assertEqual(status, 400)
+        self.assertIn('error', result)
+
+    def test_posted_presenter_not_learned(self):
+        index = PresenterIndex()
+        service = EpisodeService(DesertIslandDiscsParser(presenter_index=index))
+        result = service.post_episode({}, self.page)
+        self.assertEqual(result['episode']['presenter'], 'Lauren Laverne')
+        self.assertEqual(index.observations, [])
+
+        service.get_episode({'pid': ['m000abcd']})
+        self.assertEqual(len(index.observations), 1)
+
+    def test_only_bbc_urls_fetched(self):
+        status, result = self.request('/episode?url=http://example.com/')
+        self.assertEqual(status, 400)
+        self.assertIn('error', result)
+        self.assertEqual(self.request('/episode')[0], 400)
+
+    def test_not_found(self):
+        self.assertEqual(self.request('/nothing')[0], 404)
+
+    def test_upstream_errors(self):
+        status, result = self.request('/episode?pid=404')
+        self.assertEqual(status, 404)
+        self.assertIn('error', result)
+        self.assertEqual(self.request('/episode?pid=503')[0], 502)
+
+    def test_metrics(self):
+        self.request('/episode?pid=m000abcd')
+        self.request('/episode?url=http://example.com/')
+
+        status, result = self.request('/metrics')
+
+        self.assertEqual(status, 200)
+        stats = result['GET /episode']
+        self.assertGreaterEqual(stats['requests'], 2)
+        self.assertGreaterEqual(stats['errors'], 1)
+        self.assertGreater(stats['latency_ms']['max'], 0)
+
+    def test_concurrent_requests(self):
+        results = []
+
+        def get():
+            results.append(self.request('/episode?pid=m000abcd')[0])
+
+        threads = [threading.Thread(target=get) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [200] * 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
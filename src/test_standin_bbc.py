@@ -0,0 +1,271 @@
+import unittest
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import tempfile
+
+from bs4 import BeautifulSoup
+
+from standin_bbc import *
+from benchmark import run_benchmark, setup_command_line as benchmark_command_line
+from archive import PageArchive
+from scraper import (CastawayReader, Crawler, DesertIslandDiscsCastaway, DesertIslandDiscsParser, Fetcher,
+                     PresenterIndex, RateLimiter, SOUP_PARSER, drifted_pages, is_classic_episode,
+                     programme_pid, reextract, set_fetcher, structured_page,
+                     setup_command_line as scraper_command_line)
+from metrics import METRICS
+
+# Programme JSON documents and segments fragments of example episodes, written by hand
+# in the BBC's format rather than made from the pages
+STRUCTURED_FIXTURES = '../data/fixtures/structured'
+STRUCTURED_FIXTURE_PAGES = {
+    'm0000r6k': '../data/BBC Radio 4 - Desert Island Discs, Nile Rodgers.html',
+    'm000bl1f': '../data/BBC Radio 4 - Desert Island Discs, Isabella Tree, writer and conservationist.html',
+}
+
+
+class TestStandInBBC(unittest.TestCase):
+    def test_listing_page(self):
+        parser = DesertIslandDiscsParser()
+        soup = BeautifulSoup(listing_page('localhost:1', 2, 5, 45), SOUP_PARSER)
+
+        castaways = parser.listing_castaways(soup)
+
+        self.assertEqual(len(castaways), 10)
+        self.assertEqual(castaways[0].name, 'Castaway 10')
+        self.assertEqual(castaways[0].episode_url, 'http://localhost:1/programmes/x0000010')
+        self.assertEqual(parser.last_listing_page(soup), 5)
+        self.assertEqual(len(parser.listing_castaways(
+            BeautifulSoup(listing_page('localhost:1', 5, 5, 45), SOUP_PARSER))), 5)
+
+    def test_publish(self):
+        site = StandInBBC(10, publish_every=2)
+        site.page('localhost:1', LISTING_PATH, 'page=1')
+        self.assertEqual(site.published, 0)
+        _, body = site.page('localhost:1', LISTING_PATH, 'page=2')
+        self.assertEqual((site.published, site.pages), (1, 2))
+        # the oldest episode has moved onto page 2
+        self.assertIn(f'/programmes/{episode_pid(9)}"', body.decode())
+        self.assertEqual(site.page('localhost:1', f'/programmes/{episode_pid(10)}', '')[0], 200)
+
+    def test_fault_rates(self):
+        site = StandInBBC(10, error_rate=0.2, reset_rate=0.1)
+        for _ in range(2000):
+            site.choose()
+        self.assertAlmostEqual(site.outcomes[ERROR] / 2000, 0.2, delta=0.05)
+        self.assertAlmostEqual(site.outcomes[RESET] / 2000, 0.1, delta=0.05)
+        self.assertEqual(site.outcomes[THROTTLE], 0)
+
+    def test_latency_distributions(self):
+        r = random.Random(0)
+        self.assertEqual(parse_latency('constant:0.5')(r), 0.5)
+        self.assertTrue(0.1 <= parse_latency('uniform:0.1,0.2')(r) <= 0.2)
+        with self.assertRaises(argparse.ArgumentTypeError):
+            parse_latency('normal:1')
+
+    def test_crawl_recovers_from_faults(self):
+        site = StandInBBC(30, error_rate=0.1, throttle_rate=0.05, reset_rate=0.05,
+                          drip_rate=0.05, retry_after=0, drip_delay=0)
+        args = benchmark_command_line().parse_args(
+            ['--rate', '200', '--min-rate', '100', '--max-rate', '500', '--fetch-workers', '4',
+             # enough that no request fails every time
+             '--max-retries', '8'])
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'episodes.csv')
+            crawler, pipeline, _ = run_benchmark(site, args, output)
+            rows = list(CastawayReader().rows(output))
+
+        self.assertEqual(len(rows), 30)
+        self.assertEqual(crawler.parser.failed_urls, [])
+        self.assertGreater(crawler.fetcher.retries, 0)
+
+    def test_streamed_crawl(self):
+        site = StandInBBC(20)
+        rows = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for stream in ([], ['--stream']):
+                args = benchmark_command_line().parse_args(
+                    ['--rate', '200', '--max-rate', '500'] + stream)
+                output = os.path.join(directory, f'episodes{len(stream)}.csv')
+                crawler, _, _ = run_benchmark(site, args, output)
+                # The server's port differs between crawls so URLs are compared by PID
+                rows[bool(stream)] = sorted((programme_pid(r.pop('URL')), r)
+                                            for r in CastawayReader().rows(output))
+
+        self.assertEqual(crawler.fetcher.truncated, 20)
+        self.assertEqual(len(rows[True]), 20)
+        self.assertEqual(rows[True], rows[False])
+
+    def structured_fixtures(self):
+        """
+        Yield (episode page, programme JSON document, segments fragment) of the episodes
+        whose structured representations are recorded in STRUCTURED_FIXTURES
+        """
+        for pid, filename in STRUCTURED_FIXTURE_PAGES.items():
+            with open(os.path.join(STRUCTURED_FIXTURES, f'{pid}.json'), 'rb') as f:
+                programme = json.load(f)
+            with open(os.path.join(STRUCTURED_FIXTURES, f'{pid}.segments.inc'), 'rb') as f:
+                segments = f.read()
+            with open(filename, 'rb') as f:
+                yield f.read(), programme, segments
+
+    def test_structured_page_matches_page(self):
+        parser = DesertIslandDiscsParser()
+        for page, programme, segments in self.structured_fixtures():
+            structured = structured_page(programme, segments)
+            self.assertLess(len(structured), len(page) / 5)
+            self.assertEqual(parser.parse_episode_page(structured).as_dict(),
+                             parser.parse_episode_page(page).as_dict())
+
+    def test_recorded_fragments_match_fixtures(self):
+        """
+        The stand-in's fragments, made from the example pages, are extracted as the
+        recorded ones are
+        """
+        parser = DesertIslandDiscsParser()
+        for page, programme, segments in self.structured_fixtures():
+            recorded, recorded_segments = record_fragments(page)
+            self.assertEqual(parser.parse_episode_page(
+                structured_page({'programme': recorded}, recorded_segments)).as_dict(),
+                parser.parse_episode_page(structured_page(programme, segments)).as_dict())
+
+    def test_structured_crawl(self):
+        site = StandInBBC(20)
+        rows = {}
+        downloaded = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for structured in ([], ['--structured']):
+                args = benchmark_command_line().parse_args(
+                    ['--rate', '200', '--max-rate', '500'] + structured)
+                output = os.path.join(directory, f'episodes{len(structured)}.csv')
+                run_benchmark(site, args, output)
+                downloaded[bool(structured)] = METRICS.get('did_bytes_downloaded_total')
+                rows[bool(structured)] = sorted((programme_pid(r.pop('URL')), r)
+                                                for r in CastawayReader().rows(output))
+
+        self.assertEqual(len(rows[True]), 20)
+        self.assertEqual(rows[True], rows[False])
+        # Two of the nine example pages lack fields so their pages are fetched too
+        self.assertGreater(METRICS.get('did_page_fallbacks_total'), 0)
+        self.assertLess(downloaded[True], downloaded[False] / 2)
+
+    def test_structured_episode_finished_once(self):
+        """
+        An episode completed from its full page is counted and its presenter recorded
+        once
+        """
+        # one episode for each example page
+        site = StandInBBC(9)
+        server, listing_url = serve_in_thread(site)
+        index = PresenterIndex()
+        parser = DesertIslandDiscsParser(structured=True, presenter_index=index)
+        try:
+            set_fetcher(Fetcher(RateLimiter(500, max_rate=500)))
+            METRICS.reset()
+            castaways = []
+            for i in range(site.episodes):
+                castaway = DesertIslandDiscsCastaway(None, None, listing_url.replace(
+                    LISTING_PATH + '?page=%s', f'/programmes/{episode_pid(i)}'), None)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    castaways.append(parser.parse_castaway_episode(castaway, parser.fetch_episode(castaway)))
+        finally:
+            server.shutdown()
+            server.server_close()
+            set_fetcher(None)
+
+        self.assertGreater(METRICS.get('did_page_fallbacks_total'), 0)
+        self.assertEqual(sum(parser.layout_stats.hits.values()) +
+                         sum(parser.layout_stats.misses.values()), site.episodes)
+        self.assertEqual(len(index.observations),
+                         len([c for c in castaways if c.episode.presenter_mined and c.episode.presenter and
+                              not is_classic_episode(c.episode.title)]))
+
+    def test_reextract_structured_crawl(self):
+        site = StandInBBC(20)
+        server, listing_url = serve_in_thread(site)
+        with tempfile.TemporaryDirectory() as directory:
+            crawled, reextracted, archive = [os.path.join(directory, name)
+                                             for name in ['crawled.csv', 'reextracted.csv', 'pages.warc.gz']]
+            try:
+                set_fetcher(Fetcher(RateLimiter(500, max_rate=500), archive=PageArchive(archive)))
+                crawler = Crawler(DesertIslandDiscsParser(structured=True), scraper_command_line().parse_args(
+                    ['--csv', crawled, '--listing-url', listing_url]))
+                METRICS.reset()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    crawler.crawl_frontier(crawler.frontier(range(1, crawler.last_page() + 1)))
+            finally:
+                server.shutdown()
+                server.server_close()
+                set_fetcher(None)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                count = reextract(archive, reextracted, dataset=os.path.join(directory, 'none.csv'),
+                                  processes=2)
+            rows = [sorted(CastawayReader().rows(output), key=lambda r: r['URL'])
+                    for output in [crawled, reextracted]]
+
+        self.assertEqual(count, 20)
+        # including episodes completed from their full page
+        self.assertGreater(METRICS.get('did_page_fallbacks_total'), 0)
+        self.assertEqual(rows[1], rows[0])
+
+
+class TestListingDrift(unittest.TestCase):
+    def frontier(self, site, order):
+        """
+        Return (crawler, programme ids found) of listing pages of site fetched in order
+        """
+        server, listing_url = serve_in_thread(site)
+        try:
+            set_fetcher(Fetcher(RateLimiter(500, max_rate=500)))
+            crawler = Crawler(DesertIslandDiscsParser(), scraper_command_line().parse_args(
+                ['--listing-url', listing_url, '--listing-workers', '1']))
+            with contextlib.redirect_stdout(io.StringIO()):
+                castaways = crawler.frontier(order(range(1, crawler.last_page() + 1)))
+        finally:
+            server.shutdown()
+            server.server_close()
+            set_fetcher(None)
+
+        return crawler, [programme_pid(c.episode_url) for c in castaways]
+
+    def test_duplicates_dropped(self):
+        site = StandInBBC(45, publish_every=2)
+        crawler, pids = self.frontier(site, list)
+
+        self.assertGreater(crawler.duplicates, 0)
+        self.assertEqual(len(pids), len(set(pids)))
+        self.assertLessEqual({episode_pid(i) for i in range(45)}, set(pids))
+
+    def test_slid_episodes_recovered(self):
+        # pages fetched last first so episodes slide onto pages already fetched
+        site = StandInBBC(45, publish_every=2)
+        _, pids = self.frontier(site, lambda pages: list(reversed(pages)))
+
+        self.assertEqual(len(pids), len(set(pids)))
+        self.assertLessEqual({episode_pid(i) for i in range(45)}, set(pids))
+
+    def test_drifted_pages(self):
+        self.assertEqual(drifted_pages([1, 2, 3], {1: 0, 2: 1, 3: 2}), [4])
+        self.assertEqual(drifted_pages([1, 2, 3], {1: 1, 2: 0, 3: 2}), [2, 4])
+        # page 3 couldn't be fetched
+        self.assertEqual(drifted_pages([2, 3], {2: 0}), [3, 4])
+        # page 4 is in the next shard
+        self.assertEqual(drifted_pages([2, 3], {2: 1, 3: 0}, last=3), [3])
+        self.assertEqual(drifted_pages([2, 3], {2: 1, 3: 0}, last=5), [3, 4])
+
+    def test_first_listing_fetch_kept(self):
+        site = StandInBBC(45, publish_every=2)
+        crawler, _ = self.frontier(site, list)
+
+        # page 1 is fetched again, and before the others, but only its fetch by the
+        # listing stages counts
+        self.assertEqual(crawler.listing_fetched, {page: page - 1 for page in range(1, 6)})
+
+
+if __name__ == '__main__':
+    unittest.main()
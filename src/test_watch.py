@@ -0,0 +1,143 @@
+import unittest
+import contextlib
+import glob
+import io
+import os
+import tempfile
+import zlib
+
+from watch import *
+from scraper import DesertIslandDiscsParser, set_fetcher
+
+TEST_PROGRAMME_LISTING_1 = "../data/BBC Radio 4 - Desert Island Discs - Available now.html"
+ETAG = '"v1"'
+
+
+class Response:
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+class FakeBBC:
+    """
+    Serve the test listing page, with an ETag, and the test episode pages
+    """
+
+    def __init__(self):
+        with open(TEST_PROGRAMME_LISTING_1, 'rb') as f:
+            self.listing = f.read()
+        self.episodes = []
+        for filename in sorted(glob.glob('../data/BBC Radio 4 - Desert Island Discs, *.html')):
+            with open(filename, 'rb') as f:
+                self.episodes.append(f.read())
+        self.episode_requests = 0
+
+    def get(self, url, headers=None, **kwargs):
+        if 'guide?page=' in url:
+            if (headers or {}).get('If-None-Match') == ETAG:
+                return Response(304)
+            return Response(200, self.listing, {'ETag': ETAG})
+        self.episode_requests += 1
+        return Response(200, self.episodes[zlib.crc32(url.encode()) % len(self.episodes)])
+
+
+class TestWatch(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.bbc = FakeBBC()
+        set_fetcher(Fetcher(RateLimiter(rate=1000, max_rate=1000), session=self.bbc))
+        self.args = setup_command_line().parse_args(
+            ['--csv', os.path.join(self.dir.name, 'episodes.csv'),
+             '--feed', os.path.join(self.dir.name, 'changes.jsonl')])
+
+    def tearDown(self):
+        set_fetcher(None)
+        self.dir.cleanup()
+
+    def watcher(self):
+        watcher = Watcher(DesertIslandDiscsParser(), self.args, ChangeFeed(self.args.feed))
+        watcher.load()
+        return watcher
+
+    def test_new_episodes_inserted_once(self):
+        watcher = self.watcher()
+        inserted, _ = watcher.poll()
+        self.assertEqual(inserted, 10)
+        self.assertEqual(watcher.poll(), (0, 0))
+
+        records = list(ChangeFeed(self.args.feed).records())
+        self.assertEqual([r['op'] for r in records], [INSERT] * 10)
+        # oldest first
+        self.assertEqual(records[-1]['pid'], 'm000d6s1')
+        self.assertEqual(len(list(CastawayReader().rows(self.args.output))), 10)
+
+    def test_restart_skips_known_episodes(self):
+        self.watcher().poll()
+        requests = self.bbc.episode_requests
+
+        inserted, _ = self.watcher().poll()
+
+        self.assertEqual(inserted, 0)
+        # only incomplete episodes are fetched again
+        known = {r['pid']: r['missing'] for r in ChangeFeed(self.args.feed).records()}
+        self.assertEqual(self.bbc.episode_requests - requests,
+                         sum(1 for missing in known.values() if missing))
+
+    def test_csv_header_written_once(self):
+        self.watcher().poll()
+        os.remove(self.args.feed)
+        self.watcher().poll()
+
+        with open(self.args.output, encoding='utf-8') as f:
+            headers = [line for line in f if line.startswith('Castaway\t')]
+        self.assertEqual(len(headers), 1)
+
+    def test_incomplete_episodes_rechecked_when_listing_unchanged(self):
+        watcher = self.watcher()
+        watcher.poll()
+        incomplete = sum(1 for missing in watcher.known.values() if missing)
+        self.assertGreater(incomplete, 0)
+        requests = self.bbc.episode_requests
+
+        # the listing is not modified (304) but incomplete episodes are fetched again
+        self.assertEqual(watcher.poll(), (0, 0))
+        self.assertEqual(self.bbc.episode_requests - requests, incomplete)
+
+    def test_updated_episode_patched_in_csv(self):
+        self.watcher().poll()
+        rows = list(CastawayReader().rows(self.args.output))
+        complete = next(row for row in rows if not missing_fields(row))
+        complete_book = complete['Book']
+        complete['Book'] = ''
+        write_rows(rows, self.args.output)
+        # the CSV file is all the watcher knows about
+        os.remove(self.args.feed)
+
+        watcher = self.watcher()
+        self.assertEqual(watcher.poll(), (0, 1))
+
+        records = list(ChangeFeed(self.args.feed).records())
+        self.assertEqual([(r['op'], r['pid']) for r in records],
+                         [(UPDATE, programme_pid(complete['URL']))])
+        patched = list(CastawayReader().rows(self.args.output))
+        self.assertEqual(len(patched), len(rows))
+        self.assertEqual(next(row['Book'] for row in patched if row['URL'] == complete['URL']),
+                         complete_book)
+
+    def test_failed_poll_logged(self):
+        self.args.once = True
+        watcher = self.watcher()
+
+        def fail():
+            raise OSError('disk full')
+
+        watcher.poll = fail
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            watcher.run()
+        self.assertIn('*** Poll failed', output.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+import gzip
+import importlib.util
+import json
+import os
+import tempfile
+from datetime import date
+
+from writers import *
+from scraper import (CastawayReader, CastawayWriter, DesertIslandDiscsCastaway,
+                     DesertIslandDiscsEpisode, Track, TrackList, MAX_TRACKS)
+
+
+def castaway(tracks=MAX_TRACKS, pid='b001'):
+    track_list = TrackList()
+    for i in range(1, tracks + 1):
+        track_list.add(Track(f'Artist {i}', f'Song {i}'))
+    episode = DesertIslandDiscsEpisode('Cilla Black', track_list, 'Book', '', 'Song 1',
+                                       'Sue Lawley', ('1984-02-12', '12:15'))
+    return DesertIslandDiscsCastaway('Cilla Black', 'singer',
+                                     f'https://www.bbc.co.uk/programmes/{pid}', episode)
+
+
+def write(filename, castaways, format=None):
+    with open_writer(CastawayWriter(), filename, format) as writer:
+        for c in castaways:
+            writer.write(c)
+
+
+class TestWriters(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_output_format(self):
+        self.assertEqual(output_format('episodes.csv'), TSV)
+        self.assertEqual(output_format(None), TSV)
+        self.assertEqual(output_format('episodes.jsonl'), JSONL)
+        self.assertEqual(output_format('episodes.JSONL.gz'), JSONL)
+        self.assertEqual(output_format('episodes.txt', JSONL), JSONL)
+        with self.assertRaises(ValueError):
+            output_format(None, PARQUET)
+        with self.assertRaises(ValueError):
+            output_format('episodes.parquet.gz')
+        with self.assertRaises(ValueError):
+            output_format('-', XLSX)
+
+    def test_tsv_appends(self):
+        filename = self.path('episodes.csv')
+        write(filename, [castaway()])
+        write(filename, [castaway(pid='b002')])
+
+        rows = list(CastawayReader().rows(filename))
+
+        self.assertEqual([r['URL'][-4:] for r in rows], ['b001', 'b002'])
+        with open(filename, encoding='utf-8') as f:
+            self.assertEqual(f.read().count('Castaway\t'), 1)
+
+    def test_jsonl_keeps_every_track(self):
+        filename = self.path('episodes.jsonl.gz')
+        write(filename, [castaway(tracks=MAX_TRACKS + 2)])
+        write(filename, [castaway(tracks=1, pid='b002')])
+
+        with gzip.open(filename, 'rt', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+
+        self.assertEqual(len(records), 2)
+        self.assertEqual(len(records[0]['tracks']), MAX_TRACKS + 2)
+        self.assertEqual(records[0]['tracks'][-1], {'artist': 'Artist 10', 'song': 'Song 10'})
+        self.assertEqual(records[0]['pid'], 'b001')
+        self.assertIsNone(records[0]['luxury'])
+        self.assertEqual(records[1]['broadcast_date'], '1984-02-12')
+
+    @unittest.skipUnless(importlib.util.find_spec('zstandard'), 'zstandard not installed')
+    def test_zstd(self):
+        import zstandard
+        filename = self.path('episodes.csv.zst')
+        write(filename, [castaway()])
+
+        with zstandard.open(filename, 'rt', encoding='utf-8') as f:
+            self.assertIn('Cilla Black', f.read())
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow not installed')
+    def test_parquet(self):
+        import pyarrow.parquet
+        filename = self.path('episodes.parquet')
+        with open_writer(CastawayWriter(), filename) as writer:
+            writer.row_group_size = 2
+            for i in range(5):
+                writer.write(castaway(tracks=i, pid=f'b00{i}'))
+
+        f = pyarrow.parquet.ParquetFile(filename)
+        table = f.read()
+
+        self.assertEqual(f.num_row_groups, 3)
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(table.column('broadcast_date')[0].as_py(), date(1984, 2, 12))
+        self.assertEqual([len(t) for t in table.column('tracks').to_pylist()], [0, 1, 2, 3, 4])
+        with self.assertRaises(ValueError):
+            output_format(filename)
+
+    def test_summary(self):
+        summary = EpisodeSummary()
+        columns = CastawayWriter()
+        for i in range(3):
+            summary.add(columns.castaway_as_record(castaway(tracks=i + 1, pid=f'b00{i}')))
+        summary.add(dict(columns.castaway_as_record(castaway(tracks=0)), broadcast_date='1999-12-31',
+                         book=' Book ', luxury='Piano'))
+
+        sheets = {name: rows for name, _, rows in summary.sheets()}
+
+        self.assertEqual(sheets['Artists'], [('Artist 1', 3), ('Artist 2', 2), ('Artist 3', 1)])
+        self.assertEqual(sheets['Books'], [('Book', 4)])
+        self.assertEqual(sheets['Luxuries'], [('Piano', 1)])
+        self.assertEqual(sheets['Decades'], [('1980s', 3), ('1990s', 1)])
+
+    @unittest.skipUnless(importlib.util.find_spec('openpyxl'), 'openpyxl not installed')
+    def test_xlsx(self):
+        import openpyxl
+        filename = self.path('episodes.xlsx')
+        write(filename, [castaway(tracks=i, pid=f'b00{i}') for i in range(3)])
+
+        workbook = openpyxl.load_workbook(filename, read_only=True)
+        episodes = list(workbook['Episodes'].values)
+
+        self.assertEqual(workbook.sheetnames, ['Episodes', 'Artists', 'Books', 'Luxuries', 'Decades'])
+        self.assertEqual(len(episodes), 4)
+        self.assertEqual(episodes[0][8], 'Date first broadcast')
+        self.assertEqual(episodes[1][8].date(), date(1984, 2, 12))
+        self.assertEqual(list(workbook['Artists'].values)[1], ('Artist 1', 2))
+        self.assertEqual(list(workbook['Decades'].values)[1], ('1980s', 3))
+        with self.assertRaises(ValueError):
+            output_format(filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
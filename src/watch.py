@@ -0,0 +1,290 @@
+"""
+=============================================================================
+File: watch.py
+Description: Watch for new Desert Island Discs episodes and scrape them as soon as
+             they appear on the BBC website.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+
+To run:
+
+    python watch.py --csv <episodes.csv> --feed <changes.jsonl>
+
+The first listing page is polled every --interval seconds. The request is
+conditional (If-None-Match/If-Modified-Since) so an unchanged page costs little.
+Episodes not already in the CSV file or change feed are scraped and appended to
+both. Episodes already seen that had missing data (see repair.py) are scraped
+again on every poll while they're on the first page, even if the page hasn't
+changed, since the BBC often adds the details after broadcast; their rows in the
+CSV file are patched when more details are found.
+
+With --xlsx, an Excel workbook (see writers.py) is regenerated from the CSV file
+each time episodes are added or updated.
+
+The change feed has one JSON object per line, which is appended as each change is
+found, so consumers can tail it instead of re-reading the CSV file:
+
+    {"op": "insert" or "update", "pid": ..., "time": ..., "castaway": ..., "job": ...,
+     "url": ..., "missing": [fields still missing], "episode": {...}}
+=============================================================================
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from bs4 import BeautifulSoup
+
+from scraper import (CastawayReader, CastawayWriter, Crawler, DesertIslandDiscsParser,
+                     ExtractionCache, Fetcher, Pipeline, PresenterIndex,
+                     RateLimiter, default_fetcher, extractor_version, listing_url,
+                     missing_fields, programme_pid, set_fetcher, DEFAULT_DATASET, DEFAULT_FETCH_WORKERS,
+                     DEFAULT_PARSE_WORKERS, DEFAULT_QUEUE_SIZE, DEFAULT_RATE,
+                     DEFAULT_MAX_RATE, DESERT_ISLAND_DISCS_PAGE, SOUP_PARSER)
+from export import export_replacing
+from fetcher import NOT_MODIFIED
+from merge_shards import write_rows
+from repair import patch_row
+from writers import optional_import
+
+DEFAULT_INTERVAL = 60 * 60
+INSERT = 'insert'
+UPDATE = 'update'
+
+
+class ChangeFeed:
+    """
+    Append-only JSON Lines file of episodes inserted and updated
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def records(self):
+        if os.path.exists(self.filename):
+            with open(self.filename, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+    def append(self, op, castaway, missing):
+        record = {'op': op,
+                  'pid': programme_pid(castaway.episode_url),
+                  'time': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                  'castaway': castaway.name,
+                  'job': castaway.job,
+                  'url': castaway.episode_url,
+                  'missing': missing,
+                  'episode': castaway.episode.as_dict()}
+        with open(self.filename, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+class Watcher:
+    """
+    Poll the first listing page and scrape episodes that are new or incomplete
+    """
+
+    def __init__(self, parser, args, feed):
+        self.args = args
+        self.feed = feed
+        self.crawler = Crawler(parser, args)
+        self.fetcher = default_fetcher()
+        self.writer = CastawayWriter()
+        # programme id to fields missing for each episode seen
+        self.known = {}
+        # ETag/Last-Modified and hash of the last listing page processed
+        self.validators = {}
+        self.listing_hash = None
+        # castaways on the last listing page processed
+        self.listed = []
+
+    def load(self):
+        """
+        Find episodes already scraped from the CSV file and change feed
+        """
+        if self.args.output and os.path.exists(self.args.output):
+            for row in CastawayReader().rows(self.args.output):
+                self.known[programme_pid(row['URL'])] = missing_fields(row)
+        for record in self.feed.records():
+            self.known[record['pid']] = record['missing']
+
+    def conditional_headers(self):
+        headers = {}
+        if 'ETag' in self.validators:
+            headers['If-None-Match'] = self.validators['ETag']
+        if 'Last-Modified' in self.validators:
+            headers['If-Modified-Since'] = self.validators['Last-Modified']
+        return headers
+
+    def scrape(self, castaways):
+        scraped = {}
+
+        def collect(castaway):
+            scraped[castaway.episode_url] = castaway
+
+        Pipeline(self.crawler.episode_stages(collect)).run(castaways)
+        return scraped
+
+    def fetch_listing(self):
+        """
+        Fetch the first listing page if it has changed. Return (castaways, response),
+        or (None, None) if it hasn't changed or couldn't be fetched.
+        """
+        response = self.fetcher.get(self.crawler.listing_url % 1, self.conditional_headers())
+        if response.status_code == NOT_MODIFIED:
+            return None, None
+        if response.status_code != 200:
+            print(f'Status {response.status_code} for listing page')
+            return None, None
+
+        listing_hash = hashlib.sha1(response.content).hexdigest()
+        if listing_hash == self.listing_hash:
+            # The server doesn't support conditional requests but nothing has changed
+            return None, None
+
+        castaways = self.crawler.parser.listing_castaways(
+            BeautifulSoup(response.content, SOUP_PARSER))
+        return castaways, response
+
+    def update_csv(self, updated):
+        """
+        Patch the rows in the CSV file of the castaways given, which are keyed by
+        programme id, and rewrite it
+        """
+        if not (self.args.output and os.path.exists(self.args.output)):
+            return
+        rows = list(CastawayReader().rows(self.args.output))
+        for i, row in enumerate(rows):
+            if (castaway := updated.get(programme_pid(row['URL']))) is not None:
+                rows[i] = patch_row(row, self.writer.castaway_as_dict(castaway))
+        write_rows(rows, self.args.output + '.tmp')
+        os.replace(self.args.output + '.tmp', self.args.output)
+
+    def poll(self):
+        """
+        Check the first listing page once. Return (episodes inserted, episodes updated).
+        """
+        castaways, response = self.fetch_listing()
+        if castaways is not None:
+            self.listed = castaways
+
+        # New episodes and those seen before with missing fields
+        to_scrape = [c for c in self.listed
+                     if self.known.get(programme_pid(c.episode_url), True)]
+        scraped = self.scrape(to_scrape) if to_scrape else {}
+
+        inserted = []
+        updated = {}
+        # Oldest first so the feed is in broadcast order
+        for castaway in reversed(self.listed):
+            if castaway.episode_url not in scraped:
+                continue
+            pid = programme_pid(castaway.episode_url)
+            missing = missing_fields(self.writer.castaway_as_dict(castaway))
+            if pid not in self.known:
+                self.feed.append(INSERT, castaway, missing)
+                inserted.append(castaway)
+            elif len(missing) < len(self.known[pid]):
+                self.feed.append(UPDATE, castaway, missing)
+                updated[pid] = castaway
+            self.known[pid] = missing
+
+        if updated:
+            self.update_csv(updated)
+        if inserted:
+            with self.writer.open_csv(self.args.output) as csv_output:
+                for castaway in inserted:
+                    csv_output.writerow(self.writer.castaway_as_row(castaway))
+        if (inserted or updated) and self.args.xlsx:
+            export_replacing(self.args.output, self.args.xlsx)
+
+        if response is not None:
+            if len(scraped) == len(to_scrape):
+                self.validators = {k: response.headers[k] for k in ('ETag', 'Last-Modified')
+                                   if k in response.headers}
+                self.listing_hash = hashlib.sha1(response.content).hexdigest()
+            else:
+                # Some episodes couldn't be fetched: try again next time, even if the
+                # listing hasn't changed
+                self.validators = {}
+                self.listing_hash = None
+
+        return len(inserted), len(updated)
+
+    def run(self):
+        while True:
+            try:
+                inserted, updated = self.poll()
+                print(f'{datetime.now():%Y-%m-%d %H:%M:%S} new episodes: {inserted}, '
+                      f'updated: {updated}, known: {len(self.known)}')
+            except Exception as e:
+                # Keep watching: the next poll may succeed
+                print(f'*** Poll failed: {e!r}')
+
+            if self.args.once:
+                break
+            time.sleep(self.args.interval)
+
+
+def setup_command_line():
+    cmdline = argparse.ArgumentParser(prog='Desert Island Discs watcher')
+    cmdline.add_argument('--csv', dest='output', default=DEFAULT_DATASET,
+                         help=f'CSV file to append new episodes to (default is {DEFAULT_DATASET})')
+    cmdline.add_argument('--feed', required=True,
+                         help='JSON Lines file to append inserted and updated episodes to')
+    cmdline.add_argument('--xlsx',
+                         help='Excel workbook to regenerate from the CSV file when episodes are added')
+    cmdline.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                         help=f'Seconds between polls of the listing page (default is {DEFAULT_INTERVAL})')
+    cmdline.add_argument('--listing-url', type=listing_url, default=DESERT_ISLAND_DISCS_PAGE,
+                         help='URL of the episode listing pages, with %%s for the page number '
+                         '(default is the BBC website)')
+    cmdline.add_argument('--once', action='store_true',
+                         help='Poll once and exit, eg when run from cron')
+    cmdline.add_argument('--cache',
+                         help='Extraction cache file (see scraper.py --cache)')
+    cmdline.add_argument('--dataset', default=DEFAULT_DATASET,
+                         help='CSV file used to look up presenters by broadcast date')
+    cmdline.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                         help=f'Initial requests per second (default is {DEFAULT_RATE})')
+    cmdline.add_argument('--max-rate', type=float, default=DEFAULT_MAX_RATE,
+                         help=f'Maximum requests per second (default is {DEFAULT_MAX_RATE})')
+    cmdline.add_argument('--fetch-workers', type=int, default=DEFAULT_FETCH_WORKERS,
+                         help=f'Threads fetching episode pages (default is {DEFAULT_FETCH_WORKERS})')
+    cmdline.add_argument('--parse-workers', type=int, default=DEFAULT_PARSE_WORKERS,
+                         help=f'Threads parsing episode pages (default is {DEFAULT_PARSE_WORKERS})')
+    cmdline.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                         help=f'Size of the queue between stages (default is {DEFAULT_QUEUE_SIZE})')
+    return cmdline
+
+
+def main():
+    args = setup_command_line().parse_args()
+    if args.xlsx:
+        try:
+            optional_import('openpyxl', 'Excel output')
+        except ValueError as e:
+            print(f'*** {e}')
+            sys.exit(1)
+    set_fetcher(Fetcher(RateLimiter(args.rate, max_rate=args.max_rate)))
+
+    cache = ExtractionCache(args.cache, extractor_version()) if args.cache else None
+    parser = DesertIslandDiscsParser(
+        presenter_index=PresenterIndex.from_dataset(args.dataset), cache=cache)
+
+    watcher = Watcher(parser, args, ChangeFeed(args.feed))
+    watcher.load()
+    print(f'Watching for new episodes; {len(watcher.known)} already scraped')
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print('Stopped')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,397 @@
+"""
+=============================================================================
+File: writers.py
+Description: Output formats for scraped episodes: tab-separated CSV, JSON Lines,
+             Parquet and Excel, optionally compressed.
+Author: Praful https://github.com/Praful/desert-island-discs
+Licence: GPL v3
+
+Each format writes castaways one at a time as they are scraped, so a crawl's output
+never has to be held in memory. The format is chosen with scraper.py's --format or
+from the output filename:
+
+    episodes.csv            tab-separated, MAX_TRACKS artist/song column pairs (default)
+    episodes.jsonl          one JSON object per episode, with a list of all its tracks
+    episodes.parquet        typed columns, tracks as a list of (artist, song) structs
+    episodes.xlsx           Excel workbook: the CSV columns plus summary sheets
+    episodes.csv.gz         gzip compressed; .zst for zstandard compression
+
+read_records reads any of them back, except Excel. CSV and JSON Lines files are
+appended to if they exist. Parquet and Excel files can't be appended to so they must
+not already exist.
+
+The Excel workbook is written in openpyxl's write-only mode, which streams rows to
+disk. Its summary sheets (most chosen artists, books and luxuries, and episodes per
+decade) are counted as episodes are written (see EpisodeSummary) and added when the
+workbook is closed, so memory used grows only with the number of different artists,
+books and luxuries.
+
+Parquet needs pyarrow, Excel needs openpyxl and zstandard compression needs
+zstandard (pip install pyarrow openpyxl zstandard). They're only imported when used.
+=============================================================================
+"""
+
+import abc
+import collections
+import contextlib
+import csv
+import importlib
+import io
+import json
+import os
+import sys
+from datetime import date
+
+TSV = 'tsv'
+JSONL = 'jsonl'
+PARQUET = 'parquet'
+XLSX = 'xlsx'
+FORMATS = [TSV, JSONL, PARQUET, XLSX]
+
+GZIP = '.gz'
+ZSTD = '.zst'
+COMPRESSIONS = [GZIP, ZSTD]
+
+# Filename extensions, after any compression extension is removed
+FORMAT_EXTENSIONS = {'.jsonl': JSONL, '.ndjson': JSONL, '.parquet': PARQUET, '.xlsx': XLSX}
+
+# Formats written as a whole file: format: (name, module needed)
+FILE_FORMATS = {PARQUET: ('Parquet', 'pyarrow.parquet'), XLSX: ('Excel', 'openpyxl')}
+
+# Episodes buffered before they're written to a Parquet file as a row group
+DEFAULT_ROW_GROUP_SIZE = 1000
+
+# module: package to install
+OPTIONAL_PACKAGES = {'pyarrow': 'pyarrow', 'pyarrow.parquet': 'pyarrow', 'openpyxl': 'openpyxl',
+                     'zstandard': 'zstandard'}
+
+
+def optional_import(module, purpose):
+    """
+    Return module, which is an optional dependency. Raise ValueError saying how to
+    install it if it's missing.
+    """
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise ValueError(f'{purpose} needs {OPTIONAL_PACKAGES[module]}: '
+                         f'pip install {OPTIONAL_PACKAGES[module]}') from None
+
+
+def compression(filename):
+    """
+    Return compression extension of filename or None if it isn't compressed
+    """
+    extension = os.path.splitext(filename or '')[1].lower()
+    return extension if extension in COMPRESSIONS else None
+
+
+def file_format(filename, format=None):
+    """
+    Return format if given, otherwise the format inferred from filename's extension
+    """
+    name = filename or ''
+    if compression(name):
+        name = os.path.splitext(name)[0]
+    return format or FORMAT_EXTENSIONS.get(os.path.splitext(name)[1].lower(), TSV)
+
+
+def output_format(filename, format=None):
+    """
+    Return format to write filename in (see file_format). Raise ValueError if
+    filename can't be written in the format.
+    """
+    format = file_format(filename, format)
+
+    if format in FILE_FORMATS:
+        name, module = FILE_FORMATS[format]
+        if not filename or filename == '-':
+            raise ValueError(f'{name} output must be written to a file')
+        if compression(filename):
+            raise ValueError(f'{name} files are compressed internally: remove '
+                             f'{compression(filename)} from {filename}')
+        if os.path.exists(filename):
+            raise ValueError(f'{filename} exists and {name} files can\'t be appended to')
+        optional_import(module, f'{name} output')
+    if compression(filename) == ZSTD:
+        optional_import('zstandard', 'zstandard compression')
+
+    return format
+
+
+@contextlib.contextmanager
+def open_text(filename=None):
+    """
+    Yield (text file, True if the file is empty) for appending to filename,
+    compressed if its extension is .gz or .zst, or stdout if there's no filename
+    """
+    if not filename or filename == '-':
+        yield sys.stdout, True
+        return
+
+    empty = not os.path.exists(filename) or os.path.getsize(filename) == 0
+    # Appending to a compressed file adds a new gzip member or zstandard frame;
+    # decompressors read them as one stream.
+    if compression(filename) == GZIP:
+        import gzip
+        binary = gzip.open(filename, 'ab')
+    elif compression(filename) == ZSTD:
+        zstandard = optional_import('zstandard', 'zstandard compression')
+        binary = zstandard.ZstdCompressor().stream_writer(open(filename, 'ab'))
+    else:
+        binary = open(filename, 'ab')
+
+    with io.TextIOWrapper(binary, encoding='utf-8', newline='') as output:
+        yield output, empty
+
+
+def open_input(filename):
+    """
+    Return text file for reading filename, decompressing it if its extension is .gz
+    or .zst
+    """
+    if compression(filename) == GZIP:
+        import gzip
+        return gzip.open(filename, 'rt', encoding='utf-8', newline='')
+    if compression(filename) == ZSTD:
+        zstandard = optional_import('zstandard', 'zstandard compression')
+        return zstandard.open(filename, 'rt', encoding='utf-8', newline='')
+    return open(filename, encoding='utf-8', newline='')
+
+
+def read_records(reader, filename, format=None):
+    """
+    Return generator of episodes in filename, in any format written by open_writer,
+    as records (see dataset.CastawayWriter.castaway_as_record). reader is a
+    dataset.CastawayReader.
+    """
+    format = file_format(filename, format)
+    if format == TSV:
+        for row in reader.rows(filename):
+            yield reader.row_as_record(row)
+    elif format == JSONL:
+        with open_input(filename) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif format == XLSX:
+        raise ValueError(f'Excel files can\'t be read: convert {filename} from the CSV file it came from')
+    else:
+        parquet = optional_import('pyarrow.parquet', 'Parquet input')
+        for batch in parquet.ParquetFile(filename).iter_batches():
+            for record in batch.to_pylist():
+                if record['broadcast_date'] is not None:
+                    record['broadcast_date'] = record['broadcast_date'].isoformat()
+                yield record
+
+
+class EpisodeWriter(abc.ABC):
+    """
+    Writes castaways, with their episodes, to an output one at a time. columns is
+    a dataset.CastawayWriter, which converts castaways to rows and records.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.count = 0
+
+    def write(self, castaway):
+        self.write_record(self.columns.castaway_as_record(castaway))
+
+    @abc.abstractmethod
+    def write_record(self, record):
+        """
+        Write episode in the format returned by read_records
+        """
+
+    def close(self):
+        pass
+
+
+class TsvWriter(EpisodeWriter):
+    """
+    The original format: tab-separated with a header row and a pair of columns for
+    each track
+    """
+
+    def __init__(self, columns, output, write_header=True):
+        super().__init__(columns)
+        self.writer = csv.writer(output, delimiter='\t', lineterminator='\r\n')
+        if write_header:
+            self.writer.writerow(columns.csv_header())
+
+    def write(self, castaway):
+        self.writer.writerow(self.columns.castaway_as_row(castaway))
+        self.count += 1
+
+    def write_record(self, record):
+        self.writer.writerow(self.columns.record_as_row(record))
+        self.count += 1
+
+
+class JsonLinesWriter(EpisodeWriter):
+    """
+    One JSON object per line. Tracks are a list of {artist, song} objects so no
+    track is dropped or padded.
+    """
+
+    def __init__(self, columns, output):
+        super().__init__(columns)
+        self.output = output
+
+    def write_record(self, record):
+        self.output.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.count += 1
+
+
+def parquet_schema():
+    pyarrow = optional_import('pyarrow', 'Parquet output')
+    string = pyarrow.string()
+    return pyarrow.schema([
+        ('castaway', string),
+        ('job', string),
+        ('url', string),
+        ('pid', string),
+        ('episode_title', string),
+        ('book', string),
+        ('luxury', string),
+        ('favourite_track', string),
+        ('presenter', string),
+        ('broadcast_date', pyarrow.date32()),
+        ('broadcast_time', string),
+        ('tracks', pyarrow.list_(pyarrow.struct([('artist', string), ('song', string)]))),
+    ])
+
+
+def parse_date(s):
+    """
+    Return date of YYYY-MM-DD string s or None if it isn't one
+    """
+    try:
+        return date.fromisoformat(s[:10])
+    except (TypeError, ValueError):
+        return None
+
+
+class ParquetWriter(EpisodeWriter):
+    """
+    Typed columns in a Parquet file. Episodes are buffered and written a row group
+    at a time.
+    """
+
+    def __init__(self, columns, filename, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+        super().__init__(columns)
+        self.pyarrow = optional_import('pyarrow', 'Parquet output')
+        self.schema = parquet_schema()
+        self.row_group_size = row_group_size
+        self.rows = []
+        self.writer = optional_import('pyarrow.parquet', 'Parquet output').ParquetWriter(
+            filename, self.schema)
+
+    def write_record(self, record):
+        record = dict(record, broadcast_date=parse_date(record['broadcast_date']))
+        self.rows.append(record)
+        self.count += 1
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(self.pyarrow.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+class EpisodeSummary:
+    """
+    Counts of artists, books and luxuries chosen and episodes broadcast in each
+    decade, made one episode at a time
+    """
+
+    def __init__(self):
+        self.artists = collections.Counter()
+        self.books = collections.Counter()
+        self.luxuries = collections.Counter()
+        self.decades = collections.Counter()
+
+    @staticmethod
+    def count(counter, value):
+        if value and value.strip():
+            counter[value.strip()] += 1
+
+    def add(self, record):
+        for track in record['tracks']:
+            self.count(self.artists, track['artist'])
+        self.count(self.books, record['book'])
+        self.count(self.luxuries, record['luxury'])
+        if (broadcast := parse_date(record['broadcast_date'])) is not None:
+            self.decades[f'{broadcast.year // 10 * 10}s'] += 1
+
+    def sheets(self):
+        """
+        Return [(sheet name, header, rows)], most chosen first and decades in order
+        """
+        return [('Artists', ['Artist', 'Choices'], self.artists.most_common()),
+                ('Books', ['Book', 'Castaways'], self.books.most_common()),
+                ('Luxuries', ['Luxury', 'Castaways'], self.luxuries.most_common()),
+                ('Decades', ['Decade', 'Episodes'], sorted(self.decades.items()))]
+
+
+class XlsxWriter(EpisodeWriter):
+    """
+    Excel workbook with an Episodes sheet, which has the CSV's columns, followed by
+    the sheets of an EpisodeSummary
+    """
+
+    def __init__(self, columns, filename):
+        super().__init__(columns)
+        self.filename = filename
+        self.workbook = optional_import('openpyxl', 'Excel output').Workbook(write_only=True)
+        # Control characters, which openpyxl refuses to write
+        self.illegal_characters = importlib.import_module('openpyxl.cell.cell').ILLEGAL_CHARACTERS_RE
+        self.episodes = self.workbook.create_sheet('Episodes')
+        header = columns.csv_header()
+        self.date_column = header.index('Date first broadcast')
+        self.episodes.append(header)
+        self.summary = EpisodeSummary()
+
+    def write_record(self, record):
+        row = [self.illegal_characters.sub('', v) for v in self.columns.record_as_row(record)]
+        # A date, rather than text, so it can be sorted and filtered as one
+        row[self.date_column] = parse_date(record['broadcast_date']) or ''
+        self.episodes.append(row)
+        self.summary.add(record)
+        self.count += 1
+
+    def close(self):
+        for name, header, rows in self.summary.sheets():
+            sheet = self.workbook.create_sheet(name)
+            sheet.append(header)
+            for row in rows:
+                sheet.append(list(row))
+        self.workbook.save(self.filename)
+
+
+@contextlib.contextmanager
+def open_writer(columns, filename=None, format=None):
+    """
+    Return writer for castaways in format (inferred from filename if not given).
+    Output is to stdout if there's no filename.
+    """
+    format = output_format(filename, format)
+    if format in FILE_FORMATS:
+        writer = ParquetWriter(columns, filename) if format == PARQUET else XlsxWriter(columns, filename)
+        try:
+            yield writer
+        finally:
+            writer.close()
+        return
+
+    with open_text(filename) as (output, empty):
+        if format == JSONL:
+            yield JsonLinesWriter(columns, output)
+        else:
+            yield TsvWriter(columns, output, write_header=empty)